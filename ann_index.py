@@ -0,0 +1,203 @@
+"""Inverted-file (IVF) approximate nearest-neighbour index in plain NumPy.
+
+Vectors are clustered with spherical k-means into ``nlist`` lists. A query
+scores the centroids first and then only the rows of the ``nprobe`` closest
+lists, so the cost of a search grows with ``N * nprobe / nlist`` instead of
+``N``. Raising ``nprobe`` trades latency for recall.
+
+The index is stored in CSR form beside the vectors of the same
+generation: ``ivf_centroids.npy`` with the list centroids,
+``ivf_assignments.npy`` with the list of every row, ``ivf_order.npy`` with
+row ids grouped by list and ``ivf_offsets.npy`` with where each list starts.
+Everything is memory-mapped on load, like the vectors themselves.
+"""
+
+from __future__ import annotations
+
+import json
+import math
+from dataclasses import dataclass
+from typing import TYPE_CHECKING
+
+import numpy as np
+from loguru import logger
+
+from settings import get_section
+
+if TYPE_CHECKING:
+    from pathlib import Path
+
+ANN_CONFIG = get_section("ann")
+ANN_ENABLED = ANN_CONFIG.get("enabled", True)
+# Below this many vectors an exact scan is fast enough and no index is built
+MIN_VECTORS = ANN_CONFIG.get("min_vectors", 50000)
+NLIST = ANN_CONFIG.get("nlist", 0)  # 0 picks about 4 * sqrt(N) lists
+NPROBE = ANN_CONFIG.get("nprobe", 16)  # Lists scanned per query
+TRAIN_SAMPLE = ANN_CONFIG.get("train_sample", 100000)  # Rows k-means sees
+KMEANS_ITERATIONS = ANN_CONFIG.get("kmeans_iterations", 10)
+# Retrain once the corpus has grown or shrunk by this factor since training
+RETRAIN_FACTOR = ANN_CONFIG.get("retrain_factor", 2.0)
+
+ASSIGN_CHUNK_ROWS = 65536  # Rows upcast to float32 at a time when assigning
+UNASSIGNED = -1
+META_FILE = "ivf.json"
+
+
+def default_nlist(count: int) -> int:
+    """Return the number of lists to train for ``count`` vectors."""
+    return max(1, min(count, NLIST or int(4 * math.sqrt(count))))
+
+
+def assign_lists(vectors: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+    """Return the index of the most similar centroid for every row."""
+    assignments = np.empty(len(vectors), dtype=np.int32)
+    for start in range(0, len(vectors), ASSIGN_CHUNK_ROWS):
+        chunk = np.asarray(vectors[start:start + ASSIGN_CHUNK_ROWS], dtype=np.float32)
+        assignments[start:start + len(chunk)] = np.argmax(chunk @ centroids.T, axis=1)
+    return assignments
+
+
+def train_centroids(
+    vectors: np.ndarray,
+    nlist: int,
+    iterations: int = KMEANS_ITERATIONS,
+    sample_size: int = TRAIN_SAMPLE,
+    seed: int = 0,
+) -> np.ndarray:
+    """Cluster a sample of ``vectors`` with spherical k-means.
+
+    Centroids are re-normalised after every step so that the dot product
+    used for assignment stays a cosine similarity. Lists that end up empty
+    are re-seeded from random sample rows.
+    """
+    rng = np.random.default_rng(seed)
+    rows = (
+        rng.choice(len(vectors), sample_size, replace=False)
+        if len(vectors) > sample_size
+        else np.arange(len(vectors))
+    )
+    sample = np.asarray(vectors[np.sort(rows)], dtype=np.float32)
+    nlist = min(nlist, len(sample))
+    centroids = sample[rng.choice(len(sample), nlist, replace=False)].copy()
+    for _ in range(iterations):
+        assignments = assign_lists(sample, centroids)
+        order = np.argsort(assignments, kind="stable")
+        counts = np.bincount(assignments, minlength=nlist)
+        starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+        empty = counts == 0
+        sums = np.empty_like(centroids)
+        # reduceat sums each list's contiguous run of rows in one pass
+        sums[~empty] = np.add.reduceat(sample[order], starts[~empty], axis=0)
+        sums[empty] = sample[rng.choice(len(sample), int(empty.sum()))]
+        norms = np.linalg.norm(sums, axis=1, keepdims=True)
+        centroids = sums / np.maximum(norms, 1e-12)
+    return centroids
+
+
+@dataclass
+class IVFIndex:
+    """One memory-mapped IVF index matching a vector store generation."""
+
+    centroids: np.ndarray  # (nlist, D) float32, L2-normalised rows
+    assignments: np.ndarray  # (N,) int32 list of each row
+    order: np.ndarray  # (N,) int64 row ids grouped by list
+    offsets: np.ndarray  # (nlist + 1,) int64 start of each list in ``order``
+    trained_size: int  # Vector count when the centroids were trained
+
+    @classmethod
+    def build(
+        cls,
+        vectors: np.ndarray,
+        centroids: np.ndarray | None = None,
+        assignments: np.ndarray | None = None,
+        trained_size: int = 0,
+        nlist: int | None = None,
+    ) -> IVFIndex:
+        """Build an index, reusing ``centroids`` unless a retrain is due.
+
+        Rows whose entry in ``assignments`` is ``UNASSIGNED`` (new or changed
+        vectors) are assigned to their nearest existing list; the others keep
+        their list. A full retrain happens when there are no centroids yet or
+        the corpus size drifted by more than ``RETRAIN_FACTOR``; it trains
+        ``nlist`` lists, or ``default_nlist`` of them if not given.
+        """
+        count = len(vectors)
+        drifted = trained_size and not (
+            trained_size / RETRAIN_FACTOR <= count <= trained_size * RETRAIN_FACTOR
+        )
+        if centroids is None or assignments is None or drifted:
+            centroids = train_centroids(vectors, nlist or default_nlist(count))
+            assignments = assign_lists(vectors, centroids)
+            trained_size = count
+            logger.info(f"Trained IVF index with {len(centroids)} lists")
+        else:
+            assignments = np.array(assignments, dtype=np.int32)
+            new_rows = np.flatnonzero(assignments == UNASSIGNED)
+            if len(new_rows):
+                assignments[new_rows] = assign_lists(vectors[new_rows], centroids)
+        order = np.argsort(assignments, kind="stable")
+        counts = np.bincount(assignments, minlength=len(centroids))
+        offsets = np.concatenate(([0], np.cumsum(counts)))
+        return cls(centroids, assignments, order, offsets, trained_size)
+
+    def save(self, path: Path) -> None:
+        """Write the index into a generation directory."""
+        np.save(path / "ivf_centroids.npy", self.centroids.astype(np.float32))
+        np.save(path / "ivf_assignments.npy", self.assignments)
+        np.save(path / "ivf_order.npy", self.order.astype(np.int64))
+        np.save(path / "ivf_offsets.npy", self.offsets.astype(np.int64))
+        with (path / META_FILE).open("w", encoding="utf-8") as meta_file:
+            json.dump({"trained_size": self.trained_size}, meta_file)
+
+    @classmethod
+    def load(cls, path: Path) -> IVFIndex | None:
+        """Memory-map the index in ``path``, or return ``None`` if it has none."""
+        try:
+            with (path / META_FILE).open("r", encoding="utf-8") as meta_file:
+                meta = json.load(meta_file)
+        except FileNotFoundError:
+            return None
+        return cls(
+            centroids=np.load(path / "ivf_centroids.npy"),
+            assignments=np.load(path / "ivf_assignments.npy", mmap_mode="r"),
+            order=np.load(path / "ivf_order.npy", mmap_mode="r"),
+            offsets=np.load(path / "ivf_offsets.npy"),
+            trained_size=meta["trained_size"],
+        )
+
+    def candidates(self, query: np.ndarray, nprobe: int = NPROBE) -> np.ndarray:
+        """Return the sorted row ids in the ``nprobe`` lists closest to ``query``."""
+        nprobe = min(nprobe, len(self.centroids))
+        scores = self.centroids @ query
+        probes = np.argpartition(-scores, nprobe - 1)[:nprobe]
+        rows = np.concatenate([
+            self.order[self.offsets[probe]:self.offsets[probe + 1]]
+            for probe in probes
+        ])
+        rows.sort()  # Sequential reads of the memory-mapped vectors
+        return rows
+
+    def search(
+        self,
+        vectors: np.ndarray,
+        query: np.ndarray,
+        k: int,
+        mask: np.ndarray | None = None,
+        nprobe: int = NPROBE,
+    ) -> tuple[np.ndarray, np.ndarray]:
+        """Return row indices and scores of the best ``k`` probed rows.
+
+        Fewer than ``k`` rows come back when the probed lists hold fewer
+        eligible rows; callers fall back to an exact scan in that case.
+        """
+        query = query.astype(np.float32, copy=False)
+        rows = self.candidates(query, nprobe)
+        if mask is not None:
+            rows = rows[mask[rows]]
+        if not len(rows):
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        scores = np.asarray(vectors[rows], dtype=np.float32) @ query
+        k = min(k, len(rows))
+        best = np.argpartition(-scores, k - 1)[:k]
+        best = best[np.argsort(-scores[best])]
+        return rows[best], scores[best]
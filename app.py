@@ -2,9 +2,12 @@
 
 from __future__ import annotations
 
+import atexit
+import importlib.util
 import multiprocessing
 import os
 import time
+from pathlib import Path
 from typing import Any
 
 import bentoml
@@ -13,21 +16,59 @@ import uvicorn
 from flask import (
     Flask,
     Response,
+    abort,
     redirect,
     render_template,
     request,
+    send_file,
     send_from_directory,
     session,
     url_for,
 )
 from loguru import logger
+from PIL import UnidentifiedImageError
 from pydantic import ValidationError
+from werkzeug.security import safe_join
 
+from settings import get_section, serving_workers
+from thumbnails import THUMBNAIL_CONFIG, thumbnail_cache
 from validators import SearchQuery
 
 app = Flask(__name__)
 app.secret_key = os.getenv("SECRET_KEY", "fallback_secret_key")
 
+FRONTEND_CONFIG = get_section("frontend")
+HTTP_TIMEOUT = FRONTEND_CONFIG.get("timeout", 10.0)  # Seconds per read or write
+HTTP_CONNECT_TIMEOUT = FRONTEND_CONFIG.get("connect_timeout", 2.0)
+HTTP_RETRIES = FRONTEND_CONFIG.get("retries", 2)  # Extra attempts per search
+HTTP_RETRY_BACKOFF = FRONTEND_CONFIG.get("retry_backoff", 0.2)  # Seconds, doubled
+# HTTP/2 needs the optional h2 package (pip install "httpx[http2]")
+HTTP2 = FRONTEND_CONFIG.get("http2", False) and (
+    importlib.util.find_spec("h2") is not None
+)
+if FRONTEND_CONFIG.get("http2", False) and not HTTP2:
+    logger.warning("HTTP/2 requested but h2 is not installed, using HTTP/1.1")
+RETRY_STATUS_CODES = {502, 503, 504}
+STATIC_PREFIXES = ("static/images/", "static/videos/")
+MEDIA_FOLDERS = {"image": "static/images", "video": "static/videos"}
+# Thumbnails are revalidated by ETag once this many seconds have passed
+THUMBNAIL_MAX_AGE = THUMBNAIL_CONFIG.get("max_age", 3600)
+MEDIA_MAX_AGE = THUMBNAIL_CONFIG.get("media_max_age", 3600)
+
+# One pooled client per process so API calls reuse keep-alive connections
+http_client = httpx.Client(
+    timeout=httpx.Timeout(HTTP_TIMEOUT, connect=HTTP_CONNECT_TIMEOUT),
+    limits=httpx.Limits(
+        max_connections=FRONTEND_CONFIG.get("max_connections", 20),
+        max_keepalive_connections=FRONTEND_CONFIG.get(
+            "max_keepalive_connections", 10,
+        ),
+        keepalive_expiry=FRONTEND_CONFIG.get("keepalive_expiry", 30.0),
+    ),
+    http2=HTTP2,
+)
+atexit.register(http_client.close)
+
 # API URLs
 API_URLS = {
     "fastapi": "http://127.0.0.1:8000/search",
@@ -38,8 +79,10 @@ API_URLS = {
 HTTP_OK = 200
 
 def run_fastapi() -> None:
-    """Run FastAPI server."""
-    uvicorn.run("fastapi_app:app", host="127.0.0.1", port=8000)
+    """Run FastAPI server with the configured number of worker processes."""
+    uvicorn.run(
+        "fastapi_app:app", host="127.0.0.1", port=8000, workers=serving_workers(),
+    )
 
 def run_bentoml() -> None:
     """Run BentoML server."""
@@ -57,7 +100,7 @@ class APIManager:
         start_time = time.time()
         while time.time() - start_time < timeout:
             try:
-                response = httpx.get(api_url, timeout=5)
+                response = http_client.get(api_url, timeout=5)
                 if response.status_code == HTTP_OK:
                     logger.info(f"API is up and running at {api_url}")
                     return True
@@ -115,35 +158,74 @@ def select_api() -> Response:
     )
 
 
+def request_with_retry(
+    method: str,
+    url: str,
+    *,
+    params: dict[str, Any] | None = None,
+    json: dict[str, Any] | None = None,
+) -> httpx.Response:
+    """Send a request on the shared client, retrying transient failures.
+
+    Searches are read-only, so connection errors, read timeouts and
+    502/503/504 answers are retried up to ``HTTP_RETRIES`` times with
+    exponential back-off. A ``Retry-After`` header from a server shedding
+    load takes precedence over the back-off. The final attempt's error or
+    response is returned to the caller as is.
+    """
+    for attempt in range(HTTP_RETRIES):
+        delay = HTTP_RETRY_BACKOFF * 2**attempt
+        try:
+            response = http_client.request(method, url, params=params, json=json)
+        except httpx.TransportError as e:  # Includes connect and read timeouts
+            logger.warning(f"{method} {url} failed ({e}), retrying in {delay:.2f}s")
+        else:
+            if response.status_code not in RETRY_STATUS_CODES:
+                return response
+            retry_after = response.headers.get("Retry-After", "")
+            delay = float(retry_after) if retry_after.isdigit() else delay
+            logger.warning(
+                f"{method} {url} returned {response.status_code}, "
+                f"retrying in {delay:.2f}s",
+            )
+        time.sleep(delay)
+    return http_client.request(method, url, params=params, json=json)
+
+
+def format_api_results(
+    api_results: list[dict[str, Any]], media_type: str,
+) -> list[dict[str, Any]]:
+    """Convert API results into template rows, stripping the static prefix."""
+    formatted_results = []
+    for result in api_results:
+        file_path = result.get("file_path", "")
+        for prefix in STATIC_PREFIXES:
+            if file_path.startswith(prefix):
+                file_path = file_path.removeprefix(prefix)
+                break
+        formatted_results.append({
+            "media": file_path,
+            "caption": result.get("description", "No caption available"),
+            "media_type": media_type,
+            "offset": result.get("offset_seconds"),
+        })
+    return formatted_results
+
+
 def fetch_results_fastapi(validated_input: SearchQuery) -> list[dict[str, Any]]:
     """Fetch search results from the FastAPI service."""
-    api_url = API_URLS["fastapi"]
-
     try:
-        with httpx.Client(timeout=10) as client:
-            logger.info(
-                "Sending request to FastAPI with params {}",
-                validated_input.model_dump(),
-            )
-            response = client.get(api_url, params=validated_input.model_dump())
-            response.raise_for_status()
-            api_results = response.json().get("results", [])
-            logger.info(f"Received {len(api_results)} results from FastAPI")
-
-            # Format results and strip the 'static/' prefix
-            formatted_results = []
-            for result in api_results:
-                file_path = result.get("file_path", "")
-                if file_path.startswith("static/images"):
-                    file_path = file_path.replace("static/images", "", 1)
-                if file_path.startswith("static/videos"):
-                    file_path = file_path.replace("static/videos", "", 1)
-                formatted_results.append({
-                    "media": file_path,
-                    "caption": result.get("description", "No caption available"),
-                    "media_type": validated_input.file_type,
-                })
-            return formatted_results
+        logger.info(
+            "Sending request to FastAPI with params {}",
+            validated_input.model_dump(),
+        )
+        response = request_with_retry(
+            "GET", API_URLS["fastapi"], params=validated_input.model_dump(),
+        )
+        response.raise_for_status()
+        api_results = response.json().get("results", [])
+        logger.info(f"Received {len(api_results)} results from FastAPI")
+        return format_api_results(api_results, validated_input.file_type)
 
     except (httpx.HTTPError, ValueError) as e:
         logger.error("Error communicating with FastAPI: {}", e)
@@ -158,37 +240,19 @@ def fetch_results_fastapi(validated_input: SearchQuery) -> list[dict[str, Any]]:
 
 def fetch_results_bentoml(validated_input: SearchQuery) -> list[dict[str, Any]]:
     """Fetch search results from the BentoML service."""
-    api_url = API_URLS["bentoml"]
-
     try:
-        with httpx.Client(timeout=10) as client:
-            logger.info(
-                "Sending request to BentoML with params {}",
-                validated_input.model_dump(),
-            )
-            payload = {"input_data": validated_input.model_dump()}
-            response = client.post(api_url, json=payload)
-            response.raise_for_status()
-            api_results = response.json().get("results", [])
-            logger.info(f"Received {len(api_results)} results from BentoML")
-
-            # Format results and strip the 'static/' prefix
-            formatted_results = []
-            for result in api_results:
-                file_path = result.get("file_path", "")
-                description = result.get("description", "No caption available")
-                if file_path.startswith("static/images"):
-                    file_path = file_path.replace("static/images/", "", 1)
-                elif file_path.startswith("static/videos"):
-                    file_path = file_path.replace("static/videos/", "", 1)
-                formatted_results.append({
-                    "media": file_path,
-                    "caption": description,
-                    "media_type": validated_input.file_type,
-                })
-            return formatted_results
-
-    except httpx.HTTPError as e:
+        logger.info(
+            "Sending request to BentoML with params {}",
+            validated_input.model_dump(),
+        )
+        payload = {"input_data": validated_input.model_dump()}
+        response = request_with_retry("POST", API_URLS["bentoml"], json=payload)
+        response.raise_for_status()
+        api_results = response.json().get("results", [])
+        logger.info(f"Received {len(api_results)} results from BentoML")
+        return format_api_results(api_results, validated_input.file_type)
+
+    except (httpx.HTTPError, ValueError) as e:
         logger.error(f"Error communicating with BentoML: {e}")
         return [
             {
@@ -221,6 +285,7 @@ def index() -> Response:
             validated_input = SearchQuery(
                 query=request.form.get("query", ""),
                 file_type=request.form.get("file_type"),
+                mode=request.form.get("mode", "keyword"),
             )
             results = fetch_results(validated_input)
         except ValidationError as e:
@@ -243,13 +308,47 @@ def index() -> Response:
 @app.route("/images/<path:filename>")
 def serve_image(filename: str) -> Response:
     """Serve static image files from the 'static/images' folder."""
-    return send_from_directory("static/images", filename)
+    return send_from_directory(
+        MEDIA_FOLDERS["image"], filename, conditional=True, max_age=MEDIA_MAX_AGE,
+    )
 
 
 @app.route("/videos/<path:filename>")
 def serve_video(filename: str) -> Response:
-    """Serve static video files from the 'static/videos' folder."""
-    return send_from_directory("static/videos", filename)
+    """Serve static video files from the 'static/videos' folder.
+
+    Responses are conditional, so browsers get ``Accept-Ranges`` and can
+    seek or resume with ``Range`` requests instead of downloading the whole
+    file.
+    """
+    return send_from_directory(
+        MEDIA_FOLDERS["video"], filename, conditional=True, max_age=MEDIA_MAX_AGE,
+    )
+
+
+@app.route("/thumbnails/<media_type>/<path:filename>")
+def serve_thumbnail(media_type: str, filename: str) -> Response:
+    """Serve an image thumbnail or video poster, rendering it on first use.
+
+    The thumbnail's content key is sent as a strong ``ETag``, so a browser
+    revalidating after ``max_age`` gets a 304 unless the source changed.
+    """
+    folder = MEDIA_FOLDERS.get(media_type)
+    source = safe_join(folder, filename) if folder else None
+    if source is None or not Path(source).is_file():
+        abort(404)
+    try:
+        thumbnail = thumbnail_cache.get(Path(source), media_type)
+    except (OSError, UnidentifiedImageError, ValueError) as e:
+        logger.warning(f"Could not render a thumbnail for {source}: {e}")
+        abort(404)
+    return send_file(
+        thumbnail.path,
+        mimetype=thumbnail.mimetype,
+        etag=thumbnail.key,
+        conditional=True,
+        max_age=THUMBNAIL_MAX_AGE,
+    )
 
 
 if __name__ == "__main__":
@@ -0,0 +1,116 @@
+"""Benchmark IVF recall@10 and queries per second against exact search.
+
+Run from the repository root::
+
+    python -m benchmarks.benchmark_ann --vectors 200000 --nprobe 1 4 16 64
+
+By default a synthetic clustered corpus of unit vectors is generated so
+the benchmark runs without a model or media. Pass ``--from-store`` to use
+the embeddings of the current vector store generation instead; queries are
+then perturbed copies of stored rows. The first row is the exact scan, and
+its result lists are the ground truth recall is measured against.
+"""
+
+from __future__ import annotations
+
+import argparse
+import time
+
+import numpy as np
+from loguru import logger
+
+from ann_index import IVFIndex
+from vector_store import load_snapshot, top_k
+
+K = 10
+
+
+def synthetic_corpus(
+    count: int, dimensions: int, clusters: int, rng: np.random.Generator,
+) -> np.ndarray:
+    """Return ``count`` normalised float16 vectors drawn around random centres."""
+    centres = rng.standard_normal((clusters, dimensions), dtype=np.float32)
+    labels = rng.integers(clusters, size=count)
+    vectors = centres[labels] + 0.6 * rng.standard_normal(
+        (count, dimensions), dtype=np.float32,
+    )
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors.astype(np.float16)
+
+
+def make_queries(
+    vectors: np.ndarray, count: int, rng: np.random.Generator,
+) -> np.ndarray:
+    """Return normalised noisy copies of random corpus rows."""
+    rows = np.asarray(vectors[rng.integers(len(vectors), size=count)], np.float32)
+    queries = rows + 0.3 * rng.standard_normal(rows.shape, dtype=np.float32)
+    return queries / np.linalg.norm(queries, axis=1, keepdims=True)
+
+
+def time_queries(search: callable, queries: np.ndarray) -> tuple[list, float]:
+    """Run ``search`` for every query and return the results and QPS."""
+    start = time.perf_counter()
+    results = [search(query) for query in queries]
+    return results, len(queries) / (time.perf_counter() - start)
+
+
+def recall_at_k(results: list, truth: list) -> float:
+    """Return the mean fraction of the exact top ``K`` that was found."""
+    return float(np.mean([
+        len(set(found.tolist()) & set(expected.tolist())) / len(expected)
+        for found, expected in zip(results, truth, strict=True)
+    ]))
+
+
+def main() -> None:
+    """Parse arguments and print a recall versus throughput table."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--vectors", type=int, default=200000)
+    parser.add_argument("--dimensions", type=int, default=512)
+    parser.add_argument("--clusters", type=int, default=1000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--nlist", type=int, default=0, help="0 picks the default")
+    parser.add_argument("--nprobe", type=int, nargs="+", default=[1, 4, 16, 64])
+    parser.add_argument("--from-store", action="store_true")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    if args.from_store:
+        snapshot = load_snapshot()
+        if snapshot is None or not snapshot.ids:
+            parser.error("The vector store is empty; run the indexer first")
+        vectors = snapshot.vectors
+    else:
+        vectors = synthetic_corpus(
+            args.vectors, args.dimensions, args.clusters, rng,
+        )
+    queries = make_queries(vectors, args.queries, rng)
+
+    start = time.perf_counter()
+    ivf = IVFIndex.build(vectors, nlist=args.nlist or None)
+    logger.info(
+        f"Built IVF over {len(vectors)} vectors with {len(ivf.centroids)} lists "
+        f"in {time.perf_counter() - start:.1f}s",
+    )
+
+    exact, exact_qps = time_queries(
+        lambda query: top_k(vectors, query, K)[0], queries,
+    )
+    logger.info(f"{'search':>12} {'recall@10':>10} {'QPS':>9} {'speedup':>8}")
+    logger.info(f"{'exact':>12} {1.0:>10.3f} {exact_qps:>9.1f} {1.0:>7.2f}x")
+    for nprobe in args.nprobe:
+        results, qps = time_queries(
+            lambda query, nprobe=nprobe: ivf.search(
+                vectors, query, K, nprobe=nprobe,
+            )[0],
+            queries,
+        )
+        logger.info(
+            f"{f'nprobe={nprobe}':>12} {recall_at_k(results, exact):>10.3f} "
+            f"{qps:>9.1f} {qps / exact_qps:>7.2f}x",
+        )
+
+
+if __name__ == "__main__":
+    main()
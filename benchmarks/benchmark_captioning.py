@@ -0,0 +1,76 @@
+"""Benchmark BLIP captioning throughput across batch sizes.
+
+Run from the repository root::
+
+    python -m benchmarks.benchmark_captioning --batch-sizes 1 4 8 16
+
+Batch size 1 reproduces the old one-image-at-a-time loop, so the first row
+is the baseline the other rows should be compared against.
+"""
+
+from __future__ import annotations
+
+import argparse
+import time
+from pathlib import Path
+
+from loguru import logger
+
+from captioning import generate_captions, load_image
+
+DEFAULT_IMAGE_FOLDER = "static/images"
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg")
+
+
+def collect_images(folder: str, count: int) -> list:
+    """Decode up to ``count`` images, repeating the folder if it is too small."""
+    paths = sorted(
+        path for path in Path(folder).iterdir()
+        if path.suffix.lower() in IMAGE_EXTENSIONS
+    )
+    if not paths:
+        msg = f"No images found in {folder}"
+        raise FileNotFoundError(msg)
+    return [load_image(paths[i % len(paths)]) for i in range(count)]
+
+
+def run_benchmark(images: list, batch_sizes: list[int]) -> list[dict]:
+    """Caption ``images`` once per batch size and report images per second."""
+    generate_captions(images[:1], batch_size=1)  # Warm up kernels and caches
+    rows = []
+    for batch_size in batch_sizes:
+        start = time.perf_counter()
+        generate_captions(images, batch_size=batch_size)
+        elapsed = time.perf_counter() - start
+        rows.append({
+            "batch_size": batch_size,
+            "seconds": elapsed,
+            "images_per_second": len(images) / elapsed,
+        })
+    return rows
+
+
+def main() -> None:
+    """Parse arguments and print a throughput table."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--folder", default=DEFAULT_IMAGE_FOLDER)
+    parser.add_argument("--images", type=int, default=32)
+    parser.add_argument(
+        "--batch-sizes", type=int, nargs="+", default=[1, 2, 4, 8, 16],
+    )
+    args = parser.parse_args()
+
+    images = collect_images(args.folder, args.images)
+    rows = run_benchmark(images, args.batch_sizes)
+    baseline = rows[0]["images_per_second"]
+    logger.info(f"{'batch':>6} {'seconds':>9} {'img/s':>8} {'speedup':>8}")
+    for row in rows:
+        logger.info(
+            f"{row['batch_size']:>6} {row['seconds']:>9.2f} "
+            f"{row['images_per_second']:>8.2f} "
+            f"{row['images_per_second'] / baseline:>7.2f}x",
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,431 @@
+r"""Offline search and indexing benchmarks with machine-readable results.
+
+Run from the repository root::
+
+    python -m benchmarks.benchmark_suite --sizes 1000 10000 100000 \\
+        --index-sizes 1000 --output results.json
+
+Nothing is downloaded. Every run works in a scratch directory (``--workdir``
+or a temporary one) with semantic search, the caption cache and the result
+cache turned off, and captions come from a deterministic stub captioner
+drawing Zipf-distributed words from a fixed vocabulary.
+
+For each of ``--sizes`` a synthetic corpus of that many captioned
+documents is written straight into a fresh Whoosh index (80% images, 20%
+video frames in groups of four) and ``search_with_filters`` is timed for
+each query shape in ``QUERY_SHAPES``. For each of ``--index-sizes``, that
+many small JPEGs are generated and ``index_data`` rebuilds the index from
+them, with the time spent in each stage reported separately. Decode
+(which includes the thumbnail) and thumbnail times are summed over the
+decode threads, so they can exceed the wall time.
+
+Results are logged as tables and written as JSON to ``--output``. Pass a
+previous results file as ``--compare`` to log the relative change of every
+metric, e.g. between two commits.
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import statistics
+import subprocess
+import tempfile
+import threading
+import time
+import zlib
+from contextlib import ExitStack, contextmanager
+from datetime import UTC, datetime, timedelta
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, ParamSpec, TypeVar
+from unittest import mock
+
+from loguru import logger
+from PIL import Image
+from whoosh import index
+from whoosh.writing import SegmentWriter
+
+import settings
+from media_ids import frame_id
+
+if TYPE_CHECKING:
+    from collections.abc import Callable, Iterator
+
+P = ParamSpec("P")
+R = TypeVar("R")
+
+# Stub captions look like BLIP's: "a <adjective> <subject> <relation> <scene>"
+ADJECTIVES = (
+    "small", "large", "white", "black", "brown", "red", "blue", "green", "old",
+    "young", "happy", "wet", "sleeping", "running", "wooden", "tall", "little",
+    "yellow", "striped", "fluffy",
+)
+SUBJECTS = (
+    "dog", "cat", "man", "woman", "child", "car", "bird", "horse", "boat",
+    "tree", "house", "bicycle", "train", "plane", "cow", "sheep", "bus",
+    "truck", "flower", "table", "chair", "laptop", "phone", "guitar", "ball",
+    "kite", "surfboard", "umbrella", "bench", "bridge", "tower", "mountain",
+    "river", "fountain", "statue", "lamp", "window", "door", "fence", "camel",
+)
+RELATIONS = (
+    "on", "in", "near", "under", "next to", "in front of", "behind", "with",
+)
+SCENES = (
+    "the beach", "a street", "a field", "the snow", "a park", "a kitchen",
+    "a city", "the water", "a forest", "a table", "the grass", "a road",
+    "a room", "the sand", "a garden", "the sky", "a hill", "a lake", "a desert",
+    "a market",
+)
+VIDEO_SHARE = 0.2  # Share of documents that are video frames
+FRAMES_PER_VIDEO = 4
+FRAME_SPACING_SECONDS = 3.0
+CORPUS_START = datetime(2020, 1, 1, tzinfo=UTC)
+CORPUS_DAYS = 5 * 365
+STUB_IMAGE_SIZE = 64
+SEED = 42
+
+# Name -> search_with_filters keyword arguments. Dates are relative to
+# CORPUS_START so every shape selects the same share of any corpus size.
+QUERY_SHAPES: dict[str, dict[str, Any]] = {
+    "single_common": {"query": "dog"},
+    "single_rare": {"query": "camel"},
+    "two_terms": {"query": "dog beach"},
+    "or_group": {"query": "dog OR cat OR horse OR bird"},
+    "not": {"query": "dog NOT beach"},
+    "date_range": {
+        "query": "dog",
+        "start_date": CORPUS_START + timedelta(days=365),
+        "end_date": CORPUS_START + timedelta(days=2 * 365),
+    },
+    "type_filter": {"query": "dog", "file_type": "video"},
+    "date_range_or_not": {
+        "query": "dog OR cat NOT snow",
+        "start_date": CORPUS_START + timedelta(days=365),
+        "end_date": CORPUS_START + timedelta(days=3 * 365),
+        "file_type": "image",
+    },
+}
+
+
+def zipf_choice(rng: random.Random, words: tuple[str, ...]) -> str:
+    """Pick a word, the ``n``-th one with probability proportional to 1/n."""
+    weights = [1 / rank for rank in range(1, len(words) + 1)]
+    return rng.choices(words, weights)[0]
+
+
+def stub_caption(seed: int) -> str:
+    """Return a deterministic BLIP-like caption for ``seed``."""
+    rng = random.Random(seed)  # noqa: S311
+    return (
+        f"a {zipf_choice(rng, ADJECTIVES)} {zipf_choice(rng, SUBJECTS)} "
+        f"{rng.choice(RELATIONS)} {zipf_choice(rng, SCENES)}"
+    )
+
+
+def stub_caption_batch(images: list[Image.Image]) -> list[str]:
+    """Stand-in for ``captioning.caption_batch`` keyed by pixel content."""
+    return [stub_caption(zlib.crc32(image.tobytes())) for image in images]
+
+
+def synthetic_documents(count: int, seed: int = SEED) -> Iterator[dict[str, Any]]:
+    """Yield ``count`` index documents shaped like the ones ``index_data`` writes."""
+    rng = random.Random(seed)  # noqa: S311
+    produced = video = 0
+    while produced < count:
+        date = CORPUS_START + timedelta(seconds=rng.randrange(CORPUS_DAYS * 86400))
+        if rng.random() >= VIDEO_SHARE:
+            yield {
+                "file_path": f"static/images/gen{produced}.jpg",
+                "media_type": "image",
+                "description": stub_caption(rng.getrandbits(32)),
+                "date": date,
+            }
+            produced += 1
+            continue
+        video_path = f"static/videos/gen{video}.mp4"
+        video += 1
+        for frame in range(min(FRAMES_PER_VIDEO, count - produced)):
+            offset = frame * FRAME_SPACING_SECONDS
+            yield {
+                "file_path": frame_id(video_path, offset),
+                "video_path": video_path,
+                "offset_seconds": offset,
+                "media_type": "video",
+                "description": stub_caption(rng.getrandbits(32)),
+                "date": date,
+            }
+            produced += 1
+
+
+class StageTimer:
+    """Accumulate wall time and call counts per named stage across threads."""
+
+    def __init__(self) -> None:
+        """Start with no stages."""
+        self.seconds: dict[str, float] = {}
+        self.calls: dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def wrap(self, stage: str, func: Callable[P, R]) -> Callable[P, R]:
+        """Return ``func`` with its time charged to ``stage``."""
+
+        def timed(*args: P.args, **kwargs: P.kwargs) -> R:
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                elapsed = time.perf_counter() - start
+                with self._lock:
+                    self.seconds[stage] = self.seconds.get(stage, 0.0) + elapsed
+                    self.calls[stage] = self.calls.get(stage, 0) + 1
+
+        return timed
+
+
+def latency_summary(samples: list[float]) -> dict[str, float]:
+    """Return mean, p50, p95 and max of ``samples`` seconds, in milliseconds."""
+    ordered = sorted(samples)
+    return {
+        "mean_ms": 1000 * statistics.fmean(ordered),
+        "p50_ms": 1000 * ordered[len(ordered) // 2],
+        "p95_ms": 1000 * ordered[min(len(ordered) - 1, int(0.95 * len(ordered)))],
+        "max_ms": 1000 * ordered[-1],
+    }
+
+
+def benchmark_index_write(size: int) -> dict[str, float]:
+    """Write ``size`` synthetic documents into a fresh index; return docs/s.
+
+    The index folder is emptied first. ``create_in`` only drops the table of
+    contents, and the commit's cleanup skips files that are still open, so
+    the previous size's segments could otherwise count towards
+    ``index_bytes``.
+    """
+    # App modules read the patched config and open the index when imported,
+    # so they are only imported once main() has set up the scratch directory
+    from main import INDEX_FOLDER, schema  # noqa: PLC0415
+
+    shutil.rmtree(INDEX_FOLDER, ignore_errors=True)
+    Path(INDEX_FOLDER).mkdir(parents=True)
+    ix = index.create_in(INDEX_FOLDER, schema)
+    start = time.perf_counter()
+    writer = ix.writer(limitmb=256)
+    for document in synthetic_documents(size):
+        writer.add_document(**document)
+    added = time.perf_counter() - start
+    writer.commit()
+    seconds = time.perf_counter() - start
+    return {
+        "documents": size,
+        "seconds": seconds,
+        "commit_seconds": seconds - added,
+        "documents_per_second": size / seconds,
+        "index_bytes": sum(
+            path.stat().st_size for path in Path(INDEX_FOLDER).iterdir()
+        ),
+    }
+
+
+def benchmark_search(repeat: int, warmup: int) -> dict[str, dict[str, float]]:
+    """Time ``search_with_filters`` for every query shape on the current index."""
+    from main import search_with_filters, searcher_manager  # noqa: PLC0415
+
+    searcher_manager.force_refresh()
+    results = {}
+    for name, search in QUERY_SHAPES.items():
+        for _ in range(warmup):
+            hits = search_with_filters(**search)
+        samples = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            hits = search_with_filters(**search)
+            samples.append(time.perf_counter() - start)
+        results[name] = {"hits": len(hits), **latency_summary(samples)}
+    return results
+
+
+def write_stub_images(count: int, folder: Path, seed: int = SEED) -> None:
+    """Write ``count`` small distinct JPEGs into ``folder``."""
+    rng = random.Random(seed)  # noqa: S311
+    folder.mkdir(parents=True, exist_ok=True)
+    for number in range(count):
+        image = Image.new("RGB", (STUB_IMAGE_SIZE, STUB_IMAGE_SIZE), tuple(
+            rng.randrange(256) for _ in range(3)
+        ))
+        image.putpixel((number % STUB_IMAGE_SIZE, 0), (number % 256, 0, 0))
+        image.save(folder / f"gen{number}.jpg", quality=90)
+
+
+def benchmark_index_data(size: int) -> dict[str, Any]:
+    """Run ``index_data(full_rebuild=True)`` over ``size`` stub images."""
+    import indexer  # noqa: PLC0415
+    import pipeline  # noqa: PLC0415
+    from main import IMAGE_FOLDER, VIDEO_FOLDER  # noqa: PLC0415
+
+    for folder in (IMAGE_FOLDER, VIDEO_FOLDER):
+        shutil.rmtree(folder, ignore_errors=True)
+    write_stub_images(size, Path(IMAGE_FOLDER))
+    Path(VIDEO_FOLDER).mkdir(parents=True, exist_ok=True)
+    shutil.rmtree("cache", ignore_errors=True)
+
+    timer = StageTimer()
+    patches = {
+        (indexer, "scan_media_files"): "scan",
+        (indexer, "diff_against_manifest"): "hash_and_diff",
+        (indexer, "prepare_media"): "decode",
+        (indexer, "store_thumbnail"): "thumbnail",
+        (pipeline, "caption_batch"): "caption_stub",
+        (SegmentWriter, "add_document"): "write_documents",
+        (SegmentWriter, "delete_by_term"): "write_deletes",
+        (SegmentWriter, "commit"): "commit",
+        (indexer, "save_manifest"): "save_manifest",
+    }
+    with ExitStack() as stack:
+        for (owner, name), stage in patches.items():
+            func = stub_caption_batch if stage == "caption_stub" else getattr(
+                owner, name,
+            )
+            stack.enter_context(
+                mock.patch.object(owner, name, timer.wrap(stage, func)),
+            )
+        start = time.perf_counter()
+        indexer.index_data(full_rebuild=True)
+        seconds = time.perf_counter() - start
+    return {
+        "files": size,
+        "seconds": seconds,
+        "files_per_second": size / seconds,
+        "stages": {
+            stage: {"seconds": timer.seconds[stage], "calls": timer.calls[stage]}
+            for stage in timer.seconds
+        },
+    }
+
+
+def run_metadata(args: argparse.Namespace) -> dict[str, Any]:
+    """Describe the code and machine the results were measured on."""
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "HEAD"],  # noqa: S607
+            capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        "commit": commit,
+        "timestamp": datetime.now(UTC).isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "arguments": vars(args),
+    }
+
+
+def flatten(results: dict, prefix: str = "") -> dict[str, float]:
+    """Return every numeric leaf of ``results`` keyed by its dotted path."""
+    flat = {}
+    for key, value in results.items():
+        path = f"{prefix}{key}"
+        if isinstance(value, dict):
+            flat.update(flatten(value, f"{path}."))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[path] = value
+    return flat
+
+
+def log_comparison(results: dict, previous_path: Path) -> None:
+    """Log the relative change of every metric shared with an older run."""
+    with previous_path.open("r", encoding="utf-8") as previous_file:
+        previous = flatten(json.load(previous_file)["results"])
+    current = flatten(results["results"])
+    logger.info(f"Compared with {previous_path}:")
+    for key in sorted(current.keys() & previous.keys()):
+        if key.endswith(("_ms", "_per_second", "seconds")) and previous[key]:
+            change = (current[key] - previous[key]) / previous[key]
+            logger.info(
+                f"  {key}: {previous[key]:.3f} -> {current[key]:.3f} ({change:+.1%})",
+            )
+
+
+@contextmanager
+def scratch_directory(workdir: Path | None) -> Iterator[Path]:
+    """Run inside ``workdir``, or a temporary directory removed afterwards.
+
+    The app resolves ``index/``, ``static/`` and ``cache/`` against the
+    working directory, so the benchmark never touches the real ones.
+    """
+    previous = Path.cwd()
+    with tempfile.TemporaryDirectory(prefix="bench-") as temporary:
+        path = (workdir or Path(temporary)).resolve()
+        path.mkdir(parents=True, exist_ok=True)
+        os.chdir(path)
+        try:
+            yield path
+        finally:
+            os.chdir(previous)
+
+
+
+def main() -> None:
+    """Parse arguments, run the benchmarks and write the JSON results."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="*", default=[1000, 10000])
+    parser.add_argument("--index-sizes", type=int, nargs="*", default=[1000])
+    parser.add_argument("--repeat", type=int, default=50)
+    parser.add_argument("--warmup", type=int, default=5)
+    parser.add_argument("--workdir", type=Path)
+    parser.add_argument("--output", type=Path)
+    parser.add_argument("--compare", type=Path)
+    args = parser.parse_args()
+
+    # Override the cached configuration before any app module reads it
+    config = settings.load_config()
+    config.setdefault("semantic", {})["enabled"] = False
+    config.setdefault("caption_cache", {})["enabled"] = False
+    config.setdefault("search", {})["result_cache_size"] = 0
+    output = args.output.resolve() if args.output else None
+    compare = args.compare.resolve() if args.compare else None
+
+    with scratch_directory(args.workdir):
+        results: dict[str, Any] = {"search": {}, "index_data": {}}
+        for size in args.sizes:
+            write = benchmark_index_write(size)
+            logger.info(
+                f"{size} documents written in {write['seconds']:.1f}s "
+                f"({write['documents_per_second']:.0f} docs/s)",
+            )
+            shapes = benchmark_search(args.repeat, args.warmup)
+            results["search"][str(size)] = {"index_write": write, "queries": shapes}
+            logger.info(f"{'shape':>18} {'hits':>5} {'p50 ms':>8} {'p95 ms':>8}")
+            for name, shape in shapes.items():
+                logger.info(
+                    f"{name:>18} {shape['hits']:>5} {shape['p50_ms']:>8.2f} "
+                    f"{shape['p95_ms']:>8.2f}",
+                )
+        for size in args.index_sizes:
+            run = benchmark_index_data(size)
+            results["index_data"][str(size)] = run
+            logger.info(
+                f"index_data over {size} images: {run['seconds']:.1f}s "
+                f"({run['files_per_second']:.0f} files/s)",
+            )
+            for stage, timing in run["stages"].items():
+                logger.info(
+                    f"{stage:>18} {timing['seconds']:>8.2f}s "
+                    f"{timing['calls']:>7} calls",
+                )
+
+    report = {"meta": run_metadata(args), "results": results}
+    if output is not None:
+        output.write_text(json.dumps(report, indent=2, default=str), encoding="utf-8")
+        logger.info(f"Wrote {output}")
+    if compare is not None:
+        log_comparison(report, compare)
+
+
+if __name__ == "__main__":
+    main()
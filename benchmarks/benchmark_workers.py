@@ -0,0 +1,133 @@
+"""Benchmark FastAPI search throughput against the number of worker processes.
+
+Run from the repository root, after indexing::
+
+    python -m benchmarks.benchmark_workers --workers 1 2 4 8 --duration 30
+
+For every worker count a fresh ``uvicorn fastapi_app:app`` server is started
+on ``--port``. Once ``/health`` answers, ``--concurrency`` client threads
+send ``/search`` requests back to back for ``--duration`` seconds, each
+picking a query from ``--queries``. The table reports successful searches
+per second, mean latency, and how many requests were shed with a 503.
+Set ``[search] result_cache_size = 0`` to measure searches rather than
+cache hits.
+"""
+
+from __future__ import annotations
+
+import argparse
+import random
+import subprocess
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from typing import TYPE_CHECKING
+
+import httpx
+from loguru import logger
+
+if TYPE_CHECKING:
+    from collections.abc import Iterator
+
+DEFAULT_QUERIES = ("dog", "cat", "beach", "city street", "people", "car", "tree")
+STARTUP_TIMEOUT = 120.0  # Seconds to wait for all workers to serve /health
+HTTP_OK = 200
+HTTP_UNAVAILABLE = 503
+
+
+@contextmanager
+def serve(workers: int, port: int) -> Iterator[str]:
+    """Run uvicorn with ``workers`` processes and yield its base URL."""
+    server = subprocess.Popen(  # noqa: S603
+        [
+            sys.executable, "-m", "uvicorn", "fastapi_app:app",
+            "--host", "127.0.0.1", "--port", str(port),
+            "--workers", str(workers), "--log-level", "warning",
+        ],
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    base_url = f"http://127.0.0.1:{port}"
+    try:
+        deadline = time.monotonic() + STARTUP_TIMEOUT
+        while True:
+            try:
+                if httpx.get(f"{base_url}/health").status_code == HTTP_OK:
+                    break
+            except httpx.TransportError:
+                pass
+            if time.monotonic() > deadline or server.poll() is not None:
+                msg = f"Server with {workers} workers did not start"
+                raise RuntimeError(msg)
+            time.sleep(0.5)
+        yield base_url
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def run_load(
+    base_url: str, concurrency: int, duration: float, queries: list[str],
+) -> tuple[int, int, float]:
+    """Return successful searches, rejections and total seconds spent waiting."""
+    lock = threading.Lock()
+    totals = {"ok": 0, "rejected": 0, "latency": 0.0}
+    stop_at = time.monotonic() + duration
+
+    def client(seed: int) -> None:
+        rng = random.Random(seed)  # noqa: S311
+        ok = rejected = 0
+        latency = 0.0
+        with httpx.Client(base_url=base_url, timeout=30.0) as http:
+            while time.monotonic() < stop_at:
+                start = time.perf_counter()
+                response = http.get("/search", params={
+                    "query": rng.choice(queries), "file_type": "image",
+                })
+                if response.status_code == HTTP_OK:
+                    ok += 1
+                    latency += time.perf_counter() - start
+                elif response.status_code == HTTP_UNAVAILABLE:
+                    rejected += 1
+        with lock:
+            totals["ok"] += ok
+            totals["rejected"] += rejected
+            totals["latency"] += latency
+
+    threads = [
+        threading.Thread(target=client, args=(seed,)) for seed in range(concurrency)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return totals["ok"], totals["rejected"], totals["latency"]
+
+
+def main() -> None:
+    """Parse arguments and print throughput for each worker count."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--duration", type=float, default=30.0)
+    parser.add_argument("--warmup", type=float, default=5.0)
+    parser.add_argument("--port", type=int, default=8010)
+    parser.add_argument("--queries", nargs="+", default=list(DEFAULT_QUERIES))
+    args = parser.parse_args()
+
+    logger.info(f"{'workers':>8} {'searches/s':>11} {'mean ms':>8} {'503s':>6}")
+    for workers in args.workers:
+        with serve(workers, args.port) as base_url:
+            run_load(base_url, args.concurrency, args.warmup, args.queries)
+            ok, rejected, latency = run_load(
+                base_url, args.concurrency, args.duration, args.queries,
+            )
+        mean_ms = 1000 * latency / ok if ok else float("nan")
+        logger.info(
+            f"{workers:>8} {ok / args.duration:>11.1f} {mean_ms:>8.1f} {rejected:>6}",
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -2,13 +2,48 @@
 
 from __future__ import annotations
 
+from datetime import datetime  # noqa: TC003 - pydantic resolves it at runtime
+from http import HTTPStatus
+from typing import TYPE_CHECKING, Literal
+
 import bentoml
+from bentoml.exceptions import BentoMLException, NotFound, ServiceUnavailable
 from loguru import logger
 from pydantic import BaseModel
 
 from main import (
+    indexed_analyzer,
+    result_cache,
     search_with_filters,  # Ensure this function is properly implemented in main.py
 )
+from main import search_batch as run_search_batch
+from metrics import time_stage
+from profiling import admin_denial, profiler
+from query_log import record_search
+from search_executor import SearchQueueFullError, search_executor
+from settings import serving_workers
+from text_analysis import warm_up
+from validators import MAX_BATCH_SIZE
+
+if TYPE_CHECKING:
+    from ranking import ScoredHit
+
+# Adaptive batching waits at most this long to fill a batch
+BATCH_MAX_LATENCY_MS = 20
+SERVING_WORKERS = serving_workers()
+
+
+class AdminTokenError(BentoMLException):
+    """Raised when an admin call lacks the configured ``X-Admin-Token``."""
+
+    error_code = HTTPStatus.FORBIDDEN
+
+
+def check_admin_token(ctx: bentoml.Context) -> None:
+    """Reject the call unless it carries the configured admin token."""
+    denial = admin_denial(ctx.request.headers.get("x-admin-token"))
+    if denial is not None:
+        raise AdminTokenError(denial)
 
 
 # Define request and response models
@@ -17,6 +52,10 @@ class SearchRequest(BaseModel):
 
     query: str
     file_type: str
+    mode: Literal["keyword", "semantic", "hybrid"] = "keyword"
+    explain: bool = False  # Include each result's score breakdown
+    start_date: datetime | None = None  # Only media dated within this range
+    end_date: datetime | None = None
 
 
 class SearchResult(BaseModel):
@@ -24,6 +63,9 @@ class SearchResult(BaseModel):
 
     file_path: str
     description: str
+    scores: dict[str, float] | None = None
+    offset_seconds: float | None = None  # Best-matching frame of a video
+    offsets: list[float] | None = None  # Every matching frame, best first
 
 
 class SearchResponse(BaseModel):
@@ -34,9 +76,72 @@ class SearchResponse(BaseModel):
     error: str | None = None
 
 
-# Define BentoML Service
+def format_results(
+    raw_results: list[ScoredHit], *, explain: bool = False,
+) -> SearchResponse:
+    """Convert search hits into the response model."""
+    with time_stage("serialize"):
+        return SearchResponse(results=[
+            SearchResult(
+                file_path=path,
+                description=desc,
+                scores=scores if explain else None,
+                offset_seconds=offsets[0] if offsets else None,
+                offsets=offsets or None,
+            )
+            for path, desc, scores, offsets in raw_results
+        ])
+
+
+def run_search(input_data: SearchRequest) -> SearchResponse:
+    """Run one search, reporting failures in the response instead of raising."""
+    try:
+        logger.info(
+            "Searching for '%s' files with query: '%s'",
+            input_data.file_type,
+            input_data.query,
+        )
+
+        # Call the search_with_filters function
+        raw_results = search_with_filters(
+            input_data.query,
+            input_data.file_type,
+            input_data.start_date,
+            input_data.end_date,
+            mode=input_data.mode,
+        )
+        return format_results(raw_results, explain=input_data.explain)
+
+    except ValueError as e:  # More specific error handling
+        logger.error(f"Search failed due to invalid input: {e!s}")
+        return SearchResponse(status="failed", error="Invalid search query.")
+
+
+    except (OSError, RuntimeError) as e:  # ✅ Replace blind `except Exception`
+        logger.exception(f"Unexpected error: {e}")
+        return SearchResponse(status="failed", error="An unexpected error.")
+
+
+def run_batch(requests: list[SearchRequest]) -> list[SearchResponse]:
+    """Run a batch of searches, retrying each alone if the batch fails."""
+    try:
+        raw_results = run_search_batch(
+            request.model_dump(exclude={"explain"}) for request in requests
+        )
+    except (ValueError, OSError, RuntimeError) as e:
+        logger.warning(f"Batch search failed, retrying one by one: {e}")
+        return [run_search(request) for request in requests]
+    return [
+        format_results(hits, explain=request.explain)
+        for request, hits in zip(requests, raw_results, strict=True)
+    ]
+
+
+# Define BentoML Service. Its built-in /metrics endpoint also exports the
+# search stage, cache and indexing metrics from the metrics module.
 @bentoml.service(
-    resources={"cpu": "1"},
+    resources={"cpu": str(SERVING_WORKERS)},
+    workers=SERVING_WORKERS,
     traffic={"timeout": 60},
     port=3000,  # Specify the port number here
 )
@@ -46,33 +151,97 @@ class SearchService:
     def __init__(self) -> None:
         """Initialize the SearchService."""
         logger.info("Initializing SearchService...")
+        # Load the query analyzer without blocking startup, then check it
+        # against the analyzer the index was built with
+        warm_up(indexed_analyzer())
 
     # Search API (POST method)
     @bentoml.api
     async def search(self, input_data: SearchRequest) -> SearchResponse:
-        """Handle search queries and return matching results."""
+        """Handle search queries and return matching results.
+
+        The blocking search runs on the bounded executor so the event loop
+        keeps serving other requests; a full queue is answered with a 503.
+        """
+        record_search(
+            input_data.query,
+            input_data.file_type,
+            input_data.mode,
+            input_data.start_date,
+            input_data.end_date,
+        )
         try:
-            logger.info(
-                "Searching for '%s' files with query: '%s'",
-                input_data.file_type,
-                input_data.query,
+            return await search_executor.run(run_search, input_data)
+        except SearchQueueFullError as e:
+            logger.warning(f"Rejecting search: {e}")
+            raise ServiceUnavailable(str(e)) from e
+
+    @bentoml.api(
+        route="/search/batch",
+        batchable=True,
+        max_batch_size=MAX_BATCH_SIZE,
+        max_latency_ms=BATCH_MAX_LATENCY_MS,
+    )
+    async def search_batch(
+        self, requests: list[SearchRequest],
+    ) -> list[SearchResponse]:
+        """Handle many searches at once, answering in request order.
+
+        Adaptive batching merges the lists of concurrent callers into one
+        call, so identical queries from different clients run only once. If
+        the merged batch fails, each search is retried alone so one bad
+        request cannot fail the other callers' results. The batch takes one
+        slot on the bounded executor, and a full queue is answered with a 503.
+        """
+        logger.info(f"Running batch of {len(requests)} searches")
+        for request in requests:
+            record_search(
+                request.query,
+                request.file_type,
+                request.mode,
+                request.start_date,
+                request.end_date,
             )
-
-            # Call the search_with_filters function
-            raw_results = search_with_filters(input_data.query, input_data.file_type)
-
-            # Format results
-            formatted_results = [
-                SearchResult(file_path=path, description=desc)
-                for path, desc in raw_results
-            ]
-            return SearchResponse(results=formatted_results)
-
-        except ValueError as e:  # More specific error handling
-            logger.error(f"Search failed due to invalid input: {e!s}")
-            return SearchResponse(status="failed", error="Invalid search query.")
-
-
-        except (OSError, RuntimeError) as e:  # ✅ Replace blind `except Exception`
-            logger.exception(f"Unexpected error: {e}")
-            return SearchResponse(status="failed", error="An unexpected error.")
+        try:
+            return await search_executor.run(run_batch, requests)
+        except SearchQueueFullError as e:
+            logger.warning(f"Rejecting batch search: {e}")
+            raise ServiceUnavailable(str(e)) from e
+
+    @bentoml.api(route="/cache/stats")
+    def cache_stats(self) -> dict[str, float]:
+        """Report search result cache hit ratio, size and evictions."""
+        return result_cache.stats()
+
+    @bentoml.api(route="/admin/profiler")
+    def admin_profiler(
+        self,
+        ctx: bentoml.Context,
+        *,
+        enabled: bool | None = None,
+        search_threshold_ms: float | None = None,
+        indexing_threshold_ms: float | None = None,
+    ) -> dict:
+        """Switch the slow-request profiler, change its thresholds, list traces.
+
+        Call it without arguments to only read the current state.
+        """
+        check_admin_token(ctx)
+        changes = (enabled, search_threshold_ms, indexing_threshold_ms)
+        if any(value is not None for value in changes):
+            profiler.configure(
+                enabled=enabled,
+                search_threshold_ms=search_threshold_ms,
+                indexing_threshold_ms=indexing_threshold_ms,
+            )
+        return profiler.describe()
+
+    @bentoml.api(route="/admin/profiler/profile")
+    def admin_profile(self, ctx: bentoml.Context, name: str) -> str:
+        """Return one saved trace as collapsed stacks, e.g. for flamegraph.pl."""
+        check_admin_token(ctx)
+        trace = profiler.read_profile(name)
+        if trace is None:
+            msg = f"Profile not found: {name}"
+            raise NotFound(msg)
+        return trace
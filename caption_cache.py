@@ -0,0 +1,105 @@
+"""Persistent, size-bounded caption cache backed by SQLite.
+
+Captions are keyed by a digest of the image content together with the model
+name and generation parameters, so identical bytes are only captioned once
+no matter how often the index is rebuilt or the file is renamed.
+"""
+
+from __future__ import annotations
+
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+from loguru import logger
+
+from settings import get_section
+
+CACHE_CONFIG = get_section("caption_cache")
+CACHE_ENABLED = CACHE_CONFIG.get("enabled", True)
+CACHE_PATH = Path(CACHE_CONFIG.get("path", "cache/captions.sqlite3"))
+CACHE_MAX_ENTRIES = CACHE_CONFIG.get("max_entries", 100_000)
+SQLITE_MAX_VARIABLES = 500  # Keys per IN (...) lookup, well under SQLite's limit
+
+
+class CaptionCache:
+    """Thread-safe LRU caption store shared by every indexing stage."""
+
+    def __init__(self, path: Path, max_entries: int) -> None:
+        """Open (or create) the cache database at ``path``."""
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS captions ("
+            "key TEXT PRIMARY KEY, caption TEXT NOT NULL, last_used REAL NOT NULL)",
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS captions_last_used ON captions (last_used)",
+        )
+        self._conn.commit()
+
+    def get_many(self, keys: list[str]) -> dict[str, str]:
+        """Return the cached captions for ``keys`` and mark them recently used."""
+        found: dict[str, str] = {}
+        unique_keys = list(dict.fromkeys(keys))
+        with self._lock:
+            for start in range(0, len(unique_keys), SQLITE_MAX_VARIABLES):
+                chunk = unique_keys[start:start + SQLITE_MAX_VARIABLES]
+                placeholders = ",".join("?" * len(chunk))
+                # Only "?" placeholders are interpolated; the keys are bound
+                query = (
+                    "SELECT key, caption FROM captions "  # noqa: S608
+                    f"WHERE key IN ({placeholders})"
+                )
+                found.update(self._conn.execute(query, chunk).fetchall())
+            if found:
+                now = time.time()
+                self._conn.executemany(
+                    "UPDATE captions SET last_used = ? WHERE key = ?",
+                    [(now, key) for key in found],
+                )
+                self._conn.commit()
+            self.hits += sum(1 for key in keys if key in found)
+            self.misses += sum(1 for key in keys if key not in found)
+        return found
+
+    def put_many(self, captions: dict[str, str]) -> None:
+        """Store new captions and evict the least recently used overflow."""
+        if not captions:
+            return
+        now = time.time()
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO captions (key, caption, last_used) "
+                "VALUES (?, ?, ?)",
+                [(key, caption, now) for key, caption in captions.items()],
+            )
+            (count,) = self._conn.execute("SELECT COUNT(*) FROM captions").fetchone()
+            overflow = count - self.max_entries
+            if overflow > 0:
+                self._conn.execute(
+                    "DELETE FROM captions WHERE key IN ("
+                    "SELECT key FROM captions ORDER BY last_used LIMIT ?)",
+                    (overflow,),
+                )
+                self.evictions += overflow
+            self._conn.commit()
+
+    def log_stats(self) -> None:
+        """Log hit, miss and eviction counts since the cache was opened."""
+        lookups = self.hits + self.misses
+        ratio = self.hits / lookups if lookups else 0.0
+        logger.info(
+            f"Caption cache: {self.hits} hits, {self.misses} misses "
+            f"({ratio:.1%} hit ratio), {self.evictions} evictions",
+        )
+
+
+caption_cache = CaptionCache(CACHE_PATH, CACHE_MAX_ENTRIES) if CACHE_ENABLED else None
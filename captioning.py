@@ -0,0 +1,149 @@
+"""Batched BLIP captioning for images and video frames."""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import threading
+from pathlib import Path
+from typing import TYPE_CHECKING
+
+from loguru import logger
+from PIL import Image
+
+from caption_cache import caption_cache
+from settings import get_section
+
+if TYPE_CHECKING:
+    from transformers import BlipForConditionalGeneration, BlipProcessor
+
+MODEL_NAME = "Salesforce/blip-image-captioning-base"
+# Images per forward pass of the BLIP decoder
+CAPTION_BATCH_SIZE = get_section("indexing").get("batch_size", 8)
+GENERATION_KWARGS = {"max_length": 20}  # Matches the BLIP base default
+NO_DESCRIPTION = "No description available."
+# Anything that changes the caption for the same pixels must be part of the key
+CACHE_NAMESPACE = f"{MODEL_NAME}|{json.dumps(GENERATION_KWARGS, sort_keys=True)}"
+
+ImageInput = str | Path | Image.Image
+
+_model_lock = threading.Lock()
+_processor: BlipProcessor | None = None
+_model: BlipForConditionalGeneration | None = None
+
+
+def load_model() -> tuple[BlipProcessor, BlipForConditionalGeneration]:
+    """Load the BLIP processor and model on first use.
+
+    torch and transformers are imported here rather than at module level so
+    that runs where every caption is cached never pay for them.
+    """
+    global _processor, _model  # noqa: PLW0603
+    with _model_lock:
+        if _model is None:
+            from transformers import (  # noqa: PLC0415
+                BlipForConditionalGeneration,
+                BlipProcessor,
+            )
+
+            logger.info("Loading BLIP image captioning model...")
+            _processor = BlipProcessor.from_pretrained(MODEL_NAME)
+            _model = BlipForConditionalGeneration.from_pretrained(MODEL_NAME)
+            logger.info("BLIP model loaded successfully!")
+    return _processor, _model
+
+
+def load_image(image: ImageInput) -> Image.Image:
+    """Return an RGB PIL image from a path or an already decoded image."""
+    if isinstance(image, Image.Image):
+        return image.convert("RGB")
+    with Image.open(image) as opened:
+        return opened.convert("RGB")
+
+
+def caption_cache_key(image: Image.Image) -> str:
+    """Key a decoded image by its pixel content, model and generation settings."""
+    digest = hashlib.blake2b(CACHE_NAMESPACE.encode(), digest_size=20)
+    digest.update(f"{image.mode}|{image.size}".encode())
+    digest.update(image.tobytes())
+    return digest.hexdigest()
+
+
+def lookup_cached_captions(keys: list[str]) -> list[str | None]:
+    """Return the cached caption for each key, or ``None`` on a miss."""
+    if caption_cache is None:
+        return [None] * len(keys)
+    found = caption_cache.get_many(keys)
+    return [found.get(key) for key in keys]
+
+
+def store_cached_captions(keys: list[str], captions: list[str]) -> None:
+    """Remember freshly generated captions, skipping failed placeholders."""
+    if caption_cache is not None:
+        caption_cache.put_many({
+            key: caption
+            for key, caption in zip(keys, captions, strict=True)
+            if caption != NO_DESCRIPTION
+        })
+
+
+def caption_batch(images: list[Image.Image]) -> list[str]:
+    """Run a single batch of decoded images through BLIP."""
+    import torch  # noqa: PLC0415 - already imported by load_model()
+
+    processor, model = load_model()
+    inputs = processor(images=images, return_tensors="pt")
+    with torch.inference_mode():
+        output = model.generate(**inputs, **GENERATION_KWARGS)
+    return [
+        caption.strip()
+        for caption in processor.batch_decode(output, skip_special_tokens=True)
+    ]
+
+
+def generate_captions(
+    images: list[ImageInput],
+    batch_size: int = CAPTION_BATCH_SIZE,
+) -> list[str]:
+    """Generate one caption per image, running BLIP in batches.
+
+    The persistent caption cache is consulted first and only misses reach the
+    model. Images that cannot be decoded, and every image in a batch that
+    fails inside the model, get the ``NO_DESCRIPTION`` placeholder so the
+    output always lines up with the input.
+    """
+    captions = [NO_DESCRIPTION] * len(images)
+    for start in range(0, len(images), max(batch_size, 1)):
+        positions, decoded = [], []
+        for position in range(start, min(start + batch_size, len(images))):
+            try:
+                decoded.append(load_image(images[position]))
+                positions.append(position)
+            except OSError as e:
+                logger.error(f"Error loading {images[position]}: {e}")
+
+        keys = [caption_cache_key(image) for image in decoded]
+        misses = []
+        for index, cached in enumerate(lookup_cached_captions(keys)):
+            if cached is None:
+                misses.append(index)
+            else:
+                captions[positions[index]] = cached
+        if not misses:
+            continue
+        try:
+            batch_captions = caption_batch([decoded[index] for index in misses])
+        except (AttributeError, KeyError, RuntimeError) as e:
+            logger.error(f"Error captioning batch starting at {start}: {e}")
+            continue
+        store_cached_captions([keys[index] for index in misses], batch_captions)
+        for index, caption in zip(misses, batch_captions, strict=True):
+            captions[positions[index]] = caption
+    return captions
+
+
+def generate_caption(image_path: ImageInput) -> str:
+    """Generate an image caption using the BLIP model."""
+    caption = generate_captions([image_path], batch_size=1)[0]
+    logger.info(f"Generated caption for {image_path}: {caption}")
+    return caption
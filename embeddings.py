@@ -0,0 +1,86 @@
+"""CLIP image and text embeddings for semantic search.
+
+Image and text towers are loaded separately and lazily: the indexer only
+needs the vision tower, and the API servers only load the much smaller text
+tower, on their first semantic query.
+"""
+
+from __future__ import annotations
+
+import threading
+from functools import lru_cache
+from typing import TYPE_CHECKING
+
+import numpy as np
+from loguru import logger
+
+from settings import get_section
+
+if TYPE_CHECKING:
+    from PIL import Image
+
+SEMANTIC_CONFIG = get_section("semantic")
+SEMANTIC_ENABLED = SEMANTIC_CONFIG.get("enabled", True)
+EMBEDDING_MODEL = SEMANTIC_CONFIG.get("model", "openai/clip-vit-base-patch32")
+EMBEDDING_BATCH_SIZE = SEMANTIC_CONFIG.get("batch_size", 16)
+TEXT_CACHE_SIZE = 4096  # Distinct query strings whose embeddings are kept
+
+_lock = threading.Lock()
+_towers: dict[str, tuple] = {}
+
+
+def _load_tower(kind: str) -> tuple:
+    """Load and memoise the ``"vision"`` or ``"text"`` tower with its processor."""
+    with _lock:
+        if kind not in _towers:
+            # Imported here so that keyword-only processes never load torch
+            from transformers import (  # noqa: PLC0415
+                AutoTokenizer,
+                CLIPImageProcessor,
+                CLIPTextModelWithProjection,
+                CLIPVisionModelWithProjection,
+            )
+
+            logger.info(f"Loading {EMBEDDING_MODEL} {kind} tower...")
+            if kind == "vision":
+                model = CLIPVisionModelWithProjection.from_pretrained(EMBEDDING_MODEL)
+                processor = CLIPImageProcessor.from_pretrained(EMBEDDING_MODEL)
+            else:
+                model = CLIPTextModelWithProjection.from_pretrained(EMBEDDING_MODEL)
+                processor = AutoTokenizer.from_pretrained(EMBEDDING_MODEL)
+            _towers[kind] = (processor, model.eval())
+            logger.info(f"{EMBEDDING_MODEL} {kind} tower loaded successfully!")
+    return _towers[kind]
+
+
+def normalize(vectors: np.ndarray) -> np.ndarray:
+    """L2-normalise rows so that dot products are cosine similarities."""
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+def embed_images(
+    images: list[Image.Image], batch_size: int = EMBEDDING_BATCH_SIZE,
+) -> np.ndarray:
+    """Return an ``(n, d)`` float32 matrix of normalised image embeddings."""
+    import torch  # noqa: PLC0415 - already imported by _load_tower()
+
+    processor, model = _load_tower("vision")
+    batches = []
+    for start in range(0, len(images), max(batch_size, 1)):
+        inputs = processor(images=images[start:start + batch_size], return_tensors="pt")
+        with torch.inference_mode():
+            batches.append(model(**inputs).image_embeds.numpy())
+    return normalize(np.concatenate(batches).astype(np.float32))
+
+
+@lru_cache(maxsize=TEXT_CACHE_SIZE)
+def embed_text(text: str) -> np.ndarray:
+    """Return the normalised embedding of a query string."""
+    import torch  # noqa: PLC0415 - already imported by _load_tower()
+
+    tokenizer, model = _load_tower("text")
+    inputs = tokenizer([text], padding=True, truncation=True, return_tensors="pt")
+    with torch.inference_mode():
+        vector = model(**inputs).text_embeds.numpy()[0]
+    return normalize(vector.astype(np.float32))
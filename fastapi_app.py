@@ -1,15 +1,37 @@
 """FastAPI application for handling search queries."""
 
 import json
+from collections.abc import AsyncIterator
+from contextlib import asynccontextmanager
 from pathlib import Path
 from typing import Annotated
 
 import uvicorn
-from fastapi import FastAPI, HTTPException, Query
+from fastapi import Depends, FastAPI, Header, HTTPException, Query, Response
+from fastapi.responses import PlainTextResponse
 from loguru import logger
 
-from main import search_with_filters
-from validators import SearchResponse, SearchResult
+from main import (
+    indexed_analyzer,
+    result_cache,
+    search_batch,
+    search_with_filters,
+)
+from metrics import RequestMetricsMiddleware, render, time_stage
+from profiling import admin_denial, profiler
+from query_log import record_search
+from ranking import ScoredHit
+from search_executor import RETRY_AFTER_SECONDS, SearchQueueFullError, search_executor
+from settings import serving_workers
+from text_analysis import warm_up
+from validators import (
+    BatchSearchRequest,
+    BatchSearchResponse,
+    ProfilerSettings,
+    SearchRequest,
+    SearchResponse,
+    SearchResult,
+)
 
 # Load configuration
 CONFIG_PATH = Path("config/config.json")  # Change to .toml if needed
@@ -24,28 +46,93 @@ except json.JSONDecodeError as error:
     error_message = "Failed to parse configuration file"
     raise RuntimeError(error_message) from error
 
+
+@asynccontextmanager
+async def lifespan(_app: FastAPI) -> AsyncIterator[None]:
+    """Load the query analyzer in the background once the worker starts.
+
+    It is then checked against the index's, and a mismatch is logged.
+    """
+    warm_up(indexed_analyzer())
+    yield
+
+
 # Initialize FastAPI
-app = FastAPI(debug=CONFIG.get("fastapi", {}).get("debug", False))
+app = FastAPI(debug=CONFIG.get("fastapi", {}).get("debug", False), lifespan=lifespan)
+app.add_middleware(RequestMetricsMiddleware)
+
+
+def format_results(
+    results: list[ScoredHit], *, explain: bool = False,
+) -> SearchResponse:
+    """Convert search hits into the response model."""
+    with time_stage("serialize"):
+        return SearchResponse(results=[
+            SearchResult(
+                file_path=path,
+                description=desc,
+                scores=scores if explain else None,
+                offset_seconds=offsets[0] if offsets else None,
+                offsets=offsets or None,
+            )
+            for path, desc, scores, offsets in results
+        ])
+
 @app.get("/health")
 async def health_check() -> dict[str, str]:
     """Perform a health check."""
     return {"status": "ok"}
+@app.get("/metrics")
+async def prometheus_metrics() -> Response:
+    """Expose request, search stage, cache and indexing metrics to Prometheus."""
+    payload, content_type = render()
+    return Response(content=payload, media_type=content_type)
+@app.get("/cache/stats")
+async def cache_stats() -> dict[str, float]:
+    """Report search result cache hit ratio, size and evictions."""
+    return result_cache.stats()
+
+
+def queue_full_error(error: SearchQueueFullError) -> HTTPException:
+    """Build the 503 returned when the search executor sheds load."""
+    logger.warning(f"Rejecting search: {error}")
+    return HTTPException(
+        status_code=503,
+        detail=str(error),
+        headers={"Retry-After": str(RETRY_AFTER_SECONDS)},
+    )
 @app.get("/search")
-async def search(
-    query: Annotated[str, Query(...)],
-    file_type: Annotated[str, Query(...)],
-) -> SearchResponse:
-    """Handle search requests with query parameters."""
-    logger.info(f"Received search request: query='{query}', file_type='{file_type}'")
-    try:
-        # Fetch results from the search function
-        results = search_with_filters(query, file_type)
+async def search(request: Annotated[SearchRequest, Query()]) -> SearchResponse:
+    """Handle search requests with query parameters.
 
-        formatted_results = [
-            SearchResult(file_path=path, description=desc) for path, desc in results
-        ]
+    Set ``explain`` to include each result's score breakdown, and
+    ``start_date``/``end_date`` (ISO 8601) to filter by media date.
+    """
+    logger.info(
+        f"Received search request: query='{request.query}', "
+        f"file_type='{request.file_type}', mode='{request.mode}'",
+    )
+    record_search(
+        request.query,
+        request.file_type,
+        request.mode,
+        request.start_date,
+        request.end_date,
+    )
+    try:
+        # Run the blocking search on the bounded executor, off the event loop
+        results = await search_executor.run(
+            search_with_filters,
+            request.query,
+            request.file_type,
+            request.start_date,
+            request.end_date,
+            mode=request.mode,
+        )
+        return format_results(results, explain=request.explain)
 
-        return SearchResponse(results=formatted_results)
+    except SearchQueueFullError as error:
+        raise queue_full_error(error) from error
 
     except ValueError as error:
         logger.error("Search failed due to invalid input: %s", error)
@@ -55,5 +142,83 @@ async def search(
         logger.error("Error during search: %s", error)
         raise HTTPException(status_code=500, detail="Internal server error") from error
 
+@app.post("/search/batch")
+async def search_batch_endpoint(batch: BatchSearchRequest) -> BatchSearchResponse:
+    """Handle many searches in one request, answering in request order.
+
+    The whole batch runs as one task on the search executor, so it uses one
+    worker thread and therefore one searcher.
+    """
+    logger.info(f"Received batch search request with {len(batch.requests)} queries")
+    for request in batch.requests:
+        record_search(
+            request.query,
+            request.file_type,
+            request.mode,
+            request.start_date,
+            request.end_date,
+        )
+    try:
+        results = await search_executor.run(
+            search_batch,
+            [request.model_dump(exclude={"explain"}) for request in batch.requests],
+        )
+        return BatchSearchResponse(responses=[
+            format_results(hits, explain=request.explain)
+            for request, hits in zip(batch.requests, results, strict=True)
+        ])
+
+    except SearchQueueFullError as error:
+        raise queue_full_error(error) from error
+
+    except ValueError as error:
+        logger.error("Batch search failed due to invalid input: %s", error)
+        raise HTTPException(status_code=400, detail=str(error)) from error
+
+    except Exception as error:
+        logger.error("Error during batch search: %s", error)
+        raise HTTPException(status_code=500, detail="Internal server error") from error
+
+
+def require_admin_token(
+    x_admin_token: Annotated[str | None, Header()] = None,
+) -> None:
+    """Reject admin calls without the configured ``X-Admin-Token``."""
+    denial = admin_denial(x_admin_token)
+    if denial is not None:
+        raise HTTPException(status_code=403, detail=denial)
+
+
+@app.get("/admin/profiler", dependencies=[Depends(require_admin_token)])
+async def profiler_status() -> dict:
+    """Report whether slow requests are profiled and list the saved traces."""
+    return profiler.describe()
+
+
+@app.post("/admin/profiler", dependencies=[Depends(require_admin_token)])
+async def configure_profiler(settings: ProfilerSettings) -> dict:
+    """Switch the slow-request profiler or change its thresholds.
+
+    The change reaches every worker within a second.
+    """
+    profiler.configure(**settings.model_dump())
+    return profiler.describe()
+
+
+@app.get(
+    "/admin/profiler/profiles/{name}",
+    dependencies=[Depends(require_admin_token)],
+    response_class=PlainTextResponse,
+)
+async def profiler_trace(name: str) -> str:
+    """Return one saved trace as collapsed stacks, e.g. for flamegraph.pl."""
+    trace = profiler.read_profile(name)
+    if trace is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return trace
+
 if __name__ == "__main__":
-    uvicorn.run(app, host="127.0.0.1", port=8000)
+    # Workers need the import string so that each process builds its own app
+    uvicorn.run(
+        "fastapi_app:app", host="127.0.0.1", port=8000, workers=serving_workers(),
+    )
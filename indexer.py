@@ -0,0 +1,563 @@
+"""Indexing entry point: caption images and videos into the Whoosh index.
+
+Run ``python indexer.py`` (or ``just index``) before starting the API
+servers. Only this module loads the captioning model, and only when there is
+something new to caption.
+"""
+
+from __future__ import annotations
+
+import argparse
+import hashlib
+import json
+import shutil
+import subprocess
+import time
+from datetime import datetime, timezone
+from enum import Enum
+from functools import partial
+from pathlib import Path
+from typing import TYPE_CHECKING
+
+import ffmpeg
+from loguru import logger
+from PIL import Image
+from PIL.ExifTags import TAGS
+from whoosh import index
+from whoosh.reading import SegmentReader
+from whoosh.util.filelock import FileLock
+
+from captioning import NO_DESCRIPTION, generate_captions, load_image
+from embeddings import SEMANTIC_ENABLED, embed_images
+from main import (
+    IMAGE_FOLDER,
+    INDEX_FOLDER,
+    INDEXER_LOCK_PATH,
+    MANIFEST_PATH,
+    VIDEO_FOLDER,
+    schema,
+    searcher_manager,
+)
+from metrics import INDEXING_COMMIT_SECONDS
+from pipeline import IndexingPipeline, PreparedItem
+from settings import get_section
+from text_analysis import analyzer_backend
+from thumbnails import PREGENERATE_THUMBNAILS, thumbnail_cache
+from vector_store import VectorStoreWriter, read_current
+from video_frames import (
+    FrameSampling,
+    FrameSamplingReport,
+    probe_video,
+    sample_distinct_frames,
+)
+
+if TYPE_CHECKING:
+    from collections.abc import Iterable
+
+    from whoosh.writing import SegmentWriter
+
+VIDEO_CONFIG = get_section("video")
+# Extract a candidate frame every few seconds for video captions
+FRAME_SAMPLE_RATE = VIDEO_CONFIG.get("frame_sample_rate", 3)
+# dHash bits (out of 64) a frame must differ by to be captioned
+SCENE_CHANGE_THRESHOLD = VIDEO_CONFIG.get("scene_change_threshold", 10)
+# Longest edge of decoded frames: BLIP's 384 px input, above the 320 px thumbnail
+FRAME_MAX_EDGE = VIDEO_CONFIG.get("frame_max_edge", 384)
+# Distinct frames kept per video, bounding the memory one video can hold
+MAX_VIDEO_FRAMES = VIDEO_CONFIG.get("max_frames", 100)
+FRAME_SAMPLING = FrameSampling(
+    FRAME_SAMPLE_RATE, SCENE_CHANGE_THRESHOLD, FRAME_MAX_EDGE, MAX_VIDEO_FRAMES,
+)
+MANIFEST_VERSION = 5  # Bump whenever the schema changes to force a full rebuild
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg")
+VIDEO_EXTENSIONS = (".mp4", ".avi", ".mov")
+HASH_CHUNK_SIZE = 1024 * 1024
+# Segments holding at least this share of all documents are left alone by
+# merge_segments; everything smaller is merged into one new segment
+LARGE_SEGMENT_SHARE = 0.1
+
+
+def extract_timestamp_from_image(image_path: str) -> datetime | None:
+    """Extract timestamp from image EXIF data."""
+    try:
+        image = Image.open(image_path)
+        exif_data = image.getexif()
+        if exif_data is not None:
+            for tag, value in exif_data.items():
+                if TAGS.get(tag) == "DateTime":
+                    return datetime.strptime(
+                        value, "%Y:%m:%d %H:%M:%S",
+                    ).replace(tzinfo=timezone.utc)
+    except (AttributeError, KeyError) as e:
+        logger.error(f"Error extracting EXIF data from image {image_path}: {e}")
+    return None
+
+def creation_time_from_metadata(metadata: dict) -> str | None:
+    """Return the first stream creation time found in ffprobe metadata."""
+    for stream in metadata.get("streams", []):
+        creation_time = stream.get("tags", {}).get("creation_time")
+        if creation_time:
+            return creation_time
+    return None
+
+
+def extract_timestamp_from_video(
+    video_path: str, metadata: dict | None = None,
+) -> str | None:
+    """Extract timestamp from video metadata using ffmpeg-python.
+
+    Pass already probed ``metadata`` to avoid a second ffprobe call.
+    """
+    if metadata is not None:
+        return creation_time_from_metadata(metadata)
+    try:
+        # Ensure the video path is valid and exists
+        video_path_obj = Path(video_path)
+        if not video_path_obj.exists():
+            logger.error("Video file not found: %s", video_path)
+            return None
+
+        # Convert to absolute path
+        video_path = str(video_path_obj.resolve())
+
+        # Use ffmpeg.probe to extract metadata
+        return creation_time_from_metadata(probe_video(video_path))
+
+    except ffmpeg.Error:
+        logger.error("FFmpeg error while extracting timestamp")
+    except FileNotFoundError:
+        logger.error("File disappeared before processing: %s", video_path)
+    return None
+
+
+def extract_video_frames(
+    video_path: str | Path, metadata: dict | None = None,
+) -> tuple[list[tuple[float, Image.Image]], FrameSamplingReport]:
+    """Sample distinct frames every ``FRAME_SAMPLE_RATE`` seconds from a video.
+
+    Returns ``(offset_seconds, frame)`` pairs. Candidates that look like the
+    previously kept frame are dropped before they reach the captioner.
+    """
+    frames, report = sample_distinct_frames(video_path, FRAME_SAMPLING, metadata)
+    logger.debug(
+        f"Sampled {report.sampled} frames from {video_path}, "
+        f"captioning {report.kept} ({report.skipped} near-duplicates skipped)",
+    )
+    return frames, report
+
+
+def extract_video_caption(video_path: str | Path) -> str:
+    """Extract frames from a video and generate an overall description.
+
+    The index stores one document per frame instead; this merged caption is
+    only a convenience for callers that want a single summary.
+    """
+    frames, _ = extract_video_frames(video_path)
+    images = [frame for _, frame in frames]
+    descriptions = list(dict.fromkeys(generate_captions(images))) if images else []
+    return " ".join(descriptions) if descriptions else NO_DESCRIPTION
+
+
+def parse_video_timestamp(timestamp: str | None) -> datetime:
+    """Convert the raw video creation time to a datetime, defaulting to now."""
+    if isinstance(timestamp, str) and timestamp != "Unknown":
+        try:
+            return datetime.strptime(
+                timestamp, "%Y:%m:%d %H:%M:%S").replace(tzinfo=timezone.utc)
+        except ValueError:
+            pass
+    return datetime.now(timezone.utc)
+
+
+def store_thumbnail(file_path: Path, media_type: str, image: Image.Image) -> None:
+    """Render the result-page thumbnail from an image decoded for captioning."""
+    try:
+        thumbnail_cache.get(file_path, media_type, image)
+    except OSError as e:
+        logger.warning(f"Could not store a thumbnail for {file_path}: {e}")
+
+
+def prepare_media(
+    file_path: Path, frame_reports: list[FrameSamplingReport] | None = None,
+) -> PreparedItem:
+    """Decode a media file and read its timestamp for the indexing pipeline.
+
+    Video frame sampling reports are appended to ``frame_reports`` if given.
+    The thumbnail (or video poster) is rendered from the decoded pixels
+    while they are in memory.
+    """
+    offsets = []
+    if file_path.suffix.lower() in IMAGE_EXTENSIONS:
+        media_type = "image"
+        images = [load_image(file_path)]
+        timestamp = extract_timestamp_from_image(file_path)
+        date = timestamp or datetime.now(timezone.utc)
+    else:
+        media_type = "video"
+        metadata = probe_video(file_path)
+        frames, report = extract_video_frames(file_path, metadata)
+        offsets = [offset for offset, _ in frames]
+        images = [frame for _, frame in frames]
+        if frame_reports is not None:
+            frame_reports.append(report)
+        date = parse_video_timestamp(
+            extract_timestamp_from_video(file_path, metadata),
+        )
+    if PREGENERATE_THUMBNAILS and images:
+        store_thumbnail(file_path, media_type, images[0])
+    return PreparedItem(
+        fields={
+            "file_path": str(file_path),  # Convert Path to string
+            "media_type": media_type,
+            "date": date,
+        },
+        images=images,
+        offsets=offsets,
+    )
+
+
+def compute_file_hash(file_path: str | Path) -> str:
+    """Return the SHA-256 hex digest of a file's contents."""
+    digest = hashlib.sha256()
+    with Path(file_path).open("rb") as handle:
+        for chunk in iter(lambda: handle.read(HASH_CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def load_manifest() -> dict[str, dict]:
+    """Load the indexing manifest, or return an empty one if it is unusable."""
+    try:
+        with MANIFEST_PATH.open("r", encoding="utf-8") as manifest_file:
+            manifest = json.load(manifest_file)
+    except (OSError, json.JSONDecodeError):
+        return {}
+    if (
+        manifest.get("version") != MANIFEST_VERSION
+        or manifest.get("semantic") != SEMANTIC_ENABLED
+        or manifest.get("analyzer") != analyzer_backend()
+        or (SEMANTIC_ENABLED and read_current() is None)
+    ):
+        return {}
+    return manifest.get("files", {})
+
+
+def save_manifest(files: dict[str, dict]) -> None:
+    """Atomically write the indexing manifest next to the Whoosh index."""
+    tmp_path = MANIFEST_PATH.with_suffix(".tmp")
+    with tmp_path.open("w", encoding="utf-8") as manifest_file:
+        json.dump(
+            {
+                "version": MANIFEST_VERSION,
+                "semantic": SEMANTIC_ENABLED,
+                "analyzer": analyzer_backend(),
+                "files": files,
+            },
+            manifest_file,
+        )
+    tmp_path.replace(MANIFEST_PATH)
+
+
+def scan_media_files() -> dict[str, Path]:
+    """Return every indexable image and video keyed by its indexed file path."""
+    media_files = {}
+    for folder, extensions in (
+        (IMAGE_FOLDER, IMAGE_EXTENSIONS),
+        (VIDEO_FOLDER, VIDEO_EXTENSIONS),
+    ):
+        for file_path in Path(folder).iterdir():
+            if file_path.name.lower().endswith(extensions):
+                media_files[str(file_path)] = file_path
+    return media_files
+
+
+def log_frame_reports(frame_reports: list[FrameSamplingReport]) -> None:
+    """Log frames sampled versus captioned for each video and overall."""
+    if not frame_reports:
+        return
+    for report in sorted(frame_reports, key=lambda report: report.video_path):
+        logger.info(
+            f"Frames for {report.video_path}: {report.sampled} sampled, "
+            f"{report.kept} captioned",
+        )
+    sampled = sum(report.sampled for report in frame_reports)
+    kept = sum(report.kept for report in frame_reports)
+    logger.info(
+        f"Video frames: {sampled} sampled, {kept} captioned, "
+        f"{sampled - kept} skipped across {len(frame_reports)} videos",
+    )
+
+
+def diff_against_manifest(
+    manifest: dict[str, dict], media_files: dict[str, Path],
+) -> tuple[dict[str, dict], list[Path]]:
+    """Return fresh manifest entries for ``media_files`` and those to index.
+
+    Files whose size and mtime match their manifest entry keep it without
+    being read. Otherwise the file is hashed; it only needs indexing if the
+    hash changed too.
+    """
+    entries = {}
+    pending = []
+    for path_key, file_path in media_files.items():
+        stat = file_path.stat()
+        entry = manifest.get(path_key)
+        if (
+            entry
+            and entry["size"] == stat.st_size
+            and entry["mtime_ns"] == stat.st_mtime_ns
+        ):
+            entries[path_key] = entry
+            continue
+
+        content_hash = compute_file_hash(file_path)
+        thumbnail_cache.remember_digest(file_path, content_hash)
+        entries[path_key] = {
+            "size": stat.st_size,
+            "mtime_ns": stat.st_mtime_ns,
+            "sha256": content_hash,
+        }
+        if entry and entry["sha256"] == content_hash:
+            continue
+        pending.append(file_path)
+    return entries, pending
+
+
+def run_pipeline(
+    ix: index.Index,
+    pending: list[Path],
+    deleted: list[str],
+    *,
+    rebuild: bool = False,
+    merge: bool = True,
+) -> list[str]:
+    """Index ``pending``, remove ``deleted`` and return the files that failed.
+
+    ``merge=False`` commits a new segment without merging small ones, which
+    keeps frequent small commits cheap; see ``merge_segments``.
+    """
+    if not pending and not deleted:
+        return []
+    frame_reports: list[FrameSamplingReport] = []
+    failed = IndexingPipeline(
+        partial(prepare_media, frame_reports=frame_reports),
+        embed=embed_images if SEMANTIC_ENABLED else None,
+    ).run(
+        ix,
+        pending,
+        deleted,
+        VectorStoreWriter(fresh=rebuild) if SEMANTIC_ENABLED else None,
+        merge=merge,
+    )
+    log_frame_reports(frame_reports)
+    return failed
+
+
+def index_data(*, full_rebuild: bool = False) -> None:
+    """Index images and videos, re-captioning only new or changed files.
+
+    A manifest of path, size, mtime and content hash is kept beside the
+    index. Files whose size and mtime are unchanged are skipped without being
+    read; files whose metadata changed but whose hash did not are only
+    re-stamped in the manifest. Files that disappeared are removed from the
+    index. Pass ``full_rebuild=True`` to wipe the index and start over.
+    Pending files go through the staged ``IndexingPipeline``, which also
+    publishes image embeddings to the vector store when semantic search is
+    enabled.
+
+    Only one process may index at a time. If another holds the indexer
+    lock, this call logs that and returns without touching anything.
+    """
+    lock = FileLock(INDEXER_LOCK_PATH)
+    if not lock.acquire(blocking=False):
+        logger.warning(
+            f"Another indexer holds {INDEXER_LOCK_PATH}, skipping this run",
+        )
+        return
+    try:
+        _index_locked(full_rebuild=full_rebuild)
+    finally:
+        lock.release()
+
+
+def _index_locked(*, full_rebuild: bool) -> bool:
+    """Body of ``index_data``; the caller holds the indexer lock.
+
+    Returns ``False`` if the run failed with an I/O error.
+    """
+    try:
+        manifest = {} if full_rebuild else load_manifest()
+        rebuild = not manifest or not index.exists_in(INDEX_FOLDER)
+        if rebuild:
+            if Path(INDEX_FOLDER).exists():
+                shutil.rmtree(INDEX_FOLDER)
+            Path(INDEX_FOLDER).mkdir(parents=True, exist_ok=True)
+            index.create_in(INDEX_FOLDER, schema)
+            manifest = {}
+            logger.info("Rebuilding index from scratch")
+
+        ix = index.open_dir(INDEX_FOLDER)
+        media_files = scan_media_files()
+        updated_manifest, pending = diff_against_manifest(manifest, media_files)
+        deleted = [path for path in manifest if path not in media_files]
+        failed = run_pipeline(ix, pending, deleted, rebuild=rebuild)
+        for path_key in failed:
+            updated_manifest.pop(path_key)  # Retry on the next run
+        save_manifest(updated_manifest)
+        searcher_manager.force_refresh()
+        logger.info(
+            f"Indexing complete! {len(pending)} indexed, {len(deleted)} removed, "
+            f"{len(media_files) - len(pending)} unchanged",
+        )
+    except (subprocess.CalledProcessError, OSError) as e:
+        logger.error(f"Error indexing data: {e}")
+        return False
+    return True
+
+
+def media_path_key(path: str | Path) -> str | None:
+    """Return the manifest key of an indexable file path, or ``None``.
+
+    Only files directly inside ``IMAGE_FOLDER`` or ``VIDEO_FOLDER`` with a
+    supported extension are indexable, matching ``scan_media_files``.
+    """
+    path = Path(path)
+    for folder, extensions in (
+        (IMAGE_FOLDER, IMAGE_EXTENSIONS),
+        (VIDEO_FOLDER, VIDEO_EXTENSIONS),
+    ):
+        if (
+            path.name.lower().endswith(extensions)
+            and path.parent.resolve() == Path(folder).resolve()
+        ):
+            return str(Path(folder) / path.name)
+    return None
+
+
+class IngestResult(Enum):
+    """Outcome of one ``index_changes`` batch."""
+
+    INDEXED = "indexed"
+    LOCKED = "locked"  # Another indexer holds the lock; nothing was touched
+    FAILED = "failed"  # Nothing was committed; the batch can be retried
+
+
+def index_changes(
+    paths: Iterable[str], *, merge: bool = False,
+) -> IngestResult:
+    """Index, re-index or remove just ``paths`` and commit one new segment.
+
+    Used for continuous ingestion: existing files are diffed against the
+    manifest like in ``index_data``, and paths that no longer exist are
+    removed. The commit skips merging unless ``merge`` is set, so a stream
+    of small batches stays cheap; ``merge_segments`` compacts them later.
+    Returns ``LOCKED``, leaving everything untouched, if another indexer
+    holds the lock, and ``FAILED`` if the batch hit an I/O error, so the
+    caller can retry either way.
+    """
+    lock = FileLock(INDEXER_LOCK_PATH)
+    if not lock.acquire(blocking=False):
+        return IngestResult.LOCKED
+    try:
+        manifest = load_manifest()
+        if not manifest or not index.exists_in(INDEX_FOLDER):
+            # Nothing to diff against yet
+            if _index_locked(full_rebuild=False):
+                return IngestResult.INDEXED
+            return IngestResult.FAILED
+        path_keys = {key for path in paths if (key := media_path_key(path))}
+        present = {
+            key: Path(key) for key in path_keys if Path(key).is_file()
+        }
+        deleted = [key for key in path_keys - present.keys() if key in manifest]
+        updated, pending = diff_against_manifest(manifest, present)
+        failed = run_pipeline(
+            index.open_dir(INDEX_FOLDER), pending, deleted, merge=merge,
+        )
+        manifest.update(updated)
+        for path_key in (*deleted, *failed):
+            manifest.pop(path_key, None)
+        save_manifest(manifest)
+        if pending or deleted:
+            logger.info(
+                f"Ingested {len(pending) - len(failed)} files, "
+                f"removed {len(deleted)}, {len(failed)} failed",
+            )
+    except (subprocess.CalledProcessError, OSError) as e:
+        logger.error(f"Error indexing changes: {e}")
+        return IngestResult.FAILED
+    finally:
+        lock.release()
+    return IngestResult.INDEXED
+
+
+def merge_small_segments(writer: SegmentWriter, segments: list) -> list:
+    """Whoosh merge policy: fold every small segment into the new one.
+
+    Whoosh's own ``MERGE_SMALL`` merges at most about five segments per
+    commit, which cannot keep up with a stream of one-file commits. This
+    merges every segment under ``LARGE_SEGMENT_SHARE`` of the documents, so
+    the large segments are not rewritten and the small ones collapse at once.
+    """
+    total = sum(segment.doc_count_all() for segment in segments)
+    large = [
+        segment for segment in segments
+        if segment.doc_count_all() >= total * LARGE_SEGMENT_SHARE
+    ]
+    small = [segment for segment in segments if segment not in large]
+    if len(small) <= 1:  # Nothing to gain from rewriting a single segment
+        return segments
+    for segment in small:
+        reader = SegmentReader(writer.storage, writer.schema, segment)
+        writer.add_reader(reader)
+        reader.close()
+    return large
+
+
+def merge_segments(max_segments: int) -> bool:
+    """Merge small index segments once there are more than ``max_segments``.
+
+    Only the small segments left behind by frequent commits are rewritten,
+    see ``merge_small_segments``. Returns ``False`` if another indexer holds
+    the lock.
+    """
+    lock = FileLock(INDEXER_LOCK_PATH)
+    if not lock.acquire(blocking=False):
+        return False
+    try:
+        if not index.exists_in(INDEX_FOLDER):
+            return True
+        ix = index.open_dir(INDEX_FOLDER)
+        with ix.reader() as reader:
+            segments = len(reader.leaf_readers())
+        if segments > max_segments:
+            start = time.perf_counter()
+            ix.writer().commit(mergetype=merge_small_segments)
+            INDEXING_COMMIT_SECONDS.labels("merge").observe(
+                time.perf_counter() - start,
+            )
+            with ix.reader() as reader:
+                merged = len(reader.leaf_readers())
+            logger.info(
+                f"Merged index segments {segments} -> {merged} "
+                f"in {time.perf_counter() - start:.2f}s",
+            )
+    finally:
+        lock.release()
+    return True
+
+
+def main() -> None:
+    """Parse command-line arguments and run indexing once."""
+    parser = argparse.ArgumentParser(description="Index images and videos.")
+    parser.add_argument(
+        "--full-rebuild",
+        action="store_true",
+        help="wipe the index and caption every file again",
+    )
+    args = parser.parse_args()
+    index_data(full_rebuild=args.full_rebuild)
+
+
+if __name__ == "__main__":
+    main()
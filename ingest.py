@@ -0,0 +1,312 @@
+"""Continuous ingestion: watch the media folders and index changes as they land.
+
+Run ``python ingest.py`` (or ``just watch``) next to the API servers instead
+of re-running the indexer by hand. It indexes anything that changed while
+it was down, then watches ``IMAGE_FOLDER`` and ``VIDEO_FOLDER``:
+
+- File events come from inotify (through the optional ``watchdog`` package)
+  or, without it, from polling the folders every ``poll_interval`` seconds.
+- Events are debounced. A path is only indexed once it has been quiet for
+  ``debounce`` seconds, so a file being copied is indexed once, complete.
+- Quiet paths are indexed together through ``indexer.index_changes``, which
+  captions them in batches and commits one small segment per batch without
+  merging. API workers pick the commit up within ``[search]
+  refresh_interval`` seconds.
+- With semantic search enabled, each commit also rewrites the whole vector
+  store, so commits are at least ``commit_interval`` seconds apart unless a
+  full ``max_batch`` of changes is waiting. After a quiet spell the first
+  change is indexed straight away.
+- A batch that fails is put back and retried after ``retry_backoff``
+  seconds, doubling after each further failure up to ``max_retry_backoff``.
+- Every ``merge_interval`` seconds, small segments are merged once there are
+  more than ``max_segments``, so query latency does not creep up.
+- With ``[metrics] ingest_port`` set, decode, caption and commit metrics
+  are served for Prometheus on that port.
+
+This process is an indexer: it takes the same lock as ``indexer.py`` for
+every batch and merge, and retries later while another indexer holds it.
+"""
+
+from __future__ import annotations
+
+import argparse
+import importlib.util
+import os
+import threading
+import time
+from pathlib import Path
+
+from loguru import logger
+
+from indexer import IngestResult, index_changes, index_data, merge_segments
+from main import IMAGE_FOLDER, VIDEO_FOLDER
+from metrics import INGEST_METRICS_PORT, serve
+from settings import get_section
+
+INGEST_CONFIG = get_section("ingest")
+POLL_INTERVAL = INGEST_CONFIG.get("poll_interval", 2.0)  # Seconds between scans
+DEBOUNCE_SECONDS = INGEST_CONFIG.get("debounce", 2.0)  # Quiet time before indexing
+# A path that keeps changing is indexed anyway after this many seconds
+MAX_DELAY_SECONDS = INGEST_CONFIG.get("max_delay", 30.0)
+MAX_BATCH_FILES = INGEST_CONFIG.get("max_batch", 256)  # Files per commit
+# Every commit rewrites the whole vector store, so while changes keep arriving
+# commits are spaced at least this many seconds apart
+COMMIT_INTERVAL = INGEST_CONFIG.get("commit_interval", 10.0)
+MERGE_INTERVAL = INGEST_CONFIG.get("merge_interval", 300.0)  # Seconds
+# Seconds before retrying a failed batch, doubled after each further failure
+RETRY_BACKOFF_SECONDS = INGEST_CONFIG.get("retry_backoff", 5.0)
+MAX_RETRY_BACKOFF_SECONDS = INGEST_CONFIG.get("max_retry_backoff", 300.0)
+MAX_SEGMENTS = INGEST_CONFIG.get("max_segments", 8)
+# inotify needs the optional watchdog package; polling is used without it
+USE_INOTIFY = INGEST_CONFIG.get("inotify", True) and (
+    importlib.util.find_spec("watchdog") is not None
+)
+TICK_SECONDS = 0.5  # How often the service loop checks for due work
+WATCHED_FOLDERS = (IMAGE_FOLDER, VIDEO_FOLDER)
+
+
+class ChangeQueue:
+    """Debounce file events into batches of paths that have settled."""
+
+    def __init__(
+        self,
+        debounce: float = DEBOUNCE_SECONDS,
+        max_delay: float = MAX_DELAY_SECONDS,
+    ) -> None:
+        """Initialize an empty queue."""
+        self.debounce = debounce
+        self.max_delay = max_delay
+        self._lock = threading.Lock()
+        # path -> (first event, latest event), monotonic seconds
+        self._pending: dict[str, tuple[float, float]] = {}
+
+    def __len__(self) -> int:
+        """Return how many paths are waiting."""
+        return len(self._pending)
+
+    def add(self, path: str) -> None:
+        """Record an event for ``path``, restarting its quiet period."""
+        now = time.monotonic()
+        with self._lock:
+            first, _ = self._pending.get(path, (now, now))
+            self._pending[path] = (first, now)
+
+    def take_ready(self, limit: int = MAX_BATCH_FILES) -> list[str]:
+        """Remove and return up to ``limit`` paths that are due for indexing."""
+        now = time.monotonic()
+        with self._lock:
+            ready = [
+                path for path, (first, latest) in self._pending.items()
+                if now - latest >= self.debounce or now - first >= self.max_delay
+            ][:limit]
+            for path in ready:
+                del self._pending[path]
+        return ready
+
+    def requeue(self, paths: list[str]) -> None:
+        """Put back paths that could not be indexed yet."""
+        for path in paths:
+            self.add(path)
+
+
+class PollingWatcher:
+    """Detect created, modified and deleted files by rescanning folders."""
+
+    def __init__(self, folders: tuple[str, ...], changes: ChangeQueue) -> None:
+        """Take the initial snapshot of ``folders``."""
+        self.folders = folders
+        self.changes = changes
+        self._snapshot = self._scan()
+
+    def _scan(self) -> dict[str, tuple[int, int]]:
+        """Return ``(size, mtime_ns)`` for every file in the watched folders."""
+        snapshot = {}
+        for folder in self.folders:
+            try:
+                entries = list(os.scandir(folder))
+            except FileNotFoundError:
+                continue
+            for entry in entries:
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:  # Deleted mid-scan
+                    continue
+                if entry.is_file():
+                    snapshot[entry.path] = (stat.st_size, stat.st_mtime_ns)
+        return snapshot
+
+    def poll(self) -> None:
+        """Queue every path that appeared, changed or vanished since last poll."""
+        snapshot = self._scan()
+        for path in snapshot.keys() | self._snapshot.keys():
+            if snapshot.get(path) != self._snapshot.get(path):
+                self.changes.add(path)
+        self._snapshot = snapshot
+
+    def start(self) -> None:
+        """Nothing to start; ``poll`` is driven by the service loop."""
+
+    def stop(self) -> None:
+        """Nothing to stop."""
+
+
+class InotifyWatcher:
+    """Queue paths from watchdog's inotify observer as events arrive."""
+
+    def __init__(self, folders: tuple[str, ...], changes: ChangeQueue) -> None:
+        """Register a handler for every folder; events start with ``start``."""
+        # watchdog is optional, so it is only imported when inotify is used
+        from watchdog.events import (  # noqa: PLC0415
+            FileSystemEvent,
+            FileSystemEventHandler,
+        )
+        from watchdog.observers import Observer  # noqa: PLC0415
+
+        class Handler(FileSystemEventHandler):
+            def on_any_event(self, event: FileSystemEvent) -> None:
+                if event.is_directory:
+                    return
+                changes.add(event.src_path)
+                if dest_path := getattr(event, "dest_path", ""):
+                    changes.add(dest_path)  # The target of a move or rename
+
+        self._observer = Observer()
+        for folder in folders:
+            Path(folder).mkdir(parents=True, exist_ok=True)
+            self._observer.schedule(Handler(), folder, recursive=False)
+
+    def poll(self) -> None:
+        """Nothing to do; events are pushed by the observer thread."""
+
+    def start(self) -> None:
+        """Start the observer thread."""
+        self._observer.start()
+
+    def stop(self) -> None:
+        """Stop the observer thread and wait for it."""
+        self._observer.stop()
+        self._observer.join()
+
+
+class IngestionService:
+    """Index debounced file changes and merge segments on a schedule."""
+
+    def __init__(
+        self,
+        folders: tuple[str, ...] = WATCHED_FOLDERS,
+        *,
+        inotify: bool = USE_INOTIFY,
+        commit_interval: float = COMMIT_INTERVAL,
+        merge_interval: float = MERGE_INTERVAL,
+        max_segments: int = MAX_SEGMENTS,
+    ) -> None:
+        """Initialize the service; nothing is watched until ``run``."""
+        self.folders = folders
+        self.changes = ChangeQueue()
+        watcher_class = InotifyWatcher if inotify else PollingWatcher
+        self.watcher = watcher_class(folders, self.changes)
+        self.poll_interval = TICK_SECONDS if inotify else POLL_INTERVAL
+        self.commit_interval = commit_interval
+        self.merge_interval = merge_interval
+        self.max_segments = max_segments
+        self._stop = threading.Event()
+        self._failures = 0  # Consecutive failed batches
+        self._retry_at = 0.0  # Monotonic time before which no batch is tried
+
+    def run(self, *, catch_up: bool = True) -> None:
+        """Watch and index until ``stop`` is called or the process is interrupted.
+
+        With ``catch_up``, a regular incremental ``index_data`` run first
+        indexes whatever changed while the service was down. The watcher is
+        already running by then, so nothing added meanwhile is missed.
+        """
+        logger.info(
+            f"Watching {', '.join(self.folders)} with "
+            f"{type(self.watcher).__name__}",
+        )
+        self.watcher.start()
+        if catch_up:
+            index_data()
+        last_poll = last_merge = time.monotonic()
+        last_commit = -self.commit_interval
+        try:
+            while not self._stop.wait(TICK_SECONDS):
+                now = time.monotonic()
+                if now - last_poll >= self.poll_interval:
+                    self.watcher.poll()
+                    last_poll = now
+                if self._commit_due(now - last_commit) and (
+                    paths := self.changes.take_ready()
+                ) and self._index_batch(paths):
+                    last_commit = now
+                if now - last_merge >= self.merge_interval and not len(self.changes):
+                    merge_segments(self.max_segments)
+                    last_merge = now
+        finally:
+            self.watcher.stop()
+
+    def _commit_due(self, since_commit: float) -> bool:
+        """Whether to index now, ``since_commit`` seconds after the last batch."""
+        if time.monotonic() < self._retry_at:
+            return False
+        return (
+            since_commit >= self.commit_interval
+            or len(self.changes) >= MAX_BATCH_FILES
+        )
+
+    def _index_batch(self, paths: list[str]) -> bool:
+        """Index one batch, putting it back if it was not committed.
+
+        A failed batch, including one that raised, is logged and retried
+        after an exponential back-off so the service keeps running.
+        """
+        try:
+            result = index_changes(paths)
+        except Exception as e:  # noqa: BLE001 - one bad batch must not stop ingestion
+            logger.exception(f"Indexing {len(paths)} changes raised: {e}")
+            result = IngestResult.FAILED
+        if result is IngestResult.INDEXED:
+            self._failures = 0
+            return True
+        self.changes.requeue(paths)
+        if result is IngestResult.LOCKED:
+            logger.info("Another indexer is running, retrying later")
+            return False
+        self._failures += 1
+        delay = min(
+            RETRY_BACKOFF_SECONDS * 2 ** (self._failures - 1),
+            MAX_RETRY_BACKOFF_SECONDS,
+        )
+        self._retry_at = time.monotonic() + delay
+        logger.warning(
+            f"Indexing {len(paths)} changes failed ({self._failures} in a row), "
+            f"retrying in {delay:.0f}s",
+        )
+        return False
+
+    def stop(self) -> None:
+        """Ask ``run`` to return after the current batch."""
+        self._stop.set()
+
+
+def main() -> None:
+    """Parse command-line arguments and run the ingestion service."""
+    parser = argparse.ArgumentParser(description="Continuously index new media.")
+    parser.add_argument(
+        "--poll",
+        action="store_true",
+        help="poll the folders even if inotify is available",
+    )
+    args = parser.parse_args()
+    if INGEST_METRICS_PORT:
+        serve(INGEST_METRICS_PORT)
+        logger.info(f"Serving indexing metrics on port {INGEST_METRICS_PORT}")
+    service = IngestionService(inotify=USE_INOTIFY and not args.poll)
+    try:
+        service.run()
+    except KeyboardInterrupt:
+        logger.info("Ingestion stopped")
+
+
+if __name__ == "__main__":
+    main()
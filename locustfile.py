@@ -1,16 +1,66 @@
-"""Locust load testing script for FastAPI and BentoML services.
+r"""Locust load testing script for FastAPI and BentoML services.
 
 This script automatically detects whether the target service is FastAPI or BentoML
 and adjusts the request type (`GET` for FastAPI, `POST` for BentoML).
+
+Two user classes are defined; pick one by name on the command line:
+
+- ``SearchUser`` is the original closed-loop profile: a fixed set of queries
+  with 1-5 s of think time per simulated user.
+- ``ReplayUser`` replays a JSONL query log, such as the one the APIs record
+  with ``[search] query_log``, open-loop: requests are sent on schedule
+  whether or not earlier ones have finished, so a saturated server shows up
+  as growing latency and dropped requests instead of a politely slower
+  client. ``--replay-mode replay`` keeps the recorded arrival times
+  (scaled by ``--replay-speed``), ``constant`` sends Poisson arrivals at
+  ``--target-rps``, and ``steps`` ramps through ``--rps-steps``, holding each
+  rate for ``--step-duration`` seconds. The last two draw queries from the
+  log at random, keeping its query mix. Requests are named by query class
+  (``keyword:single``, ``hybrid:or+date``...) so Locust's stats and CSV
+  export break latency down per class, and per-class and per-step latency
+  histograms are written to ``--histogram-file`` on exit.
+
+Example, ramping until the server saturates::
+
+    locust -f locustfile.py ReplayUser --headless -u 1 --host http://127.0.0.1:8000 \
+        --query-log logs/queries.jsonl --replay-mode steps --rps-steps 5,10,20,40
 """
 
+import json
+import math
+import random
 import secrets  # Secure random selection
-from typing import ClassVar
+import time
+from collections.abc import Iterator
+from datetime import datetime
+from pathlib import Path
+from typing import Any, ClassVar
 
-from locust import HttpUser, between, task
+import gevent
+from gevent.pool import Pool
+from locust import HttpUser, between, constant, events, task
+from locust.exception import StopUser
+from loguru import logger
+from requests.adapters import HTTPAdapter
 
 # Constants
 HTTP_OK = 200
+# Latency histogram buckets grow by 2**(1/4), from 0.5 ms to about 65 s
+HISTOGRAM_BASE_MS = 0.5
+HISTOGRAM_GROWTH = 2 ** 0.25
+HISTOGRAM_BUCKETS = 68
+
+
+def detect_service(client: Any) -> tuple[bool, str]:  # noqa: ANN401
+    """Return whether searches are POSTed (BentoML) and the health endpoint."""
+    # Try FastAPI health check first
+    response = client.get("/health")
+    if response.status_code == HTTP_OK:
+        return False, "/health"  # FastAPI uses GET for search
+    # If FastAPI check fails, assume BentoML and check /healthz. If both
+    # fail, still assume BentoML
+    client.get("/healthz")
+    return True, "/healthz"
 
 
 class SearchUser(HttpUser):
@@ -30,24 +80,7 @@ class SearchUser(HttpUser):
 
     def on_start(self) -> None:
         """Detect service type by checking health endpoints."""
-        # Try FastAPI health check first
-        response = self.client.get("/health")
-        if response.status_code == HTTP_OK:
-            self.use_post = False  # FastAPI uses GET for search
-            self.health_endpoint = "/health"
-            return
-
-        # If FastAPI check fails, assume BentoML and check /healthz
-        response = self.client.get("/healthz")
-        if response.status_code == HTTP_OK:
-            self.use_post = True  # BentoML uses POST for search
-            self.health_endpoint = "/healthz"
-            return
-
-        # If both fail, assume BentoML but log an issue
-        self.use_post = True
-        self.health_endpoint = "/healthz"
-
+        self.use_post, self.health_endpoint = detect_service(self.client)
 
     @task(3)  # Prioritize search requests (3x more frequent)
     def search_test(self) -> None:
@@ -79,3 +112,307 @@ class SearchUser(HttpUser):
             response.failure(
                 f"Health failed at {self.health_endpoint}: {response.status_code}",
             )
+
+
+@events.init_command_line_parser.add_listener
+def add_replay_arguments(parser: Any) -> None:  # noqa: ANN401
+    """Register the ``ReplayUser`` options."""
+    parser.add_argument(
+        "--query-log", default="", help="JSONL query log for ReplayUser",
+    )
+    parser.add_argument(
+        "--replay-mode", choices=("replay", "constant", "steps"), default="replay",
+        help="recorded arrival times, constant RPS, or stepped RPS ramp",
+    )
+    parser.add_argument(
+        "--replay-speed", type=float, default=1.0,
+        help="speed-up factor for recorded arrival times",
+    )
+    parser.add_argument(
+        "--replay-loops", type=int, default=1,
+        help="times to replay the log in replay mode, 0 for forever",
+    )
+    parser.add_argument(
+        "--target-rps", type=float, default=10.0, help="rate for constant mode",
+    )
+    parser.add_argument(
+        "--rps-steps", default="5,10,20,40", help="comma-separated rates for steps",
+    )
+    parser.add_argument(
+        "--step-duration", type=float, default=60.0, help="seconds per step",
+    )
+    parser.add_argument(
+        "--max-in-flight", type=int, default=1000,
+        help="outstanding requests before new arrivals are dropped",
+    )
+    parser.add_argument(
+        "--histogram-file", default="latency_histograms.json",
+        help="where ReplayUser writes per-class latency histograms",
+    )
+
+
+def load_query_log(path: str) -> list[dict[str, Any]]:
+    """Read searches from a JSONL log, oldest first.
+
+    Lines without a ``query`` are skipped. ``timestamp`` may be epoch
+    seconds or ISO 8601; replay mode skips entries without one.
+    """
+    entries = []
+    with Path(path).open(encoding="utf-8") as log_file:
+        for line in log_file:
+            if not line.strip():
+                continue
+            entry = json.loads(line)
+            if not entry.get("query"):
+                continue
+            timestamp = entry.get("timestamp")
+            if isinstance(timestamp, str):
+                timestamp = datetime.fromisoformat(timestamp).timestamp()
+            entry["timestamp"] = timestamp
+            entries.append(entry)
+    entries.sort(key=lambda entry: entry["timestamp"] or 0.0)
+    return entries
+
+
+def query_class(entry: dict[str, Any]) -> str:
+    """Name the shape of a search, e.g. ``keyword:single`` or ``hybrid:or+date``."""
+    query = entry["query"]
+    features = [
+        name for name, present in (
+            ("or", " OR " in query),
+            ("not", " NOT " in query),
+            ("date", bool(entry.get("start_date") or entry.get("end_date"))),
+        ) if present
+    ]
+    if not features:
+        features = ["single" if len(query.split()) == 1 else "multi"]
+    return f"{entry.get('mode') or 'keyword'}:{'+'.join(features)}"
+
+
+class LatencyHistogram:
+    """Log-bucketed latency counts with approximate percentiles."""
+
+    def __init__(self) -> None:
+        """Start with empty buckets."""
+        self.counts = [0] * HISTOGRAM_BUCKETS
+        self.requests = 0
+        self.failures = 0
+
+    @staticmethod
+    def upper_bound(bucket: int) -> float:
+        """Return the upper edge of ``bucket`` in milliseconds."""
+        return HISTOGRAM_BASE_MS * HISTOGRAM_GROWTH ** bucket
+
+    def add(self, milliseconds: float, *, failed: bool = False) -> None:
+        """Count one response."""
+        ratio = max(milliseconds, HISTOGRAM_BASE_MS) / HISTOGRAM_BASE_MS
+        bucket = math.ceil(math.log(ratio, HISTOGRAM_GROWTH))
+        self.counts[min(bucket, HISTOGRAM_BUCKETS - 1)] += 1
+        self.requests += 1
+        self.failures += failed
+
+    def percentile(self, fraction: float) -> float | None:
+        """Return the bucket edge below which ``fraction`` of responses fall."""
+        target = fraction * self.requests
+        seen = 0
+        for bucket, count in enumerate(self.counts):
+            seen += count
+            if count and seen >= target:
+                return round(self.upper_bound(bucket), 3)
+        return None
+
+    def to_dict(self) -> dict[str, Any]:
+        """Return counts per bucket upper edge (ms) and summary percentiles."""
+        return {
+            "requests": self.requests,
+            "failures": self.failures,
+            "p50_ms": self.percentile(0.5),
+            "p95_ms": self.percentile(0.95),
+            "p99_ms": self.percentile(0.99),
+            "buckets_ms": {
+                f"{self.upper_bound(bucket):.3f}": count
+                for bucket, count in enumerate(self.counts) if count
+            },
+        }
+
+
+class ReplayUser(HttpUser):
+    """Open-loop dispatcher replaying a recorded query log.
+
+    Run exactly one; it keeps up to ``--max-in-flight`` requests outstanding
+    on its own and counts arrivals beyond that as failed ``dropped`` requests.
+    """
+
+    fixed_count = 1
+    wait_time = constant(0)
+
+    histograms: ClassVar[dict[str, LatencyHistogram]] = {}
+    steps: ClassVar[list[dict[str, Any]]] = []
+
+    def on_start(self) -> None:
+        """Load the log and size the connection pool for the in-flight limit."""
+        self.options = self.environment.parsed_options
+        if not self.options.query_log:
+            raise StopUser
+        self.entries = load_query_log(self.options.query_log)
+        if self.options.replay_mode == "replay":
+            self.entries = self.timed_entries()
+        if not self.entries:
+            raise StopUser
+        self.use_post, _ = detect_service(self.client)
+        adapter = HTTPAdapter(pool_maxsize=self.options.max_in_flight)
+        self.client.mount("http://", adapter)
+        self.client.mount("https://", adapter)
+        self.rng = random.Random(0)  # noqa: S311 - reproducible arrivals
+
+    def timed_entries(self) -> list[dict[str, Any]]:
+        """Return the entries replay mode can place in time.
+
+        Searches without a ``timestamp`` are skipped and counted; a log with
+        none at all can only be sent with ``constant`` or ``steps``.
+        """
+        timed = [entry for entry in self.entries if entry["timestamp"] is not None]
+        if not timed:
+            logger.error(
+                f"{self.options.query_log} has no timestamps to replay; "
+                "use --replay-mode constant or steps",
+            )
+        elif skipped := len(self.entries) - len(timed):
+            logger.warning(
+                f"Skipping {skipped} of {len(self.entries)} searches in "
+                f"{self.options.query_log} without a timestamp",
+            )
+        return timed
+
+    def schedule(self) -> Iterator[tuple[float, dict[str, Any], int]]:
+        """Yield ``(seconds from start, entry, step)`` for every arrival."""
+        mode = self.options.replay_mode
+        if mode == "replay":
+            loops = self.options.replay_loops
+            loop = 0
+            offset = 0.0
+            first = self.entries[0]["timestamp"]
+            while not loops or loop < loops:
+                for entry in self.entries:
+                    gap = entry["timestamp"] - first
+                    yield offset + gap / self.options.replay_speed, entry, 0
+                # Start the next pass one average gap after the last arrival
+                offset += gap * (1 + 1 / len(self.entries)) / self.options.replay_speed
+                loop += 1
+            return
+        rates = (
+            [self.options.target_rps] if mode == "constant"
+            else [float(rate) for rate in self.options.rps_steps.split(",")]
+        )
+        elapsed = 0.0
+        for step, rate in enumerate(rates):
+            end = (
+                math.inf if mode == "constant"
+                else (step + 1) * self.options.step_duration
+            )
+            while True:
+                elapsed += self.rng.expovariate(rate)  # Poisson arrivals
+                if elapsed >= end:
+                    elapsed = end
+                    break
+                yield elapsed, self.rng.choice(self.entries), step
+
+    @task
+    def dispatch(self) -> None:
+        """Send every scheduled request on time, without waiting for replies."""
+        pool = Pool(self.options.max_in_flight)
+        rates = self.options.rps_steps.split(",")
+        start = time.monotonic()
+        for offset, entry, step in self.schedule():
+            if len(self.steps) <= step:
+                target = (
+                    float(rates[step]) if self.options.replay_mode == "steps"
+                    else None
+                )
+                self.steps.append({
+                    "step": step,
+                    "target_rps": target,
+                    "started": offset,
+                    "ended": offset,
+                    "sent": 0,
+                    "dropped": 0,
+                    "latency": LatencyHistogram(),
+                })
+            self.steps[step]["ended"] = offset
+            delay = start + offset - time.monotonic()
+            if delay > 0:
+                gevent.sleep(delay)
+            if pool.full():
+                self.steps[step]["dropped"] += 1
+                events.request.fire(
+                    request_type="POST" if self.use_post else "GET",
+                    name=f"/search [{query_class(entry)}]",
+                    response_time=0,
+                    response_length=0,
+                    exception=RuntimeError("dropped: too many requests in flight"),
+                    context={},
+                )
+                continue
+            self.steps[step]["sent"] += 1
+            pool.spawn(self.send, entry, step)
+        pool.join()
+        self.environment.runner.quit()
+
+    def send(self, entry: dict[str, Any], step: int) -> None:
+        """Issue one search and record its latency under its query class."""
+        name = query_class(entry)
+        search = {
+            key: entry[key]
+            for key in ("query", "file_type", "mode", "start_date", "end_date")
+            if entry.get(key) is not None
+        }
+        search.setdefault("file_type", "image")
+        started = time.perf_counter()
+        if self.use_post:
+            request = self.client.post(
+                "/search", json={"input_data": search}, name=f"/search [{name}]",
+                catch_response=True,
+            )
+        else:
+            request = self.client.get(
+                "/search", params=search, name=f"/search [{name}]",
+                catch_response=True,
+            )
+        with request as response:
+            milliseconds = 1000 * (time.perf_counter() - started)
+            failed = response.status_code != HTTP_OK
+            if failed:
+                response.failure(f"Search request fail:{response.status_code}")
+        self.histograms.setdefault(name, LatencyHistogram()).add(
+            milliseconds, failed=failed,
+        )
+        self.steps[step]["latency"].add(milliseconds, failed=failed)
+
+
+@events.quitting.add_listener
+def write_histograms(environment: Any, **_kwargs: Any) -> None:  # noqa: ANN401
+    """Write ``ReplayUser``'s per-class and per-step latency histograms."""
+    if not ReplayUser.histograms:
+        return
+    steps = []
+    for step in ReplayUser.steps:
+        latency = step["latency"].to_dict()
+        if environment.parsed_options.replay_mode == "steps":
+            duration = environment.parsed_options.step_duration
+        else:
+            duration = step["ended"] - step["started"]
+        steps.append({
+            **{key: value for key, value in step.items() if key != "latency"},
+            "achieved_rps": latency["requests"] / duration if duration else None,
+            **latency,
+        })
+    report = {
+        "classes": {
+            name: histogram.to_dict()
+            for name, histogram in sorted(ReplayUser.histograms.items())
+        },
+        "steps": steps,
+    }
+    Path(environment.parsed_options.histogram_file).write_text(
+        json.dumps(report, indent=2), encoding="utf-8",
+    )
@@ -1,25 +1,38 @@
-"""Main module for indexing and searching images and videos."""
+"""Main module for searching indexed images and videos.
+
+Importing this module only opens the Whoosh index. Captioning models and the
+indexing pipeline live in ``indexer``, which is run separately.
+"""
 
 from __future__ import annotations
 
-import os
-import shutil
-import subprocess
-from datetime import datetime, timezone
+import json
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
 from pathlib import Path
+from typing import TYPE_CHECKING, Any
 
-import ffmpeg
-import inflect
-import nltk
 from loguru import logger
-from moviepy.editor import VideoFileClip
-from nltk.stem import WordNetLemmatizer
-from PIL import Image
-from PIL.ExifTags import TAGS
-from transformers import BlipForConditionalGeneration, BlipProcessor
 from whoosh import index
-from whoosh.fields import DATETIME, ID, TEXT, Schema
-from whoosh.qparser import OrGroup, QueryParser
+from whoosh.fields import DATETIME, ID, NUMERIC, TEXT, Schema
+from whoosh.query import And, AndNot, DateRange, NullQuery, Term
+from whoosh.util.filelock import FileLock
+
+from embeddings import embed_text
+from media_ids import split_frame_id
+from metrics import time_stage
+from profiling import profiler
+from ranking import HYBRID_CONFIG, Hit, ScoredHit, fuse_rankings, with_breakdown
+from result_cache import ResultCache, normalize_query, result_cache_key
+from search_manager import SearcherManager
+from text_analysis import caption_analyzer
+from vector_store import VectorFilters, VectorStore
+
+if TYPE_CHECKING:
+    from collections.abc import Iterable, Mapping
+    from datetime import datetime
+
+    from whoosh.index import FileIndex
 
 # Configure logging
 logger.add(
@@ -27,219 +40,355 @@ logger.add(
     format="{time} | {level} | {name}:{function}:{line} - {message}",
 )
 
-# Ensure NLTK resources are downloaded
-nltk.download("wordnet")
-nltk.download("omw-1.4")
-
-# Initialize lemmatizer and inflect engine
-lemmatizer = WordNetLemmatizer()
-inflect_engine = inflect.engine()
-
 # Set paths
 IMAGE_FOLDER = "static/images"
 VIDEO_FOLDER = "static/videos"
 INDEX_FOLDER = "index"
-FRAME_SAMPLE_RATE = 3  # Extract every 3 seconds for video captions
+MANIFEST_PATH = Path(INDEX_FOLDER) / "manifest.json"  # Written by the indexer
+# Held by the one process allowed to write the index (see indexer.py). It
+# lives beside INDEX_FOLDER because a full rebuild deletes that folder.
+INDEXER_LOCK_PATH = "index.lock"
+INDEX_WAIT_INTERVAL = 0.5  # Seconds between checks while an indexer creates it
+SEARCH_LIMIT = 10
+SEARCH_MODES = ("keyword", "semantic", "hybrid")
+MAX_FRAME_OFFSETS = 3  # Best-matching timestamps returned per video hit
+# Candidates each retriever contributes to hybrid fusion
+HYBRID_CANDIDATES = HYBRID_CONFIG.get("candidates", 50)
+# Milliseconds hybrid search waits for both retrievers before fusing
+HYBRID_LATENCY_BUDGET_MS = HYBRID_CONFIG.get("latency_budget_ms", 300)
 
 # Ensure required directories exist
 for folder in [IMAGE_FOLDER, VIDEO_FOLDER, INDEX_FOLDER]:
     Path(folder).mkdir(parents=True, exist_ok=True)
 
-# Define schema
+# Define schema. Each sampled video frame is its own document whose
+# file_path is a frame id (see media_ids); its parent path and offset are
+# indexed for deletes and grouping but not stored, as the id carries both.
 schema = Schema(
-    file_path=ID(stored=True),
-    description=TEXT(stored=True),
+    file_path=ID(stored=True, unique=True),
+    video_path=ID(sortable=True),  # Parent video of a frame document
+    offset_seconds=NUMERIC(float),  # Position of a frame in its video
+    media_type=ID(stored=True),  # "image" or "video", for filtering in the query
+    description=TEXT(stored=True, analyzer=caption_analyzer()),
     date=DATETIME(stored=True),  # Add date field for temporal queries
 )
 
-# Create or open index
-if not Path(INDEX_FOLDER).joinpath("MAIN_0.toc").exists():
-    ix = index.create_in(INDEX_FOLDER, schema)
-else:
-    ix = index.open_dir(INDEX_FOLDER)
-
-# Load BLIP model
-logger.info("Loading BLIP image captioning model...")
-processor = BlipProcessor.from_pretrained("Salesforce/blip-image-captioning-base")
-model = BlipForConditionalGeneration.from_pretrained(
-    "Salesforce/blip-image-captioning-base",
-)
-logger.info("BLIP model loaded successfully!")
+def open_index() -> FileIndex:
+    """Open the index read-side, creating an empty one if none exists yet.
+
+    API workers never write the index. When several start together on a
+    fresh checkout, only the one holding the indexer lock creates the
+    empty index; the others, or all of them while an indexer is already
+    running, wait for it to appear instead of racing ``create_in``.
+    """
+    while not index.exists_in(INDEX_FOLDER):
+        lock = FileLock(INDEXER_LOCK_PATH)
+        if lock.acquire(blocking=False):
+            try:
+                if not index.exists_in(INDEX_FOLDER):
+                    index.create_in(INDEX_FOLDER, schema)
+            finally:
+                lock.release()
+        else:
+            time.sleep(INDEX_WAIT_INTERVAL)
+    return index.open_dir(INDEX_FOLDER)
 
 
-def extract_timestamp_from_image(image_path: str) -> datetime | None:
-    """Extract timestamp from image EXIF data."""
+def indexed_analyzer() -> str | None:
+    """Return the analyzer backend the index was built with, if recorded."""
     try:
-        image = Image.open(image_path)
-        exif_data = image.getexif()
-        if exif_data is not None:
-            for tag, value in exif_data.items():
-                if TAGS.get(tag) == "DateTime":
-                    return datetime.strptime(
-                        value, "%Y:%m:%d %H:%M:%S",
-                    ).replace(tzinfo=timezone.utc)
-    except (AttributeError, KeyError) as e:
-        logger.error(f"Error extracting EXIF data from image {image_path}: {e}")
-    return None
-
-def extract_timestamp_from_video(video_path: str) -> str | None:
-    """Extract timestamp from video metadata using ffmpeg-python."""
-    try:
-        # Ensure the video path is valid and exists
-        video_path_obj = Path(video_path)
-        if not video_path_obj.exists():
-            logger.error("Video file not found: %s", video_path)
-            return None
-
-        # Convert to absolute path
-        video_path = str(video_path_obj.resolve())
-
-        # Use ffmpeg.probe to extract metadata
-        metadata = ffmpeg.probe(video_path)
-        for stream in metadata.get("streams", []):
-            creation_time = stream.get("tags", {}).get("creation_time")
-            if creation_time:
-                return creation_time
-
-    except ffmpeg.Error:
-        logger.error("FFmpeg error while extracting timestamp")
-    except FileNotFoundError:
-        logger.error("File disappeared before processing: %s", video_path)
-    return None
-
-
-def generate_caption(image_path: str) -> str:
-    """Generate an image caption using the BLIP model."""
-    try:
-        image = Image.open(image_path).convert("RGB")
-        inputs = processor(images=image, return_tensors="pt")
-        output = model.generate(**inputs)
-        caption = processor.decode(output[0], skip_special_tokens=True)
-        logger.info(f"Generated caption for {image_path}: {caption}")
-    except (AttributeError, KeyError) as e:
-        logger.error(f"Error processing {image_path}: {e}")
-        return "No description available."
-    else:
-        return caption
-
-
-def extract_video_caption(video_path: str | Path) -> str:
-    """Extract frames from a video and generate an overall description."""
-    # Convert video_path to a string if it's a Path object
-    video_path_str = str(video_path) if isinstance(video_path, Path) else video_path
+        with MANIFEST_PATH.open("r", encoding="utf-8") as manifest_file:
+            return json.load(manifest_file).get("analyzer")
+    except (OSError, json.JSONDecodeError):
+        return None
+
+
+# Whoosh memory-maps segment files, so every worker process shares one
+# page-cache copy of the index, like the vector store's embedding matrix
+ix = open_index()
+searcher_manager = SearcherManager(ix)
+vector_store = VectorStore()
+result_cache = ResultCache()
+# Runs the keyword and semantic retrievers of a hybrid search side by side
+hybrid_executor = ThreadPoolExecutor(
+    max_workers=HYBRID_CONFIG.get("workers", 8), thread_name_prefix="hybrid",
+)
 
-    clip = VideoFileClip(video_path_str)  # Pass the string path to moviepy
-    duration = int(clip.duration)
-    descriptions = []
-    try:
-        for i in range(0, duration, FRAME_SAMPLE_RATE):
-            frame = clip.get_frame(i)
-            frame_path = f"temp_frame_{i}.jpg"
-            Image.fromarray(frame).save(frame_path)
-            caption = generate_caption(frame_path)
-            descriptions.append(caption)
-            Path(frame_path).unlink()
-    except (OSError, subprocess.CalledProcessError) as e:
-        logger.warning(f"Error processing frame at {i}s: {e}")
-    return " ".join(descriptions) if descriptions else "No description available."
-
-
-def index_data() -> None:
-    """Index images and videos."""
-    try:
-        if Path(INDEX_FOLDER).exists():
-            shutil.rmtree(INDEX_FOLDER)
-
-        # Create the index folder
-        Path(INDEX_FOLDER).mkdir(parents=True, exist_ok=True)
-
-        # Create or open the index
-        ix = index.create_in(INDEX_FOLDER, schema)
-        writer = ix.writer()
-
-        for img_file in os.listdir(IMAGE_FOLDER):
-            img_path = Path(IMAGE_FOLDER) / img_file
-            if img_file.lower().endswith((".png", ".jpg", ".jpeg")):
-                caption = generate_caption(img_path)
-                timestamp = extract_timestamp_from_image(img_path)
-                writer.add_document(
-                    file_path=str(img_path),  # Convert Path to string
-                    description=caption,
-                    date=timestamp or datetime.now(timezone.utc),
-                )
-                logger.info(f"Indexed image: {img_path}")
-
-        for video_file in os.listdir(VIDEO_FOLDER):
-            if video_file.lower().endswith((".mp4", ".avi", ".mov")):
-                video_path = Path(VIDEO_FOLDER) / video_file
-                video_caption = extract_video_caption(video_path)
-                timestamp = extract_timestamp_from_video(video_path)
-                if timestamp == "Unknown":
-                    timestamp = datetime.now(timezone.utc)
-                if isinstance(timestamp, str):
-                    try:
-                        timestamp = datetime.strptime(
-                            timestamp, "%Y:%m:%d %H:%M:%S").replace(tzinfo=timezone.utc)
-                    except ValueError:
-                        timestamp = datetime.now(timezone.utc)
-
-                # Add the document to the index
-                writer.add_document(
-                    file_path=str(video_path),
-                    description=video_caption,
-                    date=timestamp,
-                )
-                logger.info(f"Indexed video: {video_path}")
-
-        writer.commit()
-        logger.info("Indexing complete!")
-    except (subprocess.CalledProcessError, OSError) as e:
-        logger.error(f"Error indexing data: {e}")
-        return
 
 def search_with_filters(
     query: str,
     file_type: str | None = None,
     start_date: datetime | None = None,
     end_date: datetime | None = None,
-) -> list[dict]:
-    """Search with optional filters for file type and date range."""
-    search_results = []
-
-    with ix.searcher() as searcher:
-        # Handle NOT operator explicitly
-        if " NOT " in query:
-            main_query, exclude_term = query.split(" NOT ", 1)
-            main_query = main_query.strip()
-            exclude_term = exclude_term.strip().lower()  # Case-insensitive exclusion
-        else:
-            main_query = query
-            exclude_term = None
-
-        # Parse the main query
-        qp = QueryParser("description", ix.schema, group=OrGroup)
-        q = qp.parse(main_query)
-
-        # Perform the search
-        results = searcher.search(q, limit=10)
-
-        # Filter results by date range and exclude_term
-        filtered_results = []
-        for hit in results:
-            if exclude_term and exclude_term in hit["description"].lower():
-                continue  # Skip documents containing the exclude_term
-            if file_type and file_type not in hit["file_path"]:
-                continue
-            if start_date and hit["date"] < start_date:
-                continue
-            if end_date and hit["date"] > end_date:
+    mode: str = "keyword",
+) -> list[ScoredHit]:
+    """Search with optional filters for file type and date range.
+
+    ``mode`` selects keyword (Whoosh BM25F), semantic (CLIP embeddings) or
+    hybrid ranking. Each result is ``(file_path, description, scores)``,
+    where ``scores`` breaks the ranking down per retriever (see
+    ``ranking``). Results are served from ``result_cache`` when the same
+    normalized search was answered recently against the current index
+    version. Slow searches are profiled when the profiler is enabled.
+    """
+    if mode not in SEARCH_MODES:
+        msg = f"Unknown search mode {mode!r}, expected one of {SEARCH_MODES}"
+        raise ValueError(msg)
+    with profiler.track("search", f"{mode} {query!r}"):
+        with time_stage("cache_lookup"):
+            cache_key = result_cache_key(query, file_type, start_date, end_date, mode)
+            version = (searcher_manager.version, vector_store.version)
+            cached = result_cache.get(cache_key, version)
+        if cached is not None:
+            return cached
+
+        search_results, complete = search_index(
+            query, file_type, start_date, end_date, mode,
+        )
+        if complete:  # Don't pin a partial hybrid ranking for the whole TTL
+            result_cache.put(cache_key, version, search_results)
+        return search_results
+
+
+def search_batch(searches: Iterable[Mapping[str, Any]]) -> list[list[ScoredHit]]:
+    """Run many searches in order, answering identical ones only once.
+
+    Each mapping holds keyword arguments for ``search_with_filters``. Every
+    search runs on the calling thread, so the whole batch shares one
+    searcher and one set of parsers, and searches that normalize to the same
+    cache key are executed once and fanned back out to every position.
+    """
+    answers: dict[tuple, list[ScoredHit]] = {}
+    results = []
+    for search in searches:
+        key = result_cache_key(
+            search["query"],
+            search.get("file_type"),
+            search.get("start_date"),
+            search.get("end_date"),
+            search.get("mode", "keyword"),
+        )
+        if key not in answers:
+            answers[key] = search_with_filters(**search)
+        results.append(answers[key])
+    logger.info(f"Batch search answered {len(results)} queries, {len(answers)} unique")
+    return results
+
+
+def search_index(
+    query: str,
+    file_type: str | None = None,
+    start_date: datetime | None = None,
+    end_date: datetime | None = None,
+    mode: str = "keyword",
+) -> tuple[list[ScoredHit], bool]:
+    """Run a search against the indexes, bypassing the result cache.
+
+    Returns the results and whether they are complete. Hybrid results that
+    had to be fused without one retriever are not.
+    """
+    complete = True
+    if mode == "keyword":
+        search_results = with_breakdown(
+            "keyword", keyword_search(query, file_type, start_date, end_date),
+        )
+    elif mode == "semantic":
+        search_results = with_breakdown(
+            "semantic", semantic_search(query, file_type, start_date, end_date),
+        )
+    else:
+        search_results, complete = hybrid_search(
+            query, file_type, start_date, end_date,
+        )
+
+    logger.info(
+        f"Search results for '{query}' ({mode}): "
+        f"{[path for path, _, _, _ in search_results]}",
+    )
+    return search_results, complete
+
+
+def split_exclusion(query: str) -> tuple[str, str | None]:
+    """Split ``"a b NOT c"`` into the main query and the excluded terms."""
+    # Handle NOT operator explicitly
+    if " NOT " in query:
+        main_query, exclude_term = query.split(" NOT ", 1)
+        return main_query.strip(), exclude_term.strip() or None
+    return query, None
+
+
+def group_frame_hits(
+    hits: list[tuple[str, str, float]], limit: int = SEARCH_LIMIT,
+) -> list[Hit]:
+    """Group best-first ``(document_id, description, score)`` hits per file.
+
+    A video takes the score and caption of its best frame, so long videos
+    gain nothing from sheer caption volume, and lists the offsets of up to
+    ``MAX_FRAME_OFFSETS`` matching frames, best first.
+    """
+    grouped: dict[str, Hit] = {}
+    for document_id, description, score in hits:
+        media_path, offset = split_frame_id(document_id)
+        if media_path not in grouped:
+            if len(grouped) == limit:
                 continue
-            filtered_results.append((hit["file_path"], hit["description"], hit["date"]))
+            grouped[media_path] = (media_path, description, score, [])
+        offsets = grouped[media_path][3]
+        if offset is not None and len(offsets) < MAX_FRAME_OFFSETS:
+            offsets.append(offset)
+    return list(grouped.values())
 
-        search_results = [(img, desc) for img, desc, _ in filtered_results]
 
-    logger.info(f"Search results for '{query}': {search_results}")
-    return search_results
+def keyword_search(
+    query: str,
+    file_type: str | None = None,
+    start_date: datetime | None = None,
+    end_date: datetime | None = None,
+    limit: int = SEARCH_LIMIT,
+) -> list[Hit]:
+    """Rank documents with Whoosh BM25F, grouping video frames per video.
+
+    File type, date range and ``NOT`` exclusions are compiled into the Whoosh
+    query, so the top results are ranked over eligible documents only.
+    Collapsing on ``video_path`` keeps at most ``MAX_FRAME_OFFSETS`` frames
+    per video, so ``limit * MAX_FRAME_OFFSETS`` documents always cover
+    ``limit`` files when there are that many matches.
+    """
+    main_query, exclude_term = split_exclusion(query)
+
+    with time_stage("parse"):
+        # Parse the main query
+        q = searcher_manager.parser("description").parse(main_query)
+        if exclude_term:
+            excluded = searcher_manager.parser("description", "and").parse(
+                exclude_term,
+            )
+            if excluded is not NullQuery:
+                q = AndNot(q, excluded)  # Excludes without adding to scores
+
+    # Restrict the candidate set without affecting scores
+    filters = []
+    if file_type:
+        filters.append(Term("media_type", file_type))
+    if start_date or end_date:
+        filters.append(DateRange("date", start_date, end_date))
+
+    searcher = searcher_manager.searcher()
+    with time_stage("score"):
+        results = searcher.search(
+            q,
+            filter=And(filters) if filters else None,
+            limit=limit * MAX_FRAME_OFFSETS,
+            collapse="video_path",
+            collapse_limit=MAX_FRAME_OFFSETS,
+        )
+    with time_stage("collect"):
+        return group_frame_hits(
+            [(hit["file_path"], hit["description"], hit.score) for hit in results],
+            limit,
+        )
+
+
+def semantic_search(
+    query: str,
+    file_type: str | None = None,
+    start_date: datetime | None = None,
+    end_date: datetime | None = None,
+    limit: int = SEARCH_LIMIT,
+) -> list[Hit]:
+    """Rank documents by CLIP cosine similarity to the query text.
+
+    The ``NOT`` clause is not embedded; documents whose captions match it are
+    masked out of the vector scan instead, like in the keyword path. Video
+    frames are grouped per video like keyword hits.
+    """
+    main_query, exclude_term = split_exclusion(query)
+    searcher = searcher_manager.searcher()
+    excluded = None
+    if exclude_term:
+        excluded_query = searcher_manager.parser("description", "and").parse(
+            exclude_term,
+        )
+        if excluded_query is not NullQuery:
+            excluded = {
+                hit["file_path"]
+                for hit in searcher.search(excluded_query, limit=None)
+            }
+
+    with time_stage("semantic"):
+        hits = vector_store.search(
+            embed_text(normalize_query(main_query)),
+            limit * MAX_FRAME_OFFSETS,
+            filters=VectorFilters(file_type, start_date, end_date, excluded),
+        )
+    with time_stage("collect"):
+        results = []
+        for document_id, score in hits:
+            stored = searcher.document(file_path=document_id)
+            if stored is not None:  # Vectors can briefly lead the Whoosh commit
+                results.append((document_id, stored["description"], score))
+        return group_frame_hits(results, limit)
+
+
+def hybrid_search(
+    query: str,
+    file_type: str | None = None,
+    start_date: datetime | None = None,
+    end_date: datetime | None = None,
+    *,
+    limit: int = SEARCH_LIMIT,
+) -> tuple[list[ScoredHit], bool]:
+    """Fuse keyword and semantic candidates retrieved concurrently.
+
+    Both retrievers get the same filters and contribute their top
+    ``HYBRID_CANDIDATES``. If one has not answered within the ``[hybrid]
+    latency_budget_ms`` (for instance while the CLIP text model loads) or
+    fails, the other's candidates are fused alone and the results are
+    flagged incomplete. With nothing to fuse by the budget, the search waits
+    for the first retriever to succeed and only raises once both have failed.
+    """
+    started = time.perf_counter()
+    futures: dict[str, Future[list[Hit]]] = {
+        name: hybrid_executor.submit(
+            retriever, query, file_type, start_date, end_date, HYBRID_CANDIDATES,
+        )
+        for name, retriever in (
+            ("keyword", keyword_search), ("semantic", semantic_search),
+        )
+    }
+    done, pending = wait(futures.values(), timeout=HYBRID_LATENCY_BUDGET_MS / 1000)
+    # Nothing to fuse yet, so wait past the budget for the first retriever
+    # that succeeds, or until every one of them has failed
+    while pending and all(future.exception() is not None for future in done):
+        finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+        done |= finished
+
+    rankings: dict[str, list[Hit]] = {}
+    errors = []
+    for name, future in futures.items():
+        if future not in done:
+            logger.warning(
+                f"Hybrid search for '{query}' fused without {name} results: "
+                f"over the {HYBRID_LATENCY_BUDGET_MS:.0f} ms budget",
+            )
+        elif future.exception() is not None:
+            logger.error(f"{name.capitalize()} retrieval failed: {future.exception()}")
+            errors.append(future.exception())
+        else:
+            rankings[name] = future.result()
+    if not rankings and errors:
+        raise errors[0]
+
+    with time_stage("fuse"):
+        results = [
+            (path, description, scores, offsets[:MAX_FRAME_OFFSETS])
+            for path, description, scores, offsets in fuse_rankings(rankings, limit)
+        ]
+    logger.debug(
+        f"Hybrid search for '{query}' took "
+        f"{(time.perf_counter() - started) * 1000:.1f} ms",
+    )
+    return results, len(rankings) == len(futures)
 
 
 def run_advanced_search(
@@ -247,10 +396,8 @@ def run_advanced_search(
     file_type: str,
     start_date: datetime | None,
     end_date: datetime | None,
-) -> list[dict]:
+    mode: str = "keyword",
+) -> list[ScoredHit]:
     """Search UI function for retrieving images and videos."""
-    return search_with_filters(query, file_type, start_date, end_date)
-
+    return search_with_filters(query, file_type, start_date, end_date, mode)
 
-# Run indexing before launching the UI
-index_data()
@@ -0,0 +1,26 @@
+"""Identifiers for indexed media and the video frames indexed under them.
+
+Images are indexed under their file path. Every sampled video frame is its
+own document, identified by the video path plus a media-fragment suffix,
+e.g. ``static/videos/clip.mp4#t=12``. The same id keys the frame's row in
+the vector store, so both indexes resolve a hit to a video and an offset
+without storing either separately.
+"""
+
+from __future__ import annotations
+
+FRAME_SEPARATOR = "#t="
+
+
+def frame_id(video_path: str, offset_seconds: float) -> str:
+    """Return the document id of the frame at ``offset_seconds``."""
+    offset = f"{offset_seconds:.3f}".rstrip("0").rstrip(".")
+    return f"{video_path}{FRAME_SEPARATOR}{offset}"
+
+
+def split_frame_id(document_id: str) -> tuple[str, float | None]:
+    """Return the media path and frame offset, ``None`` for non-frame ids."""
+    media_path, separator, offset = document_id.rpartition(FRAME_SEPARATOR)
+    if not separator:
+        return document_id, None
+    return media_path, float(offset)
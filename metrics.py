@@ -0,0 +1,183 @@
+"""Prometheus metrics for the search and indexing paths.
+
+Every process keeps its own registry. With more than one process (several
+API workers, or the APIs plus ``ingest.py``), set ``[metrics]
+multiprocess_dir`` so that each process writes its samples there and
+``/metrics`` aggregates all of them. Clear that directory before restarting
+the services, or counters carry over from the previous run. BentoML sets up
+its own multiprocess directory and serves these metrics on its built-in
+``/metrics`` endpoint, next to its request histograms.
+
+Observing a metric costs a few microseconds, so instrumentation stays on.
+"""
+
+from __future__ import annotations
+
+import os
+import time
+from collections.abc import Awaitable, Callable, MutableMapping
+from pathlib import Path
+from typing import Any
+
+from settings import get_section
+
+METRICS_CONFIG = get_section("metrics")
+MULTIPROCESS_DIR = METRICS_CONFIG.get("multiprocess_dir", "")
+# ingest.py serves its own metrics on this port when > 0
+INGEST_METRICS_PORT = METRICS_CONFIG.get("ingest_port", 0)
+
+# prometheus_client picks single or multiprocess storage when first imported
+if MULTIPROCESS_DIR:
+    Path(MULTIPROCESS_DIR).mkdir(parents=True, exist_ok=True)
+    os.environ.setdefault("PROMETHEUS_MULTIPROC_DIR", MULTIPROCESS_DIR)
+
+from prometheus_client import (  # noqa: E402
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Histogram,
+    generate_latest,
+    multiprocess,
+    start_http_server,
+)
+
+Scope = MutableMapping[str, Any]
+Message = MutableMapping[str, Any]
+ASGIApp = Callable[
+    [Scope, Callable[[], Awaitable[Message]], Callable[[Message], Awaitable[None]]],
+    Awaitable[None],
+]
+
+# Seconds; search stages start well under a millisecond
+STAGE_BUCKETS = (
+    0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1,
+    0.25, 0.5, 1.0, 2.5,
+)
+INDEXING_BUCKETS = (0.001, 0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+SEARCH_STAGES = (
+    "cache_lookup",  # Result cache key and lookup
+    "parse",  # Whoosh query parsing
+    "score",  # Whoosh matching, scoring and collapsing
+    "collect",  # Stored fields and per-video grouping of the hits
+    "semantic",  # Query embedding and vector scan
+    "fuse",  # Fusing the hybrid rankings
+    "serialize",  # Building the Pydantic response models
+)
+
+REQUEST_SECONDS = Histogram(
+    "http_request_duration_seconds",
+    "HTTP request latency by route and status.",
+    ("method", "route", "status"),
+    buckets=STAGE_BUCKETS,
+)
+SEARCH_STAGE_SECONDS = Histogram(
+    "search_stage_duration_seconds",
+    "Time spent in each stage of a search.",
+    ("stage",),
+    buckets=STAGE_BUCKETS,
+)
+RESULT_CACHE_EVENTS = Counter(
+    "search_result_cache_events_total",
+    "Result cache lookups and removals by outcome.",
+    ("event",),
+)
+SEARCHER_REFRESHES = Counter(
+    "searcher_refreshes_total",
+    "Per-thread searchers reopened after a new index commit.",
+)
+INDEXING_DECODE_SECONDS = Histogram(
+    "indexing_decode_duration_seconds",
+    "Time to decode one file, including video frame sampling.",
+    ("media_type",),
+    buckets=INDEXING_BUCKETS,
+)
+INDEXING_MODEL_SECONDS = Histogram(
+    "indexing_model_batch_duration_seconds",
+    "Time per captioning or embedding batch.",
+    ("task",),
+    buckets=INDEXING_BUCKETS,
+)
+INDEXING_MODEL_IMAGES = Counter(
+    "indexing_model_images_total",
+    "Images captioned or embedded; rate() gives captions per second.",
+    ("task",),
+)
+INDEXING_COMMIT_SECONDS = Histogram(
+    "indexing_commit_duration_seconds",
+    "Time to commit the Whoosh index or vector store, or to merge segments.",
+    ("store",),
+    buckets=INDEXING_BUCKETS,
+)
+INDEXING_FILES = Counter(
+    "indexing_files_total",
+    "Media files indexed, removed or skipped after failing.",
+    ("result",),
+)
+
+# Children bound once, so the hot path skips the label lookup
+_STAGE_TIMERS = {stage: SEARCH_STAGE_SECONDS.labels(stage) for stage in SEARCH_STAGES}
+
+
+def time_stage(stage: str) -> Any:  # noqa: ANN401
+    """Return a context manager that records one search stage's duration."""
+    return _STAGE_TIMERS[stage].time()
+
+
+def render() -> tuple[bytes, str]:
+    """Return the exposition payload and its content type.
+
+    In multiprocess mode the samples of every process are merged.
+    """
+    if "PROMETHEUS_MULTIPROC_DIR" in os.environ:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry), CONTENT_TYPE_LATEST
+
+
+def serve(port: int) -> None:
+    """Serve this process's metrics over HTTP from a background thread."""
+    start_http_server(port)
+
+
+class RequestMetricsMiddleware:
+    """ASGI middleware recording ``http_request_duration_seconds``.
+
+    Requests are labelled with their route template, such as ``/search``, so
+    path parameters do not multiply the series.
+    """
+
+    def __init__(self, app: ASGIApp) -> None:
+        """Wrap ``app``."""
+        self.app = app
+
+    async def __call__(
+        self,
+        scope: Scope,
+        receive: Callable[[], Awaitable[Message]],
+        send: Callable[[Message], Awaitable[None]],
+    ) -> None:
+        """Time one request, reading the route the router stored in ``scope``."""
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        started = time.perf_counter()
+        status = 500
+
+        async def record_status(message: Message) -> None:
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, record_status)
+        finally:
+            route = scope.get("route")
+            REQUEST_SECONDS.labels(
+                scope["method"],
+                getattr(route, "path", "unmatched"),
+                str(status),
+            ).observe(time.perf_counter() - started)
@@ -0,0 +1,481 @@
+"""Staged indexing pipeline: parallel decode, batched captioning, single writer.
+
+Decode workers read images, EXIF data and video metadata from disk and push
+prepared items onto a queue bounded both in items and in decoded frames. The
+caption stage pulls from that queue
+and packs images from several items into full BLIP batches. Finished
+documents go to one writer thread, which is the only code that touches the
+Whoosh ``ix.writer()``.
+"""
+
+from __future__ import annotations
+
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING
+
+from loguru import logger
+
+from caption_cache import caption_cache
+from captioning import (
+    CAPTION_BATCH_SIZE,
+    NO_DESCRIPTION,
+    caption_batch,
+    caption_cache_key,
+    lookup_cached_captions,
+    store_cached_captions,
+)
+from media_ids import frame_id
+from metrics import (
+    INDEXING_COMMIT_SECONDS,
+    INDEXING_DECODE_SECONDS,
+    INDEXING_FILES,
+    INDEXING_MODEL_IMAGES,
+    INDEXING_MODEL_SECONDS,
+)
+from profiling import profiler
+from settings import get_section
+
+if TYPE_CHECKING:
+    from collections.abc import Callable
+    from pathlib import Path
+
+    import numpy as np
+    from PIL import Image
+    from whoosh.index import Index
+    from whoosh.writing import IndexWriter
+
+    from vector_store import VectorStoreWriter
+
+INDEXING_CONFIG = get_section("indexing")
+PIPELINE_WORKERS = INDEXING_CONFIG.get("workers", 4)
+PIPELINE_QUEUE_DEPTH = INDEXING_CONFIG.get("queue_depth", 32)
+PIPELINE_QUEUE_FRAMES = INDEXING_CONFIG.get("queue_frames", 256)
+FLUSH_TIMEOUT = 0.5  # Seconds to wait for more items before running a partial batch
+
+_DONE = object()
+_SKIPPED = object()
+
+
+@dataclass
+class PreparedItem:
+    """A media file decoded and ready for captioning.
+
+    For videos, ``offsets`` holds the position in seconds of each frame in
+    ``images``; images leave it empty.
+    """
+
+    fields: dict
+    images: list[Image.Image]
+    offsets: list[float] = field(default_factory=list)
+    cache_keys: list[str] = field(default_factory=list)
+    captions: list[str | None] = field(default_factory=list)
+    embeddings: list[np.ndarray | None] = field(default_factory=list)
+
+    def _frames(self) -> list[int]:
+        """Return the video frames worth indexing.
+
+        A frame whose caption repeats the previous kept frame's, common for
+        static scenes, is folded into it: the earlier offset already points
+        at that scene.
+        """
+        kept = []
+        previous = None
+        for i, caption in enumerate(self.captions):
+            if caption != previous:
+                kept.append(i)
+                previous = caption
+        return kept
+
+    def to_documents(self) -> list[dict]:
+        """Return the Whoosh documents for this file.
+
+        An image is a single document. A video is one document per kept
+        frame, keyed by its frame id and carrying ``video_path`` and
+        ``offset_seconds``; a video without frames keeps a placeholder
+        document under its own path so it stays listed.
+        """
+        if not self.offsets:
+            caption = next((caption for caption in self.captions if caption), None)
+            return [{**self.fields, "description": caption or NO_DESCRIPTION}]
+        video_path = self.fields["file_path"]
+        return [
+            {
+                **self.fields,
+                "file_path": frame_id(video_path, self.offsets[i]),
+                "video_path": video_path,
+                "offset_seconds": self.offsets[i],
+                "description": self.captions[i] or NO_DESCRIPTION,
+            }
+            for i in self._frames()
+        ]
+
+    def to_vectors(self) -> list[tuple[str, np.ndarray]]:
+        """Return ``(document_id, embedding)`` for every embedded document."""
+        if not self.offsets:
+            ids = [self.fields["file_path"]] * bool(self.embeddings)
+            embeddings = self.embeddings[:1]
+        else:
+            frames = self._frames()
+            ids = [
+                frame_id(self.fields["file_path"], self.offsets[i]) for i in frames
+            ]
+            embeddings = [self.embeddings[i] for i in frames]
+        return [
+            (document_id, vector)
+            for document_id, vector in zip(ids, embeddings, strict=True)
+            if vector is not None
+        ]
+
+
+class _FrameBudget:
+    """Bound the decoded images held between the decode and model stages.
+
+    The queues count items, but one video item carries up to ``[video]
+    max_frames`` frames. Decode workers therefore also wait here until the
+    images already in flight leave room for theirs. An item larger than the
+    whole budget still goes through, alone.
+    """
+
+    def __init__(self, limit: int) -> None:
+        """Allow up to ``limit`` images in flight."""
+        self.limit = max(limit, 1)
+        self.held = 0
+        self._condition = threading.Condition()
+
+    def acquire(self, images: int, stop: threading.Event) -> bool:
+        """Wait for room for ``images``; return False if ``stop`` is set first."""
+        with self._condition:
+            while self.held and self.held + images > self.limit:
+                if stop.is_set():
+                    return False
+                self._condition.wait(FLUSH_TIMEOUT)
+            self.held += images
+            return True
+
+    def release(self, images: int) -> None:
+        """Return ``images`` to the budget once the model stage dropped them."""
+        with self._condition:
+            self.held -= images
+            self._condition.notify_all()
+
+
+@dataclass
+class _ModelBatches:
+    """Images from many items waiting for the caption and embedding models.
+
+    An item goes on to the writer, and its images back to the frame budget,
+    once its last pending image is done.
+    """
+
+    documents: queue.Queue
+    frames: _FrameBudget
+    to_caption: list[tuple[PreparedItem, int]] = field(default_factory=list)
+    to_embed: list[tuple[PreparedItem, int]] = field(default_factory=list)
+    remaining: dict[int, int] = field(default_factory=dict)
+
+    def __bool__(self) -> bool:
+        """Whether any image is still waiting for a model."""
+        return bool(self.to_caption or self.to_embed)
+
+    def add(self, item: PreparedItem, *, embed: bool) -> None:
+        """Queue the item's uncached images for captioning, and all to embed."""
+        misses = [i for i, caption in enumerate(item.captions) if caption is None]
+        embeds = list(range(len(item.images))) if embed else []
+        if not misses and not embeds:
+            self.send(item)
+            return
+        self.remaining[id(item)] = len(misses) + len(embeds)
+        self.to_caption.extend((item, i) for i in misses)
+        self.to_embed.extend((item, i) for i in embeds)
+
+    @staticmethod
+    def take(
+        pending: list[tuple[PreparedItem, int]], size: int,
+    ) -> list[tuple[PreparedItem, int]]:
+        """Remove and return up to ``size`` images from the front of ``pending``."""
+        batch, pending[:size] = pending[:size], []
+        return batch
+
+    def finish(self, item: PreparedItem) -> None:
+        """Count one image of ``item`` as done."""
+        self.remaining[id(item)] -= 1
+        if self.remaining[id(item)] == 0:
+            del self.remaining[id(item)]
+            self.send(item)
+
+    def send(self, item: PreparedItem) -> None:
+        """Drop the item's images and hand it to the writer."""
+        self.frames.release(len(item.images))
+        item.images = []
+        self.documents.put(item)
+
+
+class IndexingPipeline:
+    """Run decode, caption and write stages concurrently over a set of files.
+
+    When ``embed`` is given, the model stage also batches every image through
+    it, and the writer stage publishes one vector per indexed document (an
+    image or a video frame) to the vector store.
+    """
+
+    def __init__(
+        self,
+        prepare: Callable[[Path], PreparedItem],
+        workers: int = PIPELINE_WORKERS,
+        queue_depth: int = PIPELINE_QUEUE_DEPTH,
+        batch_size: int = CAPTION_BATCH_SIZE,
+        embed: Callable[[list[Image.Image]], np.ndarray] | None = None,
+    ) -> None:
+        """Initialize the pipeline with the per-file ``prepare`` function."""
+        self.prepare = prepare
+        self.embed = embed
+        self.workers = max(workers, 1)
+        self.queue_depth = max(queue_depth, 1)
+        self.batch_size = max(batch_size, 1)
+        self._stop = threading.Event()
+        self._failed: list[str] = []
+        self._writer_errors: list[Exception] = []
+        self._frame_budget = _FrameBudget(PIPELINE_QUEUE_FRAMES)
+        self._captioned = 0
+        self._caption_seconds = 0.0
+
+    def run(
+        self,
+        ix: Index,
+        paths: list[Path],
+        deleted: list[str],
+        vectors: VectorStoreWriter | None = None,
+        *,
+        merge: bool = True,
+    ) -> list[str]:
+        """Index ``paths``, remove ``deleted`` file paths and commit once.
+
+        ``merge=False`` writes the commit as a new segment without merging
+        small segments into it. Returns the file paths that could not be
+        prepared and were skipped.
+        """
+        prepared: queue.Queue = queue.Queue(maxsize=self.queue_depth)
+        documents: queue.Queue = queue.Queue(maxsize=self.queue_depth)
+        self._writer_errors = []
+
+        writer_thread = threading.Thread(
+            target=self._write,
+            args=(ix, documents, deleted, vectors),
+            kwargs={"merge": merge},
+            name="index-writer",
+        )
+        writer_thread.start()
+        self._stop.clear()
+        self._failed = []
+        self._frame_budget = _FrameBudget(PIPELINE_QUEUE_FRAMES)
+        self._captioned = 0
+        self._caption_seconds = 0.0
+        try:
+            with ThreadPoolExecutor(
+                max_workers=self.workers, thread_name_prefix="index-decode",
+            ) as executor:
+                for path in paths:
+                    executor.submit(self._decode, path, prepared)
+                try:
+                    self._caption(len(paths), prepared, documents)
+                except BaseException:
+                    self._stop.set()  # Release decode workers blocked on the queue
+                    raise
+        finally:
+            documents.put(_DONE)
+            writer_thread.join()
+        if caption_cache is not None:
+            caption_cache.log_stats()
+        if self._captioned:
+            logger.info(
+                f"Captioned {self._captioned} images in "
+                f"{self._caption_seconds:.1f}s of model time "
+                f"({self._captioned / self._caption_seconds:.1f} captions/s)",
+            )
+        if self._writer_errors:
+            raise self._writer_errors[0]
+        return self._failed
+
+    def _decode(self, path: Path, prepared: queue.Queue) -> None:
+        """Decode stage: prepare one file and hand it to the caption stage."""
+        if self._stop.is_set():
+            return
+        try:
+            started = time.perf_counter()
+            with profiler.track("indexing", str(path)):
+                item = self.prepare(path)
+            INDEXING_DECODE_SECONDS.labels(item.fields["media_type"]).observe(
+                time.perf_counter() - started,
+            )
+            item.cache_keys = [caption_cache_key(image) for image in item.images]
+            item.captions = lookup_cached_captions(item.cache_keys)
+            item.embeddings = [None] * len(item.images)
+        except Exception as e:  # noqa: BLE001 - a lost item would stall the queue
+            logger.error(f"Error preparing {path}, skipping it: {e}")
+            self._failed.append(str(path))
+            INDEXING_FILES.labels("failed").inc()
+            item = _SKIPPED
+        if item is not _SKIPPED and not self._frame_budget.acquire(
+            len(item.images), self._stop,
+        ):
+            return
+        while not self._stop.is_set():
+            try:
+                prepared.put(item, timeout=FLUSH_TIMEOUT)
+            except queue.Full:
+                continue
+            return
+
+    def _caption(
+        self, expected: int, prepared: queue.Queue, documents: queue.Queue,
+    ) -> None:
+        """Model stage: pack images from many items into full batches.
+
+        Only images whose caption was not cached are captioned; every image
+        is embedded when an embedding function is configured.
+        """
+        batches = _ModelBatches(documents, self._frame_budget)
+        received = 0
+        while received < expected or batches:
+            item = None
+            if received < expected:
+                try:
+                    item = prepared.get(timeout=FLUSH_TIMEOUT if batches else None)
+                except queue.Empty:
+                    item = None
+            if item is not None:
+                received += 1
+                if item is _SKIPPED:
+                    continue
+                batches.add(item, embed=self.embed is not None)
+            # Run full batches now, and partial ones once the queue goes quiet
+            self._run_batches(batches, partial=item is None)
+
+    def _run_batches(self, batches: _ModelBatches, *, partial: bool) -> None:
+        """Run every full batch, and the remainder too when ``partial``."""
+        while len(batches.to_caption) >= self.batch_size or (
+            partial and batches.to_caption
+        ):
+            batch = batches.take(batches.to_caption, self.batch_size)
+            captions = self._caption_images(batch)
+            for (item, i), caption in zip(batch, captions, strict=True):
+                item.captions[i] = caption
+                batches.finish(item)
+        while len(batches.to_embed) >= self.batch_size or (
+            partial and batches.to_embed
+        ):
+            batch = batches.take(batches.to_embed, self.batch_size)
+            vectors = self._embed_images(batch)
+            for (item, i), vector in zip(batch, vectors, strict=True):
+                item.embeddings[i] = vector
+                batches.finish(item)
+
+    def _caption_images(self, batch: list[tuple[PreparedItem, int]]) -> list[str]:
+        """Caption one batch and cache the captions."""
+        started = time.perf_counter()
+        try:
+            captions = caption_batch([item.images[i] for item, i in batch])
+        except (AttributeError, KeyError, RuntimeError) as e:
+            logger.error(f"Error captioning batch: {e}")
+            return [NO_DESCRIPTION] * len(batch)
+        self._record_model_batch("caption", len(batch), time.perf_counter() - started)
+        store_cached_captions([item.cache_keys[i] for item, i in batch], captions)
+        return captions
+
+    def _embed_images(
+        self, batch: list[tuple[PreparedItem, int]],
+    ) -> list[np.ndarray | None]:
+        """Embed one batch, or return no vectors if the model fails."""
+        started = time.perf_counter()
+        try:
+            vectors = list(self.embed([item.images[i] for item, i in batch]))
+        except (AttributeError, KeyError, RuntimeError) as e:
+            logger.error(f"Error embedding batch: {e}")
+            return [None] * len(batch)
+        self._record_model_batch("embed", len(batch), time.perf_counter() - started)
+        return vectors
+
+    def _record_model_batch(self, task: str, images: int, elapsed: float) -> None:
+        """Record one successful model batch in the metrics and the run totals."""
+        INDEXING_MODEL_SECONDS.labels(task).observe(elapsed)
+        INDEXING_MODEL_IMAGES.labels(task).inc(images)
+        if task == "caption":
+            self._captioned += images
+            self._caption_seconds += elapsed
+
+    def _write(
+        self,
+        ix: Index,
+        documents: queue.Queue,
+        deleted: list[str],
+        vectors: VectorStoreWriter | None,
+        *,
+        merge: bool,
+    ) -> None:
+        """Write stage: the only owner of the Whoosh and vector store writers."""
+        writer = item = None
+        written = 0
+        try:
+            writer = ix.writer()
+            for path_key in deleted:
+                self._remove(writer, vectors, path_key)
+                logger.info(f"Removed deleted media from index: {path_key}")
+            INDEXING_FILES.labels("removed").inc(len(deleted))
+            while (item := documents.get()) is not _DONE:
+                self._add(writer, vectors, item)
+                written += 1
+            if written or deleted:
+                with INDEXING_COMMIT_SECONDS.labels("whoosh").time():
+                    writer.commit(merge=merge)
+            else:
+                writer.cancel()
+            if vectors is not None:
+                with INDEXING_COMMIT_SECONDS.labels("vectors").time():
+                    vectors.commit()
+            INDEXING_FILES.labels("indexed").inc(written)
+        except Exception as e:  # noqa: BLE001 - re-raised by run() after join
+            self._writer_errors.append(e)
+            if writer is not None and not writer.is_closed:
+                writer.cancel()
+            # Keep draining so the model stage never blocks on a full queue
+            while item is not _DONE:
+                item = documents.get()
+
+    @staticmethod
+    def _remove(
+        writer: IndexWriter, vectors: VectorStoreWriter | None, path_key: str,
+    ) -> None:
+        """Delete every document and vector of one file.
+
+        Video frames are found through ``video_path``, since their offsets
+        may differ from one version of the file to the next.
+        """
+        writer.delete_by_term("file_path", path_key)
+        writer.delete_by_term("video_path", path_key)
+        if vectors is not None:
+            vectors.delete(path_key)
+
+    def _add(
+        self,
+        writer: IndexWriter,
+        vectors: VectorStoreWriter | None,
+        item: PreparedItem,
+    ) -> None:
+        """Replace the documents and vectors of one file with ``item``'s."""
+        path_key = item.fields["file_path"]
+        self._remove(writer, vectors, path_key)
+        for document in item.to_documents():
+            writer.add_document(**document)
+        if vectors is not None:
+            for document_id, vector in item.to_vectors():
+                vectors.upsert(
+                    document_id,
+                    vector,
+                    item.fields["media_type"],
+                    item.fields["date"],
+                )
+        logger.info(f"Indexed media: {path_key}")
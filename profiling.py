@@ -0,0 +1,290 @@
+"""Stack-sampling profiler that keeps traces of slow searches and indexed files.
+
+While enabled, a background thread samples the stack of every thread that
+is inside a tracked search or file decode, every ``interval_ms``. When the
+tracked call finishes under its latency threshold, its samples are thrown
+away. When it is slower, they are written to ``folder`` as collapsed stacks:
+one ``frame;frame;frame count`` line per distinct stack, with the request as
+the root frame. ``flamegraph.pl``, speedscope and inferno read this format
+directly. Only the newest ``max_files`` traces are kept.
+
+The profiler is switched at runtime through ``/admin/profiler``. The switch
+is stored in a state file beside the traces. Every process, including
+other API workers and ``ingest.py``, re-reads it at most once per
+``STATE_CHECK_INTERVAL`` seconds. While disabled, a tracked call costs one
+clock read and a comparison.
+"""
+
+from __future__ import annotations
+
+import json
+import os
+import re
+import secrets
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import AbstractContextManager, nullcontext
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import TYPE_CHECKING, Any
+
+from loguru import logger
+
+from settings import get_section
+
+if TYPE_CHECKING:
+    from types import CodeType
+
+PROFILING_CONFIG = get_section("profiling")
+PROFILE_FOLDER = Path(PROFILING_CONFIG.get("folder", "cache/profiles"))
+PROFILE_MAX_FILES = PROFILING_CONFIG.get("max_files", 100)
+SAMPLE_INTERVAL_MS = PROFILING_CONFIG.get("interval_ms", 5)
+# Token required by the admin endpoints in an X-Admin-Token header. While it
+# is empty the endpoints refuse every call, since they reach every process.
+ADMIN_TOKEN = PROFILING_CONFIG.get("admin_token", "")
+STATE_CHECK_INTERVAL = 1.0  # Seconds between reads of the shared state file
+STATE_FILE = "state.json"
+PROFILE_SUFFIX = ".collapsed"
+_UNSAFE_FRAME_CHARACTERS = re.compile(r"[;\r\n]")
+
+_NOT_TRACKED = nullcontext()
+
+
+def admin_denial(token: str | None) -> str | None:
+    """Return why an admin call carrying ``token`` is refused, or ``None``."""
+    if not ADMIN_TOKEN:
+        return "Admin endpoints are disabled until [profiling] admin_token is set"
+    if not secrets.compare_digest(token or "", ADMIN_TOKEN):
+        return "Invalid admin token"
+    return None
+
+
+@dataclass
+class ProfilerState:
+    """The runtime switch and thresholds shared by every process."""
+
+    enabled: bool = PROFILING_CONFIG.get("enabled", False)
+    search_threshold_ms: float = PROFILING_CONFIG.get("search_threshold_ms", 500.0)
+    indexing_threshold_ms: float = PROFILING_CONFIG.get(
+        "indexing_threshold_ms", 5000.0,
+    )
+
+    def threshold_ms(self, kind: str) -> float:
+        """Return the latency above which a ``kind`` call is kept."""
+        return (
+            self.search_threshold_ms if kind == "search"
+            else self.indexing_threshold_ms
+        )
+
+
+@dataclass
+class _Tracked:
+    """One call being sampled."""
+
+    kind: str
+    label: str
+    started: float
+    samples: Counter[str] = field(default_factory=Counter)
+
+
+class _Track(AbstractContextManager):
+    """Context manager registering the calling thread with the sampler."""
+
+    def __init__(self, profiler: SlowRequestProfiler, kind: str, label: str) -> None:
+        """Remember what to register on entry."""
+        self.profiler = profiler
+        self.kind = kind
+        self.label = label
+
+    def __enter__(self) -> None:
+        """Start sampling the calling thread."""
+        self.profiler.begin(self.kind, self.label)
+
+    def __exit__(self, *_exc_info: object) -> None:
+        """Stop sampling and save the trace if the call was slow."""
+        self.profiler.end()
+
+
+class SlowRequestProfiler:
+    """Sample tracked calls and keep the stacks of those over the threshold."""
+
+    def __init__(
+        self,
+        folder: Path = PROFILE_FOLDER,
+        max_files: int = PROFILE_MAX_FILES,
+        interval_ms: float = SAMPLE_INTERVAL_MS,
+    ) -> None:
+        """Initialize the profiler; nothing is sampled until it is enabled."""
+        self.folder = folder
+        self.max_files = max(max_files, 1)
+        self.interval = interval_ms / 1000
+        self._state = ProfilerState()
+        self._checked_at = -STATE_CHECK_INTERVAL
+        self._state_mtime = 0
+        self._lock = threading.Lock()
+        self._tracked: dict[int, _Tracked] = {}
+        self._labels: dict[CodeType, str] = {}
+        self._sampler: threading.Thread | None = None
+
+    @property
+    def state(self) -> ProfilerState:
+        """The current state, re-read from disk at most once per interval."""
+        now = time.monotonic()
+        if now - self._checked_at >= STATE_CHECK_INTERVAL:
+            self._checked_at = now
+            self._load_state()
+        return self._state
+
+    def _load_state(self) -> None:
+        """Adopt the shared state file if another process changed it."""
+        path = self.folder / STATE_FILE
+        try:
+            mtime = path.stat().st_mtime_ns
+            if mtime == self._state_mtime:
+                return
+            self._state_mtime = mtime  # Warn about a bad file only once
+            self._state = ProfilerState(**json.loads(path.read_text("utf-8")))
+        except FileNotFoundError:
+            return
+        except (OSError, TypeError, ValueError) as e:
+            logger.warning(f"Ignoring unreadable profiler state {path}: {e}")
+
+    def configure(
+        self,
+        *,
+        enabled: bool | None = None,
+        search_threshold_ms: float | None = None,
+        indexing_threshold_ms: float | None = None,
+    ) -> ProfilerState:
+        """Update the switch or thresholds for every process and return them."""
+        state = self.state
+        updates = {
+            "enabled": enabled,
+            "search_threshold_ms": search_threshold_ms,
+            "indexing_threshold_ms": indexing_threshold_ms,
+        }
+        state = ProfilerState(**{
+            **asdict(state),
+            **{key: value for key, value in updates.items() if value is not None},
+        })
+        self.folder.mkdir(parents=True, exist_ok=True)
+        path = self.folder / STATE_FILE
+        tmp_path = path.with_suffix(f".{os.getpid()}.tmp")
+        tmp_path.write_text(json.dumps(asdict(state)), encoding="utf-8")
+        tmp_path.replace(path)
+        self._state = state
+        self._state_mtime = path.stat().st_mtime_ns
+        logger.info(f"Slow request profiler set to {state}")
+        return state
+
+    def track(self, kind: str, label: str) -> AbstractContextManager:
+        """Return a context manager that profiles the enclosed call if slow.
+
+        ``kind`` is ``"search"`` or ``"indexing"`` and selects the
+        threshold; ``label`` becomes the root frame of the saved stacks.
+        """
+        if not self.state.enabled:
+            return _NOT_TRACKED
+        return _Track(self, kind, label)
+
+    def begin(self, kind: str, label: str) -> None:
+        """Start sampling the calling thread."""
+        tracked = _Tracked(kind, label, time.perf_counter())
+        with self._lock:
+            self._tracked[threading.get_ident()] = tracked
+            if self._sampler is None:
+                self._sampler = threading.Thread(
+                    target=self._sample_loop, name="profiler", daemon=True,
+                )
+                self._sampler.start()
+
+    def end(self) -> None:
+        """Stop sampling the calling thread and save its stacks if it was slow."""
+        with self._lock:
+            tracked = self._tracked.pop(threading.get_ident(), None)
+        if tracked is None:
+            return
+        elapsed_ms = (time.perf_counter() - tracked.started) * 1000
+        if elapsed_ms >= self.state.threshold_ms(tracked.kind) and tracked.samples:
+            try:
+                self._save(tracked, elapsed_ms)
+            except OSError as e:
+                logger.warning(f"Could not save profile of {tracked.label}: {e}")
+
+    def _frame_label(self, code: CodeType) -> str:
+        """Return ``function (file:line)`` for a code object, memoized."""
+        label = self._labels.get(code)
+        if label is None:
+            filename = Path(code.co_filename).name
+            label = self._labels[code] = (
+                f"{code.co_name} ({filename}:{code.co_firstlineno})"
+            )
+        return label
+
+    def _sample_loop(self) -> None:
+        """Sample tracked threads until profiling is switched off."""
+        while self.state.enabled:
+            time.sleep(self.interval)
+            with self._lock:
+                if not self._tracked:
+                    continue
+                frames = sys._current_frames()  # noqa: SLF001 - no public equivalent
+                for ident, tracked in self._tracked.items():
+                    frame = frames.get(ident)
+                    stack = []
+                    while frame is not None:
+                        stack.append(self._frame_label(frame.f_code))
+                        frame = frame.f_back
+                    stack.reverse()
+                    tracked.samples[";".join(stack)] += 1
+        with self._lock:
+            self._sampler = None
+            self._tracked.clear()
+
+    def _save(self, tracked: _Tracked, elapsed_ms: float) -> None:
+        """Write one collapsed-stack trace and drop the oldest beyond the limit."""
+        self.folder.mkdir(parents=True, exist_ok=True)
+        root = _UNSAFE_FRAME_CHARACTERS.sub(" ", f"{tracked.kind} {tracked.label}")
+        name = (
+            f"{time.time_ns() // 1_000_000}-{tracked.kind}-"
+            f"{elapsed_ms:.0f}ms-{os.getpid()}{PROFILE_SUFFIX}"
+        )
+        (self.folder / name).write_text(
+            "".join(
+                f"{root};{stack} {count}\n"
+                for stack, count in tracked.samples.most_common()
+            ),
+            encoding="utf-8",
+        )
+        for old in self.profiles()[self.max_files:]:
+            (self.folder / old).unlink(missing_ok=True)
+        logger.info(
+            f"Saved profile of slow {tracked.kind} {tracked.label!r} "
+            f"({elapsed_ms:.0f} ms) to {self.folder / name}",
+        )
+
+    def profiles(self) -> list[str]:
+        """Return saved trace file names, newest first."""
+        try:
+            names = [
+                entry.name for entry in os.scandir(self.folder)
+                if entry.name.endswith(PROFILE_SUFFIX)
+            ]
+        except FileNotFoundError:
+            return []
+        return sorted(names, key=lambda name: int(name.split("-", 1)[0]), reverse=True)
+
+    def read_profile(self, name: str) -> str | None:
+        """Return the collapsed stacks saved as ``name``, or ``None``."""
+        if name not in self.profiles():  # Only names we wrote, never a path
+            return None
+        return (self.folder / name).read_text(encoding="utf-8")
+
+    def describe(self) -> dict[str, Any]:
+        """Return the state and saved traces, for the admin endpoints."""
+        return {**asdict(self.state), "profiles": self.profiles()}
+
+
+profiler = SlowRequestProfiler()
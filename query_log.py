@@ -0,0 +1,53 @@
+"""Optional JSONL log of incoming searches, for replaying real traffic.
+
+Set ``[search] query_log`` to a file path and every search the APIs receive
+is appended to it as one JSON object per line::
+
+    {"timestamp": 1718000000.123, "query": "dog NOT beach", "file_type":
+     "image", "mode": "keyword", "start_date": null, "end_date": null}
+
+``locustfile.ReplayUser`` replays such a file with its recorded query mix
+and arrival times. Logging is off by default.
+"""
+
+from __future__ import annotations
+
+import json
+import threading
+import time
+from pathlib import Path
+from typing import TYPE_CHECKING
+
+from settings import get_section
+
+if TYPE_CHECKING:
+    from datetime import datetime
+
+QUERY_LOG_PATH = get_section("search").get("query_log", "")
+
+_lock = threading.Lock()
+
+
+def record_search(
+    query: str,
+    file_type: str | None,
+    mode: str,
+    start_date: datetime | None = None,
+    end_date: datetime | None = None,
+) -> None:
+    """Append one search to the query log, if one is configured."""
+    if not QUERY_LOG_PATH:
+        return
+    line = json.dumps({
+        "timestamp": time.time(),
+        "query": query,
+        "file_type": file_type,
+        "mode": mode,
+        "start_date": start_date.isoformat() if start_date else None,
+        "end_date": end_date.isoformat() if end_date else None,
+    })
+    path = Path(QUERY_LOG_PATH)
+    with _lock:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with path.open("a", encoding="utf-8") as log_file:
+            log_file.write(line + "\n")
@@ -0,0 +1,94 @@
+"""Fuse ranked candidate lists from several retrievers into one ranking.
+
+Every fused hit carries a score breakdown: the raw score and 1-based rank
+from each retriever that returned it, plus the ``fused`` score it was
+sorted by. Retrievers that did not return a document leave its keys out.
+Video hits also carry the offsets, in seconds, of their best-matching
+frames.
+"""
+
+from __future__ import annotations
+
+from settings import get_section
+
+HYBRID_CONFIG = get_section("hybrid")
+FUSION_METHOD = HYBRID_CONFIG.get("fusion", "rrf")  # "rrf" or "weighted"
+RRF_K = HYBRID_CONFIG.get("rrf_k", 60)  # Reciprocal-rank fusion damping constant
+FUSION_WEIGHTS = {
+    "keyword": HYBRID_CONFIG.get("keyword_weight", 0.5),
+    "semantic": HYBRID_CONFIG.get("semantic_weight", 0.5),
+}
+FUSION_METHODS = ("rrf", "weighted")
+
+# (file_path, description, score, frame offsets)
+Hit = tuple[str, str, float, list[float]]
+# (file_path, description, scores, frame offsets)
+ScoredHit = tuple[str, str, dict[str, float], list[float]]
+
+
+def with_breakdown(name: str, hits: list[Hit]) -> list[ScoredHit]:
+    """Attach a single-retriever breakdown to ``hits`` without re-ranking."""
+    return [
+        (
+            path,
+            description,
+            {name: score, f"{name}_rank": rank, "fused": score},
+            offsets,
+        )
+        for rank, (path, description, score, offsets) in enumerate(hits, start=1)
+    ]
+
+
+def normalized_scores(hits: list[Hit]) -> list[float]:
+    """Min-max scale the scores of one ranking to ``[0, 1]``."""
+    scores = [score for _, _, score, _ in hits]
+    low, high = min(scores), max(scores)
+    if high == low:
+        return [1.0] * len(scores)
+    return [(score - low) / (high - low) for score in scores]
+
+
+def fuse_rankings(
+    rankings: dict[str, list[Hit]],
+    limit: int,
+    method: str = FUSION_METHOD,
+    weights: dict[str, float] | None = None,
+    rrf_k: int = RRF_K,
+) -> list[ScoredHit]:
+    """Merge the rankings of several retrievers, best first.
+
+    ``rrf`` adds ``1 / (rrf_k + rank)`` per retriever and ignores raw
+    scores, so BM25 and cosine scales never have to be reconciled.
+    ``weighted`` min-max normalises each retriever's scores over its own
+    candidates and adds them with ``weights``, which lets a strong match in
+    one retriever outweigh mediocre ranks in the other. Frame offsets from
+    every retriever are merged, in the order the retrievers are given.
+    """
+    if method not in FUSION_METHODS:
+        msg = f"Unknown fusion method {method!r}, expected one of {FUSION_METHODS}"
+        raise ValueError(msg)
+    weights = FUSION_WEIGHTS if weights is None else weights
+    breakdowns: dict[str, dict[str, float]] = {}
+    descriptions: dict[str, str] = {}
+    offsets: dict[str, dict[float, None]] = {}
+    for name, hits in rankings.items():
+        if not hits:
+            continue
+        normalized = normalized_scores(hits) if method == "weighted" else None
+        for rank, (path, description, score, frames) in enumerate(hits, start=1):
+            scores = breakdowns.setdefault(path, {"fused": 0.0})
+            scores[name] = score
+            scores[f"{name}_rank"] = rank
+            if normalized is None:
+                scores["fused"] += 1.0 / (rrf_k + rank)
+            else:
+                scores["fused"] += weights.get(name, 1.0) * normalized[rank - 1]
+            descriptions.setdefault(path, description)
+            offsets.setdefault(path, {}).update(dict.fromkeys(frames))
+    best = sorted(
+        breakdowns.items(), key=lambda item: item[1]["fused"], reverse=True,
+    )[:limit]
+    return [
+        (path, descriptions[path], scores, list(offsets[path]))
+        for path, scores in best
+    ]
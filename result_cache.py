@@ -0,0 +1,154 @@
+"""LRU cache of search results with TTL and index-version invalidation."""
+
+from __future__ import annotations
+
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import TYPE_CHECKING, Any
+
+from metrics import RESULT_CACHE_EVENTS
+from settings import get_section
+from text_analysis import normalize_terms
+
+if TYPE_CHECKING:
+    from datetime import datetime
+
+SEARCH_CONFIG = get_section("search")
+RESULT_CACHE_SIZE = SEARCH_CONFIG.get("result_cache_size", 1024)
+RESULT_CACHE_TTL = SEARCH_CONFIG.get("result_cache_ttl", 60.0)  # Seconds
+
+QUERY_OPERATORS = {"AND", "OR", "NOT", "ANDNOT", "ANDMAYBE"}
+# Queries of bare words and operators, without fields, phrases or wildcards
+PLAIN_QUERY = re.compile(r"[\w\s]*")
+
+# Prometheus counters mirroring ResultCache's own, bound once per event
+CACHE_HITS = RESULT_CACHE_EVENTS.labels("hit")
+CACHE_MISSES = RESULT_CACHE_EVENTS.labels("miss")
+CACHE_EVICTIONS = RESULT_CACHE_EVENTS.labels("eviction")
+CACHE_EXPIRATIONS = RESULT_CACHE_EVENTS.labels("expiration")
+CACHE_INVALIDATIONS = RESULT_CACHE_EVENTS.labels("invalidation")
+
+
+def normalize_query(query: str) -> str:
+    """Lower-case terms and collapse whitespace, keeping operators intact."""
+    return " ".join(
+        token if token in QUERY_OPERATORS else token.lower()
+        for token in query.split()
+    )
+
+
+def analyze_query(query: str) -> str:
+    """Reduce a plain keyword query to the terms Whoosh will search for.
+
+    "Dogs AND the cat" becomes "dog AND cat", the same terms the caption
+    analyzer produces, so queries that only differ in inflection or stop
+    words share a cache entry. Queries using any other syntax are only
+    normalized, since their terms are not analyzed the same way.
+    """
+    if not PLAIN_QUERY.fullmatch(query):
+        return normalize_query(query)
+    terms = []
+    for token in query.split():
+        terms.extend([token] if token in QUERY_OPERATORS else normalize_terms(token))
+    return " ".join(terms)
+
+
+def result_cache_key(
+    query: str,
+    file_type: str | None,
+    start_date: datetime | None,
+    end_date: datetime | None,
+    mode: str = "keyword",
+) -> tuple:
+    """Build the cache key for one search call.
+
+    Keyword searches are keyed by their analyzed terms. Semantic and hybrid
+    searches embed the query text itself, so they keep its wording.
+    """
+    key = analyze_query(query) if mode == "keyword" else normalize_query(query)
+    return (key, file_type, start_date, end_date, mode)
+
+
+class ResultCache:
+    """Thread-safe LRU of search results, flushed when the index changes."""
+
+    def __init__(
+        self, max_entries: int = RESULT_CACHE_SIZE, ttl: float = RESULT_CACHE_TTL,
+    ) -> None:
+        """Initialize an empty cache."""
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+        self._entries: OrderedDict[tuple, tuple[float, list]] = OrderedDict()
+        self._version: Any = None
+        self._lock = threading.Lock()
+
+    def _check_version(self, version: object) -> None:
+        """Drop every entry if the index version moved. Caller holds the lock."""
+        if version != self._version:
+            if self._entries:
+                self.invalidations += 1
+                CACHE_INVALIDATIONS.inc()
+                self._entries.clear()
+            self._version = version
+
+    def get(self, key: tuple, version: object) -> list | None:
+        """Return a copy of the cached results for ``key``, or ``None``."""
+        with self._lock:
+            self._check_version(version)
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                CACHE_MISSES.inc()
+                return None
+            stored_at, results = entry
+            if time.monotonic() - stored_at > self.ttl:
+                del self._entries[key]
+                self.expirations += 1
+                self.misses += 1
+                CACHE_EXPIRATIONS.inc()
+                CACHE_MISSES.inc()
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            CACHE_HITS.inc()
+            return list(results)
+
+    def put(self, key: tuple, version: object, results: list) -> None:
+        """Store ``results`` for ``key`` as computed against ``version``."""
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            self._check_version(version)
+            self._entries[key] = (time.monotonic(), list(results))
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+                CACHE_EVICTIONS.inc()
+
+    def clear(self) -> None:
+        """Drop every cached entry."""
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict[str, float]:
+        """Return hit ratio, size and eviction counters."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "invalidations": self.invalidations,
+            }
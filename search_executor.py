@@ -0,0 +1,84 @@
+"""Bounded thread pool that keeps blocking searches off the event loop.
+
+Whoosh searches and the vector scan are synchronous and touch the disk, so
+the async API handlers hand them to this executor instead of running them
+on the event loop. At most ``workers`` searches run at once and at most
+``queue_depth`` more wait for a thread. Anything beyond that is rejected
+straight away with ``SearchQueueFullError``, which the APIs turn into a 503,
+so an overloaded server sheds load instead of queueing requests until they
+time out.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import TYPE_CHECKING, ParamSpec, TypeVar
+
+from settings import get_section
+
+if TYPE_CHECKING:
+    from collections.abc import Callable
+
+SEARCH_CONFIG = get_section("search")
+EXECUTOR_WORKERS = SEARCH_CONFIG.get("executor_workers", 8)
+EXECUTOR_QUEUE_DEPTH = SEARCH_CONFIG.get("executor_queue_depth", 64)
+RETRY_AFTER_SECONDS = 1  # Suggested client back-off when the queue is full
+
+P = ParamSpec("P")
+T = TypeVar("T")
+
+
+class SearchQueueFullError(RuntimeError):
+    """Raised when every worker is busy and the wait queue is full."""
+
+
+class BoundedSearchExecutor:
+    """Run blocking calls on a fixed pool with a bounded wait queue."""
+
+    def __init__(
+        self,
+        workers: int = EXECUTOR_WORKERS,
+        queue_depth: int = EXECUTOR_QUEUE_DEPTH,
+    ) -> None:
+        """Initialize the pool; threads are started on first use."""
+        self.workers = max(workers, 1)
+        self.queue_depth = max(queue_depth, 0)
+        self.rejected = 0
+        self._slots = threading.BoundedSemaphore(self.workers + self.queue_depth)
+        self._executor = ThreadPoolExecutor(
+            max_workers=self.workers, thread_name_prefix="search",
+        )
+
+    async def run(
+        self, func: Callable[P, T], *args: P.args, **kwargs: P.kwargs,
+    ) -> T:
+        """Run ``func`` on the pool and await its result.
+
+        Raises ``SearchQueueFullError`` without waiting if there is no free
+        worker or queue slot.
+        """
+        if not self._slots.acquire(blocking=False):
+            self.rejected += 1
+            msg = "Search queue is full, retry later"
+            raise SearchQueueFullError(msg)
+        try:
+            future = self._executor.submit(partial(func, *args, **kwargs))
+        except BaseException:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        return await asyncio.wrap_future(future)
+
+    def stats(self) -> dict[str, int]:
+        """Return pool size, queue bound and how many calls were rejected."""
+        return {
+            "workers": self.workers,
+            "queue_depth": self.queue_depth,
+            "rejected": self.rejected,
+        }
+
+
+search_executor = BoundedSearchExecutor()
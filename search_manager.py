@@ -0,0 +1,109 @@
+"""Long-lived Whoosh searchers and query parsers shared across requests.
+
+Opening a searcher reads the TOC and opens every segment, and building a
+``QueryParser`` instantiates its whole plugin chain, so doing both per request
+dominates the cost of small searches. ``SearcherManager`` keeps one searcher
+and one set of parsers per worker thread and only refreshes a searcher when
+the index has actually changed on disk.
+"""
+
+from __future__ import annotations
+
+import threading
+import time
+from pathlib import Path
+from typing import TYPE_CHECKING
+
+from whoosh.qparser import AndGroup, OrGroup, QueryParser
+
+from metrics import SEARCHER_REFRESHES
+from settings import get_section
+
+if TYPE_CHECKING:
+    from whoosh.index import FileIndex
+    from whoosh.searching import Searcher
+
+SEARCH_CONFIG = get_section("search")
+# Seconds between checks of the index TOC for new commits
+REFRESH_INTERVAL = SEARCH_CONFIG.get("refresh_interval", 1.0)
+
+PARSER_GROUPS = {"or": OrGroup, "and": AndGroup}
+
+
+class SearcherManager:
+    """Hand out per-thread searchers that follow the latest index commit."""
+
+    def __init__(
+        self, ix: FileIndex, refresh_interval: float = REFRESH_INTERVAL,
+    ) -> None:
+        """Initialize the manager for ``ix``."""
+        self.ix = ix
+        self.refresh_interval = refresh_interval
+        self.refresh_count = 0
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._version = self._read_version()
+        self._checked_at = time.monotonic()
+
+    def _read_version(self) -> tuple[int, int]:
+        """Return the latest generation and its TOC mtime.
+
+        A full rebuild restarts generations from zero, so the mtime is needed
+        to tell a rebuilt index apart from the one a searcher already holds.
+        """
+        generation = self.ix.latest_generation()
+        toc_name = f"_{self.ix.indexname}_{generation}.toc"
+        toc_path = Path(self.ix.storage.folder) / toc_name
+        try:
+            return generation, toc_path.stat().st_mtime_ns
+        except FileNotFoundError:
+            return generation, 0
+
+    @property
+    def version(self) -> tuple[int, int]:
+        """The index version, re-read at most once per ``refresh_interval``."""
+        now = time.monotonic()
+        if now - self._checked_at >= self.refresh_interval:
+            with self._lock:
+                if now - self._checked_at >= self.refresh_interval:
+                    self._version = self._read_version()
+                    self._checked_at = now
+        return self._version
+
+    def searcher(self) -> Searcher:
+        """Return this thread's searcher, refreshed if the index changed."""
+        version = self.version
+        searcher = getattr(self._local, "searcher", None)
+        if searcher is None:
+            searcher = self.ix.searcher()
+        elif self._local.version != version:
+            refreshed = searcher.refresh()
+            if refreshed is searcher:  # Same generation, but the index was rebuilt
+                searcher.close()
+                refreshed = self.ix.searcher()
+            searcher = refreshed
+            self._local.parsers = {}  # The schema may have changed with the index
+            with self._lock:
+                self.refresh_count += 1
+            SEARCHER_REFRESHES.inc()
+        self._local.searcher = searcher
+        self._local.version = version
+        return searcher
+
+    def parser(self, fieldname: str, group: str = "or") -> QueryParser:
+        """Return this thread's cached parser for ``fieldname`` and ``group``."""
+        parsers = getattr(self._local, "parsers", None)
+        if parsers is None:
+            parsers = self._local.parsers = {}
+        key = (fieldname, group)
+        if key not in parsers:
+            parsers[key] = QueryParser(
+                fieldname, self.ix.schema, group=PARSER_GROUPS[group],
+            )
+        return parsers[key]
+
+    def force_refresh(self) -> None:
+        """Re-read the index version now, e.g. right after a local commit."""
+        with self._lock:
+            self._version = self._read_version()
+            self._checked_at = time.monotonic()
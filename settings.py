@@ -0,0 +1,37 @@
+"""Access to the shared TOML configuration in ``config/config.toml``."""
+
+from __future__ import annotations
+
+import os
+import tomllib
+from functools import lru_cache
+from pathlib import Path
+from typing import Any
+
+from loguru import logger
+
+CONFIG_PATH = Path("config/config.toml")
+
+
+@lru_cache(maxsize=1)
+def load_config() -> dict[str, Any]:
+    """Load the TOML configuration once, falling back to defaults if absent."""
+    try:
+        with CONFIG_PATH.open("rb") as config_file:
+            return tomllib.load(config_file)
+    except FileNotFoundError:
+        logger.warning(f"Configuration file not found: {CONFIG_PATH}")
+    except tomllib.TOMLDecodeError as error:
+        logger.error(f"Failed to parse configuration file {CONFIG_PATH}: {error}")
+    return {}
+
+
+def get_section(name: str) -> dict[str, Any]:
+    """Return one table of the configuration, or an empty dict if missing."""
+    return load_config().get(name, {})
+
+
+def serving_workers() -> int:
+    """Return the number of API worker processes, one per core if set to 0."""
+    workers = get_section("serving").get("workers", 1)
+    return workers if workers > 0 else os.cpu_count() or 1
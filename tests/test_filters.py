@@ -0,0 +1,169 @@
+"""Keyword search ranks over filtered documents only.
+
+Most documents here outscore the eligible ones but fail the media type, date
+or ``NOT`` filter. If any filter were applied after the top-k cut, the
+search would come back short or out of order.
+"""
+
+from __future__ import annotations
+
+from datetime import UTC, datetime
+from typing import TYPE_CHECKING
+
+import pytest
+from whoosh import index
+from whoosh.query import Term
+
+import main
+from media_ids import frame_id
+from search_manager import SearcherManager
+
+if TYPE_CHECKING:
+    from pathlib import Path
+
+    from whoosh.index import FileIndex
+    from whoosh.writing import IndexWriter
+
+ELIGIBLE = 15  # More than SEARCH_LIMIT, so the cut has to pick the best ones
+DECOYS = 40  # Per filter, each scoring above every eligible document
+CAPTION_LENGTH = ELIGIBLE + DECOYS + 1
+IN_RANGE = datetime(2024, 6, 1, tzinfo=UTC)
+OUT_OF_RANGE = datetime(2020, 6, 1, tzinfo=UTC)
+START_DATE = datetime(2024, 1, 1, tzinfo=UTC)
+END_DATE = datetime(2024, 12, 31, tzinfo=UTC)
+
+
+def caption(dogs: int, extra: str = "park") -> str:
+    """Return a caption whose BM25 score for ``dog`` grows with ``dogs``.
+
+    Every caption has the same length, so length normalization cannot
+    reorder them.
+    """
+    return " ".join(["dog"] * dogs + [extra] * (CAPTION_LENGTH - dogs))
+
+
+def add_media(
+    writer: IndexWriter,
+    path: str,
+    media_type: str,
+    description: str,
+    date: datetime,
+) -> None:
+    """Add one image, or a video as a single frame one second in."""
+    if media_type == "video":
+        writer.add_document(
+            file_path=frame_id(path, 1.0),
+            video_path=path,
+            offset_seconds=1.0,
+            media_type=media_type,
+            description=description,
+            date=date,
+        )
+    else:
+        writer.add_document(
+            file_path=path, media_type=media_type, description=description, date=date,
+        )
+
+
+@pytest.fixture
+def filtered_index(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> FileIndex:
+    """Build a small index where most matches fail a filter, and search it."""
+    ix = index.create_in(tmp_path, main.schema)
+    writer = ix.writer()
+    for dogs in range(1, ELIGIBLE + 1):
+        add_media(writer, f"eligible/{dogs}.jpg", "image", caption(dogs), IN_RANGE)
+    for dogs in range(ELIGIBLE + 1, ELIGIBLE + 1 + DECOYS):
+        add_media(writer, f"video/{dogs}.mp4", "video", caption(dogs), IN_RANGE)
+        add_media(writer, f"old/{dogs}.jpg", "image", caption(dogs), OUT_OF_RANGE)
+        add_media(writer, f"cat/{dogs}.jpg", "image", caption(dogs, "cat"), IN_RANGE)
+    writer.commit()
+    monkeypatch.setattr(main, "searcher_manager", SearcherManager(ix))
+    return ix
+
+
+def test_top_k_under_heavy_filtering(filtered_index: FileIndex) -> None:
+    """Every filter applies before the cut, and scores stay plain BM25F."""
+    results, complete = main.search_index(
+        "dog NOT cat", "image", START_DATE, END_DATE,
+    )
+
+    expected = [
+        f"eligible/{dogs}.jpg"
+        for dogs in range(ELIGIBLE, ELIGIBLE - main.SEARCH_LIMIT, -1)
+    ]
+    assert complete
+    assert [path for path, _, _, _ in results] == expected
+
+    with filtered_index.searcher() as searcher:
+        unfiltered = {
+            hit["file_path"]: hit.score
+            for hit in searcher.search(Term("description", "dog"), limit=None)
+        }
+    scores = [scores["keyword"] for _, _, scores, _ in results]
+    assert scores == sorted(scores, reverse=True)
+    assert scores == pytest.approx([unfiltered[path] for path in expected])
+
+
+@pytest.fixture
+def dated_index(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> FileIndex:
+    """Index one dog on each side of and on both date bounds, plus videos."""
+    ix = index.create_in(tmp_path, main.schema)
+    writer = ix.writer()
+    add_media(writer, "before.jpg", "image", "dog", datetime(2023, 12, 31, tzinfo=UTC))
+    add_media(writer, "start.jpg", "image", "dog", START_DATE)
+    add_media(writer, "middle.jpg", "image", "dog", IN_RANGE)
+    add_media(writer, "end.jpg", "image", "dog", END_DATE)
+    add_media(writer, "after.jpg", "image", "dog", datetime(2025, 1, 1, tzinfo=UTC))
+    add_media(writer, "dog.mp4", "video", "dog", IN_RANGE)
+    add_media(writer, "cat.mp4", "video", "dog cat", IN_RANGE)
+    writer.commit()
+    monkeypatch.setattr(main, "searcher_manager", SearcherManager(ix))
+    return ix
+
+
+@pytest.mark.parametrize(
+    ("start_date", "end_date", "expected"),
+    [
+        (START_DATE, None, {"start.jpg", "middle.jpg", "end.jpg", "after.jpg"}),
+        (None, END_DATE, {"before.jpg", "start.jpg", "middle.jpg", "end.jpg"}),
+        (START_DATE, END_DATE, {"start.jpg", "middle.jpg", "end.jpg"}),
+        (END_DATE, END_DATE, {"end.jpg"}),
+    ],
+)
+@pytest.mark.usefixtures("dated_index")
+def test_date_range_bounds_are_inclusive(
+    start_date: datetime | None,
+    end_date: datetime | None,
+    expected: set[str],
+) -> None:
+    """Either bound may be left open, and both include media dated on them."""
+    results, _ = main.search_index("dog", "image", start_date, end_date)
+
+    assert {path for path, _, _, _ in results} == expected
+
+
+@pytest.mark.usefixtures("dated_index")
+def test_file_type_and_not_combine() -> None:
+    """A media type filter and a ``NOT`` exclusion both apply."""
+    results, _ = main.search_index("dog NOT cat", "video")
+
+    assert [(path, offsets) for path, _, _, offsets in results] == [
+        ("dog.mp4", [1.0]),
+    ]
+
+
+@pytest.mark.parametrize(
+    ("query", "expected"),
+    [
+        ("dog", ("dog", None)),
+        ("dog NOT cat", ("dog", "cat")),
+        ("brown dog NOT black cat", ("brown dog", "black cat")),
+        ("dog NOT cat NOT bird", ("dog", "cat NOT bird")),
+        ("dog NOT  ", ("dog", None)),
+        ("dog not cat", ("dog not cat", None)),  # Only upper-case NOT excludes
+        ("NOT cat", ("NOT cat", None)),  # Nothing to exclude from
+    ],
+)
+def test_split_exclusion(query: str, expected: tuple[str, str | None]) -> None:
+    """Only the first `` NOT `` splits, and an empty exclusion is dropped."""
+    assert main.split_exclusion(query) == expected
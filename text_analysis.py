@@ -0,0 +1,184 @@
+"""Caption and query analysis: lower-casing, stop words and lemmatization.
+
+The ``description`` field and the query parser share ``caption_analyzer``,
+so "dogs", "a dog" and "dog" all index and search as ``dog``. Plurals and
+verb forms are reduced with NLTK's WordNet lemmatizer when its data is
+installed (``python -m nltk.downloader wordnet omw-1.4``), otherwise nouns are
+singularized with ``inflect``. Every normalized term is memoized in an LRU
+cache, since captions and queries keep repeating the same few thousand words.
+"""
+
+from __future__ import annotations
+
+import re
+import threading
+from functools import lru_cache
+from typing import TYPE_CHECKING
+
+from loguru import logger
+from whoosh.analysis import (
+    STOP_WORDS,
+    Analyzer,
+    Filter,
+    LowercaseFilter,
+    RegexTokenizer,
+    StopFilter,
+    Token,
+)
+
+from settings import get_section
+
+if TYPE_CHECKING:
+    from collections.abc import Callable, Iterator
+
+ANALYSIS_CONFIG = get_section("analysis")
+LEMMATIZE = ANALYSIS_CONFIG.get("lemmatize", True)
+TERM_CACHE_SIZE = ANALYSIS_CONFIG.get("term_cache_size", 65536)
+# Whoosh's English stop words plus captioning filler such as BLIP's "arafed"
+CAPTION_STOP_WORDS = STOP_WORDS | frozenset(
+    ANALYSIS_CONFIG.get("extra_stop_words", ["arafed", "araffe"]),
+)
+MIN_TERM_LENGTH = 2
+# inflect strips a trailing "s" from words that are not plurals ("grass",
+# "bus", "tennis", "was", "its"), so the fallback leaves these alone. Its other
+# slips, like "canvas" to "canva", apply to captions and queries alike.
+NOT_PLURAL_ENDINGS = ("ss", "us", "is")
+SHORT_WORD_LENGTH = 3
+VERB_ENDINGS = ("ing", "ed")
+PLAIN_WORD = re.compile(r"\w+")
+
+_lock = threading.Lock()
+_lemmatizer: Callable[[str], str] | None = None
+_backend = "none"  # The loaded lemmatizer, see analyzer_backend
+
+
+def load_lemmatizer() -> Callable[[str], str]:
+    """Load the lemmatizer on first use, preferring WordNet if installed."""
+    global _lemmatizer, _backend  # noqa: PLW0603
+    with _lock:
+        if _lemmatizer is None:
+            _lemmatizer = _wordnet_lemmatizer()
+            _backend = "wordnet"
+        if _lemmatizer is None:
+            _lemmatizer = _inflect_singularizer()
+            _backend = "inflect"
+    return _lemmatizer
+
+
+def analyzer_backend() -> str:
+    """Return how terms are lemmatized: ``wordnet``, ``inflect`` or ``none``.
+
+    Indexes record this in their manifest. Terms analyzed with different
+    backends do not match, so queries must use the index's backend.
+    """
+    if not LEMMATIZE:
+        return "none"
+    load_lemmatizer()
+    return _backend
+
+
+def check_backend(indexed_backend: str | None) -> None:
+    """Log an error if queries here are analyzed unlike the index's captions."""
+    backend = analyzer_backend()
+    if indexed_backend is not None and backend != indexed_backend:
+        logger.error(
+            f"The index was built with the {indexed_backend} analyzer, but "
+            f"queries here use {backend}, so keyword searches will miss "
+            "matches. Align [analysis] lemmatize and the WordNet data with "
+            "the indexer's, or re-run the indexer with this setup.",
+        )
+
+
+def warm_up(indexed_backend: str | None = None) -> None:
+    """Start loading the lemmatizer on a background thread.
+
+    Importing inflect alone takes a couple of seconds. The APIs call this
+    when they start, so neither importing ``main`` nor the first search
+    waits for it; a search arriving earlier blocks until it is loaded. Once
+    loaded, it is checked against ``indexed_backend``, the backend recorded
+    in the index manifest.
+    """
+    threading.Thread(
+        target=check_backend,
+        args=(indexed_backend,),
+        name="lemmatizer-warmup",
+        daemon=True,
+    ).start()
+
+
+def _wordnet_lemmatizer() -> Callable[[str], str] | None:
+    """Return WordNet's lemmatizer, or ``None`` if its data is not installed."""
+    import nltk  # noqa: PLC0415
+    from nltk.stem import WordNetLemmatizer  # noqa: PLC0415
+
+    try:
+        nltk.data.find("corpora/wordnet")
+    except LookupError:
+        logger.warning(
+            "WordNet data not found, singularizing nouns with inflect; "
+            "install it with: python -m nltk.downloader wordnet omw-1.4",
+        )
+        return None
+    wordnet = WordNetLemmatizer()
+    wordnet.lemmatize("warmup")  # Load the corpus before threads share it
+    logger.info("Lemmatizing captions and queries with WordNet")
+
+    def lemmatize(word: str) -> str:
+        lemma = wordnet.lemmatize(word)
+        if lemma == word and word.endswith(VERB_ENDINGS):
+            lemma = wordnet.lemmatize(word, "v")
+        return lemma
+
+    return lemmatize
+
+
+def _inflect_singularizer() -> Callable[[str], str]:
+    """Return a noun singularizer built on inflect."""
+    import inflect  # noqa: PLC0415
+
+    engine = inflect.engine()
+
+    def singularize(word: str) -> str:
+        if word.endswith(NOT_PLURAL_ENDINGS) or (
+            len(word) <= SHORT_WORD_LENGTH and word.endswith("s")
+        ):
+            return word
+        return engine.singular_noun(word) or word
+
+    return singularize
+
+
+@lru_cache(maxsize=TERM_CACHE_SIZE)
+def normalize_term(term: str) -> str:
+    """Return the lemma of a lower-cased term, memoized."""
+    return load_lemmatizer()(term) if LEMMATIZE else term
+
+
+class LemmaFilter(Filter):
+    """Replace each token with its lemma, e.g. "dogs" with "dog"."""
+
+    def __call__(self, tokens: Iterator[Token]) -> Iterator[Token]:
+        """Normalize every token not already removed as a stop word."""
+        for token in tokens:
+            if not token.stopped:
+                token.text = normalize_term(token.text)
+            yield token
+
+
+def caption_analyzer() -> Analyzer:
+    """Build the analyzer shared by the ``description`` field and queries."""
+    return (
+        RegexTokenizer()
+        | LowercaseFilter()
+        | StopFilter(stoplist=CAPTION_STOP_WORDS, minsize=MIN_TERM_LENGTH)
+        | LemmaFilter()
+    )
+
+
+def normalize_terms(text: str) -> list[str]:
+    """Return the terms ``caption_analyzer`` would index for ``text``."""
+    return [
+        normalize_term(word)
+        for word in PLAIN_WORD.findall(text.lower())
+        if len(word) >= MIN_TERM_LENGTH and word not in CAPTION_STOP_WORDS
+    ]
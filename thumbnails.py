@@ -0,0 +1,198 @@
+"""Content-addressed, size-bounded cache of image thumbnails and video posters.
+
+Result pages show a resized thumbnail for every image and a poster frame
+for every video instead of the full-resolution original. A thumbnail is
+named after a digest of the source file's bytes plus the rendering
+settings, so identical files share one thumbnail, a changed file gets a new
+one, and the name doubles as a strong HTTP ``ETag``. The indexer writes
+thumbnails while it has each file decoded; the front end renders any that
+are missing on first request. Least recently used files are evicted once
+the cache grows past ``max_bytes``.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import os
+import threading
+from contextlib import closing
+from dataclasses import dataclass
+from pathlib import Path
+
+import ffmpeg
+from loguru import logger
+from PIL import Image, ImageOps, features
+
+from settings import get_section
+from video_frames import iter_video_frames
+
+THUMBNAIL_CONFIG = get_section("thumbnails")
+THUMBNAIL_FOLDER = Path(THUMBNAIL_CONFIG.get("folder", "cache/thumbnails"))
+THUMBNAIL_SIZE = THUMBNAIL_CONFIG.get("size", 320)  # Longest edge in pixels
+THUMBNAIL_QUALITY = THUMBNAIL_CONFIG.get("quality", 80)
+THUMBNAIL_MAX_BYTES = THUMBNAIL_CONFIG.get("max_bytes", 512 * 1024 * 1024)
+# Render thumbnails while indexing instead of on the first page view
+PREGENERATE_THUMBNAILS = THUMBNAIL_CONFIG.get("pregenerate", True)
+# WebP needs Pillow built with libwebp; fall back to JPEG without it
+THUMBNAIL_FORMAT = (
+    "WEBP"
+    if THUMBNAIL_CONFIG.get("format", "webp").lower() == "webp"
+    and features.check("webp")
+    else "JPEG"
+)
+THUMBNAIL_MIMETYPES = {"WEBP": "image/webp", "JPEG": "image/jpeg"}
+EVICT_TO_FRACTION = 0.9  # Evict down to this share of max_bytes to batch deletes
+HASH_CHUNK_SIZE = 1024 * 1024
+MAX_REMEMBERED_DIGESTS = 100_000
+
+
+@dataclass(frozen=True)
+class Thumbnail:
+    """A rendered thumbnail on disk and the key it is stored under."""
+
+    path: Path
+    key: str
+
+    @property
+    def mimetype(self) -> str:
+        """The content type to serve the thumbnail with."""
+        return THUMBNAIL_MIMETYPES[THUMBNAIL_FORMAT]
+
+
+def render_thumbnail(image: Image.Image, size: int = THUMBNAIL_SIZE) -> Image.Image:
+    """Return an upright RGB copy of ``image`` scaled to fit ``size`` pixels."""
+    thumbnail = ImageOps.exif_transpose(image).convert("RGB")
+    thumbnail.thumbnail((size, size), Image.Resampling.LANCZOS)
+    return thumbnail
+
+
+def render_source(source: Path, media_type: str) -> Image.Image:
+    """Decode ``source`` and render its thumbnail.
+
+    Videos use their first frame as the poster, decoded at the thumbnail
+    size, and only that frame is decoded before ffmpeg is stopped. A video
+    ffmpeg cannot read raises ``ValueError``, like one without frames.
+    """
+    if media_type == "image":
+        with Image.open(source) as image:
+            return render_thumbnail(image)
+    frames = iter_video_frames(source, sample_rate=1, max_edge=THUMBNAIL_SIZE)
+    try:
+        with closing(frames):
+            for _, frame in frames:
+                return render_thumbnail(frame)
+    except ffmpeg.Error as e:
+        msg = f"ffmpeg could not decode {source}: {e}"
+        raise ValueError(msg) from e
+    msg = f"No frames could be decoded from {source}"
+    raise ValueError(msg)
+
+
+class ThumbnailCache:
+    """Thread-safe thumbnail store shared by the indexer and the front end."""
+
+    def __init__(self, folder: Path, max_bytes: int) -> None:
+        """Use ``folder`` for thumbnails; its size is measured on first write."""
+        self.folder = folder
+        self.max_bytes = max_bytes
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._total_bytes: int | None = None
+        # (path, size, mtime_ns) -> SHA-256 of the file, so unchanged
+        # sources are only hashed once per process
+        self._digests: dict[tuple[str, int, int], str] = {}
+
+    def remember_digest(self, source: Path, digest: str) -> None:
+        """Record a content hash the caller already computed for ``source``."""
+        stat = source.stat()
+        with self._lock:
+            if len(self._digests) >= MAX_REMEMBERED_DIGESTS:
+                self._digests.clear()
+            self._digests[str(source), stat.st_size, stat.st_mtime_ns] = digest
+
+    def source_digest(self, source: Path) -> str:
+        """Return the SHA-256 of ``source``, hashing it only if it changed."""
+        stat = source.stat()
+        identity = (str(source), stat.st_size, stat.st_mtime_ns)
+        digest = self._digests.get(identity)
+        if digest is None:
+            hasher = hashlib.sha256()
+            with source.open("rb") as handle:
+                for chunk in iter(lambda: handle.read(HASH_CHUNK_SIZE), b""):
+                    hasher.update(chunk)
+            digest = hasher.hexdigest()
+            self.remember_digest(source, digest)
+        return digest
+
+    def key(self, source: Path) -> str:
+        """Return the cache key of the thumbnail for ``source``."""
+        settings = f"{THUMBNAIL_SIZE}:{THUMBNAIL_QUALITY}:{THUMBNAIL_FORMAT}"
+        return hashlib.sha256(
+            f"{self.source_digest(source)}:{settings}".encode(),
+        ).hexdigest()
+
+    def _path(self, key: str) -> Path:
+        """Return where the thumbnail for ``key`` is stored."""
+        return self.folder / key[:2] / f"{key}.{THUMBNAIL_FORMAT.lower()}"
+
+    def get(
+        self, source: Path, media_type: str, image: Image.Image | None = None,
+    ) -> Thumbnail:
+        """Return the thumbnail for ``source``, rendering it if it is missing.
+
+        Pass an already decoded ``image`` (a video's first frame for videos)
+        to avoid decoding the source again.
+        """
+        key = self.key(source)
+        path = self._path(key)
+        try:
+            os.utime(path)  # Mark as recently used for eviction
+        except FileNotFoundError:
+            pass
+        else:
+            return Thumbnail(path, key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        thumbnail = (
+            render_thumbnail(image) if image is not None
+            else render_source(source, media_type)
+        )
+        tmp_path = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+        thumbnail.save(tmp_path, THUMBNAIL_FORMAT, quality=THUMBNAIL_QUALITY)
+        tmp_path.replace(path)
+        self._account(path.stat().st_size)
+        return Thumbnail(path, key)
+
+    def _account(self, added_bytes: int) -> None:
+        """Add a new file to the cache size and evict if it is over budget."""
+        with self._lock:
+            if self._total_bytes is None:
+                self._total_bytes = sum(size for _, size, _ in self._entries())
+            else:
+                self._total_bytes += added_bytes
+            if self._total_bytes <= self.max_bytes:
+                return
+            target = self.max_bytes * EVICT_TO_FRACTION
+            for path, size, _ in sorted(self._entries(), key=lambda entry: entry[2]):
+                if self._total_bytes <= target:
+                    break
+                path.unlink(missing_ok=True)
+                self._total_bytes -= size
+                self.evictions += 1
+            logger.info(
+                f"Thumbnail cache over {self.max_bytes} bytes, "
+                f"evicted down to {self._total_bytes}",
+            )
+
+    def _entries(self) -> list[tuple[Path, int, int]]:
+        """Return ``(path, size, mtime_ns)`` for every cached thumbnail."""
+        entries = []
+        for path in self.folder.glob(f"*/*.{THUMBNAIL_FORMAT.lower()}"):
+            try:
+                stat = path.stat()
+            except FileNotFoundError:  # Evicted by another process
+                continue
+            entries.append((path, stat.st_size, stat.st_mtime_ns))
+        return entries
+
+
+thumbnail_cache = ThumbnailCache(THUMBNAIL_FOLDER, THUMBNAIL_MAX_BYTES)
@@ -3,6 +3,7 @@
 from __future__ import annotations
 
 from datetime import datetime, timezone
+from typing import Literal
 
 from pydantic import BaseModel, Field
 
@@ -28,36 +29,79 @@ class VideoData(BaseModel):
     description: str
     date: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
 
+MAX_BATCH_SIZE = 256  # Searches accepted in one batch request
+
+
 # Search request model
 class SearchRequest(BaseModel):
-    """Model representing a search request."""
+    """Model representing a search request.
+
+    ``start_date`` and ``end_date`` optionally restrict results to media
+    dated within that range, inclusive.
+    """
 
     query: str
     file_type: str
+    mode: Literal["keyword", "semantic", "hybrid"] = "keyword"
+    explain: bool = False
+    start_date: datetime | None = None
+    end_date: datetime | None = None
 
 
 # Search response model
 
 class SearchResult(BaseModel):
-    """Model representing a search result."""
+    """Model representing a search result.
+
+    ``scores`` holds the per-retriever score breakdown and is only filled in
+    when the request asks for it. Video results set ``offset_seconds`` to the
+    best-matching frame and ``offsets`` to every matching frame, best first.
+    """
 
     file_path: str
     description: str
+    scores: dict[str, float] | None = None
+    offset_seconds: float | None = None
+    offsets: list[float] | None = None
 
 class SearchResponse(BaseModel):
     """Model representing a search response."""
 
     results: list[SearchResult]
 
+
+class BatchSearchRequest(BaseModel):
+    """Model representing many search requests sent in one round trip."""
+
+    requests: list[SearchRequest] = Field(..., max_length=MAX_BATCH_SIZE)
+
+
+class BatchSearchResponse(BaseModel):
+    """Model representing batch search responses, in request order."""
+
+    responses: list[SearchResponse]
+
 class SearchQuery(BaseModel):
     """Model representing a search query.
 
     Attributes:
         query (str): Search keyword or phrase.
         file_type (str): Type of file to search for.
+        mode (str): Ranking mode: keyword, semantic or hybrid.
 
     """
 
     query: str
     file_type: str
+    mode: Literal["keyword", "semantic", "hybrid"] = "keyword"
+
+
+class ProfilerSettings(BaseModel):
+    """Model representing a change to the slow-request profiler.
+
+    Fields left unset keep their current value.
+    """
 
+    enabled: bool | None = None
+    search_threshold_ms: float | None = Field(None, ge=0)
+    indexing_threshold_ms: float | None = Field(None, ge=0)
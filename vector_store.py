@@ -0,0 +1,326 @@
+"""Memory-mapped embedding matrix for semantic search.
+
+Every indexing run writes a complete generation directory under
+``VECTOR_FOLDER`` and then atomically repoints ``CURRENT`` at it. Readers map
+the float16 matrix with ``np.load(mmap_mode="r")``, so every API worker
+process shares the same page-cache copy and never sees a half-written
+generation. Large generations also carry an IVF index (see ``ann_index``)
+so queries only scan a fraction of the rows.
+"""
+
+from __future__ import annotations
+
+import json
+import shutil
+import threading
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import TYPE_CHECKING
+
+import numpy as np
+from loguru import logger
+
+from ann_index import ANN_ENABLED, MIN_VECTORS, NPROBE, UNASSIGNED, IVFIndex
+from media_ids import split_frame_id
+from settings import get_section
+
+if TYPE_CHECKING:
+    from datetime import datetime
+
+SEMANTIC_CONFIG = get_section("semantic")
+VECTOR_FOLDER = Path(SEMANTIC_CONFIG.get("vector_folder", "vectors"))
+# Seconds between checks of CURRENT for a new generation
+REFRESH_INTERVAL = get_section("search").get("refresh_interval", 1.0)
+CURRENT_FILE = "CURRENT"
+KEEP_GENERATIONS = 2  # Older generations may still be mapped by slow readers
+SCAN_CHUNK_ROWS = 65536  # Rows upcast to float32 at a time during a scan
+MEDIA_TYPE_CODES = {"image": 0, "video": 1}
+
+
+@dataclass
+class VectorSnapshot:
+    """One immutable, memory-mapped generation of the vector store."""
+
+    generation: str
+    ids: list[str]
+    vectors: np.ndarray  # (N, D) float16, L2-normalised rows
+    media_types: np.ndarray  # (N,) uint8, see MEDIA_TYPE_CODES
+    dates: np.ndarray  # (N,) int64 epoch seconds
+    ivf: IVFIndex | None = None  # Only built past ``MIN_VECTORS`` rows
+    _rows: dict[str, int] | None = field(default=None, repr=False)
+
+    @property
+    def rows(self) -> dict[str, int]:
+        """Map each document id to its row, built on first use."""
+        if self._rows is None:
+            self._rows = {path: row for row, path in enumerate(self.ids)}
+        return self._rows
+
+
+def read_current(folder: Path = VECTOR_FOLDER) -> str | None:
+    """Return the name of the current generation directory, if any."""
+    try:
+        return (folder / CURRENT_FILE).read_text(encoding="utf-8").strip() or None
+    except FileNotFoundError:
+        return None
+
+
+def load_snapshot(folder: Path = VECTOR_FOLDER) -> VectorSnapshot | None:
+    """Memory-map the current generation, or return ``None`` if there is none."""
+    generation = read_current(folder)
+    if generation is None:
+        return None
+    path = folder / generation
+    with (path / "ids.json").open("r", encoding="utf-8") as ids_file:
+        ids = json.load(ids_file)
+    return VectorSnapshot(
+        generation=generation,
+        ids=ids,
+        vectors=np.load(path / "vectors.npy", mmap_mode="r"),
+        media_types=np.load(path / "media_types.npy", mmap_mode="r"),
+        dates=np.load(path / "dates.npy", mmap_mode="r"),
+        ivf=IVFIndex.load(path) if ANN_ENABLED else None,
+    )
+
+
+@dataclass
+class VectorFilters:
+    """The same filters the keyword path applies, as a row mask."""
+
+    file_type: str | None = None
+    start_date: datetime | None = None
+    end_date: datetime | None = None
+    excluded: set[str] | None = None
+
+    def mask(self, snapshot: VectorSnapshot) -> np.ndarray | None:
+        """Build a boolean row mask, or ``None`` if every row is eligible."""
+        mask = None
+        if self.file_type:
+            code = MEDIA_TYPE_CODES.get(self.file_type)
+            mask = (
+                snapshot.media_types == code
+                if code is not None
+                else np.zeros(len(snapshot.ids), dtype=bool)
+            )
+        if self.start_date is not None:
+            after = snapshot.dates >= int(self.start_date.timestamp())
+            mask = after if mask is None else mask & after
+        if self.end_date is not None:
+            before = snapshot.dates <= int(self.end_date.timestamp())
+            mask = before if mask is None else mask & before
+        if self.excluded:
+            rows = [
+                snapshot.rows[path]
+                for path in self.excluded
+                if path in snapshot.rows
+            ]
+            if rows:
+                mask = np.ones(len(snapshot.ids), dtype=bool) if mask is None else mask
+                mask[rows] = False
+        return mask
+
+
+def top_k(
+    vectors: np.ndarray,
+    query: np.ndarray,
+    k: int,
+    mask: np.ndarray | None = None,
+) -> tuple[np.ndarray, np.ndarray]:
+    """Return the row indices and cosine scores of the ``k`` best rows."""
+    query = query.astype(np.float32, copy=False)
+    scores = np.empty(len(vectors), dtype=np.float32)
+    for start in range(0, len(vectors), SCAN_CHUNK_ROWS):
+        chunk = np.asarray(vectors[start:start + SCAN_CHUNK_ROWS], dtype=np.float32)
+        scores[start:start + len(chunk)] = chunk @ query
+    if mask is not None:
+        scores[~mask] = -np.inf
+    k = min(k, int(np.isfinite(scores).sum()))
+    if k <= 0:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+    candidates = np.argpartition(-scores, k - 1)[:k]
+    order = candidates[np.argsort(-scores[candidates])]
+    return order, scores[order]
+
+
+class VectorStore:
+    """Read side of the store, safe to share between request threads."""
+
+    def __init__(
+        self, folder: Path = VECTOR_FOLDER, refresh_interval: float = REFRESH_INTERVAL,
+    ) -> None:
+        """Initialize the store; the snapshot is mapped on first use."""
+        self.folder = folder
+        self.refresh_interval = refresh_interval
+        self._snapshot: VectorSnapshot | None = None
+        self._checked_at = float("-inf")
+        self._lock = threading.Lock()
+
+    def snapshot(self) -> VectorSnapshot | None:
+        """Return the current snapshot, remapping it if a new one was committed."""
+        now = time.monotonic()
+        if now - self._checked_at < self.refresh_interval:
+            return self._snapshot
+        with self._lock:
+            if now - self._checked_at >= self.refresh_interval:
+                generation = read_current(self.folder)
+                current = self._snapshot.generation if self._snapshot else None
+                if generation != current:
+                    try:
+                        self._snapshot = load_snapshot(self.folder)
+                    except FileNotFoundError as error:
+                        # Pruned by a newer commit between reading CURRENT and
+                        # mapping it: keep serving and look again next call.
+                        logger.warning(f"Vector generation vanished: {error}")
+                        return self._snapshot
+                self._checked_at = now
+        return self._snapshot
+
+    @property
+    def version(self) -> str | None:
+        """The generation currently being served."""
+        snapshot = self.snapshot()
+        return snapshot.generation if snapshot else None
+
+    def search(
+        self,
+        query: np.ndarray,
+        k: int,
+        *,
+        filters: VectorFilters | None = None,
+        nprobe: int = NPROBE,
+    ) -> list[tuple[str, float]]:
+        """Return ``(document_id, score)`` for the ``k`` nearest eligible rows.
+
+        Generations with an IVF index only scan the ``nprobe`` closest lists.
+        If filters leave fewer than ``k`` eligible rows in those lists, the
+        search falls back to an exact scan so selective filters still fill
+        the page.
+        """
+        snapshot = self.snapshot()
+        if snapshot is None or not snapshot.ids:
+            return []
+        mask = filters.mask(snapshot) if filters is not None else None
+        rows = None
+        if snapshot.ivf is not None:
+            rows, scores = snapshot.ivf.search(
+                snapshot.vectors, query, k, mask, nprobe,
+            )
+        if rows is None or len(rows) < k:
+            rows, scores = top_k(snapshot.vectors, query, k, mask)
+        return [
+            (snapshot.ids[row], float(score))
+            for row, score in zip(rows.tolist(), scores.tolist(), strict=True)
+        ]
+
+
+class VectorStoreWriter:
+    """Accumulate upserts and deletions, then publish a new generation."""
+
+    def __init__(self, folder: Path = VECTOR_FOLDER, *, fresh: bool = False) -> None:
+        """Start from the current generation, or from nothing if ``fresh``.
+
+        The IVF centroids and list assignments of the current generation are
+        carried over, so a commit only assigns new vectors to lists instead
+        of re-clustering the whole corpus.
+        """
+        self.folder = folder
+        # document id -> (vector, media type code, epoch date, IVF list)
+        self._rows: dict[str, tuple[np.ndarray, int, int, int]] = {}
+        self._frames: dict[str, set[str]] = {}  # Video path -> its frame ids
+        self._centroids: np.ndarray | None = None
+        self._trained_size = 0
+        self._dirty = fresh
+        snapshot = None if fresh else load_snapshot(folder)
+        if snapshot is not None:
+            vectors = np.array(snapshot.vectors)  # One sequential read of the map
+            media_types = snapshot.media_types.tolist()
+            dates = snapshot.dates.tolist()
+            lists = [UNASSIGNED] * len(snapshot.ids)
+            if snapshot.ivf is not None:
+                lists = snapshot.ivf.assignments.tolist()
+                self._centroids = np.array(snapshot.ivf.centroids)
+                self._trained_size = snapshot.ivf.trained_size
+            for row, document_id in enumerate(snapshot.ids):
+                self._rows[document_id] = (
+                    vectors[row], media_types[row], dates[row], lists[row],
+                )
+                self._track_frame(document_id)
+
+    def _track_frame(self, document_id: str) -> None:
+        """Remember ``document_id`` under its video if it is a frame id."""
+        media_path, offset = split_frame_id(document_id)
+        if offset is not None:
+            self._frames.setdefault(media_path, set()).add(document_id)
+
+    def upsert(
+        self, document_id: str, vector: np.ndarray, media_type: str, date: datetime,
+    ) -> None:
+        """Insert or replace the embedding for a file or video frame."""
+        self._track_frame(document_id)
+        self._rows[document_id] = (
+            vector.astype(np.float16),
+            MEDIA_TYPE_CODES[media_type],
+            int(date.timestamp()),
+            UNASSIGNED,
+        )
+        self._dirty = True
+
+    def delete(self, file_path: str) -> None:
+        """Remove ``file_path`` and, for a video, all of its frames."""
+        for document_id in (file_path, *self._frames.pop(file_path, ())):
+            if self._rows.pop(document_id, None) is not None:
+                self._dirty = True
+
+    def commit(self) -> None:
+        """Write a new generation and atomically make it current."""
+        if not self._dirty:
+            return
+        self.folder.mkdir(parents=True, exist_ok=True)
+        generation = f"gen-{time.time_ns()}"
+        path = self.folder / generation
+        path.mkdir()
+
+        ids = list(self._rows)
+        vectors = (
+            np.stack([self._rows[path_key][0] for path_key in ids])
+            if ids
+            else np.zeros((0, 0), dtype=np.float16)
+        )
+        np.save(path / "vectors.npy", vectors.astype(np.float16, copy=False))
+        np.save(path / "media_types.npy", np.array(
+            [self._rows[path_key][1] for path_key in ids], dtype=np.uint8,
+        ))
+        np.save(path / "dates.npy", np.array(
+            [self._rows[path_key][2] for path_key in ids], dtype=np.int64,
+        ))
+        with (path / "ids.json").open("w", encoding="utf-8") as ids_file:
+            json.dump(ids, ids_file)
+        if ANN_ENABLED and len(ids) >= MIN_VECTORS:
+            IVFIndex.build(
+                vectors,
+                self._centroids,
+                np.array([self._rows[path_key][3] for path_key in ids]),
+                self._trained_size,
+            ).save(path)
+
+        tmp_current = self.folder / f"{CURRENT_FILE}.tmp"
+        tmp_current.write_text(generation, encoding="utf-8")
+        tmp_current.replace(self.folder / CURRENT_FILE)
+        self._dirty = False
+        logger.info(f"Published vector store {generation} with {len(ids)} vectors")
+        self._prune(keep=generation)
+
+    def _prune(self, keep: str) -> None:
+        """Delete all but the newest ``KEEP_GENERATIONS`` generations."""
+        generations = sorted(
+            (
+                entry.name
+                for entry in self.folder.iterdir()
+                if entry.name.startswith("gen-")
+            ),
+            key=lambda name: int(name.removeprefix("gen-")),
+        )
+        for name in generations[:-KEEP_GENERATIONS]:
+            if name != keep:
+                shutil.rmtree(self.folder / name, ignore_errors=True)
@@ -0,0 +1,184 @@
+"""In-memory video frame sampling through a single ffmpeg decode pass."""
+
+from __future__ import annotations
+
+from contextlib import closing
+from dataclasses import dataclass
+from typing import TYPE_CHECKING
+
+import ffmpeg
+from loguru import logger
+from PIL import Image
+
+if TYPE_CHECKING:
+    from collections.abc import Iterator
+    from pathlib import Path
+
+QUARTER_TURNS = (90, 270)
+HASH_SIZE = 8  # 8x8 difference hash, i.e. 64 bits per frame
+
+
+@dataclass(frozen=True)
+class FrameSampling:
+    """How candidate frames are taken from a video and which are kept.
+
+    ``max_edge`` scales decoded frames down to that many pixels on their
+    longest edge, and ``max_frames`` caps the distinct frames kept per video.
+    """
+
+    sample_rate: float  # Seconds between candidate frames
+    threshold: int  # dHash bits a frame must differ by to be kept
+    max_edge: int | None = None
+    max_frames: int | None = None
+
+
+@dataclass
+class FrameSamplingReport:
+    """How many candidate frames a video yielded and how many were kept."""
+
+    video_path: str
+    sampled: int = 0
+    kept: int = 0
+    truncated: bool = False  # Sampling stopped at the kept-frame limit
+
+    @property
+    def skipped(self) -> int:
+        """Frames dropped as near-duplicates of the previous kept frame."""
+        return self.sampled - self.kept
+
+
+def probe_video(video_path: str | Path) -> dict:
+    """Return the ffprobe metadata of a video file."""
+    return ffmpeg.probe(str(video_path))
+
+
+def video_frame_size(metadata: dict) -> tuple[int, int]:
+    """Return the (width, height) ffmpeg will emit after auto-rotation."""
+    stream = next(
+        (
+            stream for stream in metadata.get("streams", [])
+            if stream.get("codec_type") == "video"
+        ),
+        None,
+    )
+    if stream is None:
+        msg = "No video stream found"
+        raise ValueError(msg)
+    width, height = int(stream["width"]), int(stream["height"])
+    rotation = int(stream.get("tags", {}).get("rotate", 0))
+    for side_data in stream.get("side_data_list", []):
+        rotation = int(side_data.get("rotation", rotation))
+    if abs(rotation) % 360 in QUARTER_TURNS:
+        width, height = height, width
+    return width, height
+
+
+def scaled_frame_size(
+    width: int, height: int, max_edge: int | None,
+) -> tuple[int, int]:
+    """Return the size that fits ``max_edge`` with the same aspect ratio.
+
+    Frames are never upscaled, and ``None`` keeps the source size.
+    """
+    if max_edge is None or max(width, height) <= max_edge:
+        return width, height
+    scale = max_edge / max(width, height)
+    return max(round(width * scale), 1), max(round(height * scale), 1)
+
+
+def iter_video_frames(
+    video_path: str | Path,
+    sample_rate: float,
+    metadata: dict | None = None,
+    max_edge: int | None = None,
+) -> Iterator[tuple[float, Image.Image]]:
+    """Yield ``(offset_seconds, frame)`` every ``sample_rate`` seconds.
+
+    ffmpeg decodes the video once, drops frames with its ``fps`` filter,
+    scales the survivors down to ``max_edge`` pixels on their longest edge
+    and streams them as raw RGB over a pipe, so nothing touches the disk
+    and there is no per-frame seek.
+    """
+    metadata = metadata or probe_video(video_path)
+    width, height = scaled_frame_size(*video_frame_size(metadata), max_edge)
+    frame_bytes = width * height * 3
+    process = (
+        ffmpeg.input(str(video_path))
+        .filter("fps", fps=f"1/{sample_rate}")
+        .filter("scale", width, height)
+        .output("pipe:", format="rawvideo", pix_fmt="rgb24")
+        .global_args("-loglevel", "error", "-nostdin")
+        .run_async(pipe_stdout=True)
+    )
+    try:
+        index = 0
+        while len(chunk := process.stdout.read(frame_bytes)) == frame_bytes:
+            yield index * sample_rate, Image.frombytes("RGB", (width, height), chunk)
+            index += 1
+    finally:
+        process.stdout.close()
+        if process.wait() not in (0, None) and index == 0:
+            logger.warning(f"ffmpeg produced no frames for {video_path}")
+
+
+def difference_hash(image: Image.Image, hash_size: int = HASH_SIZE) -> int:
+    """Return a perceptual dHash: one bit per horizontal brightness gradient."""
+    pixels = list(
+        image.convert("L").resize((hash_size + 1, hash_size)).getdata(),
+    )
+    bits = 0
+    for row in range(hash_size):
+        offset = row * (hash_size + 1)
+        for col in range(hash_size):
+            left, right = pixels[offset + col], pixels[offset + col + 1]
+            bits = (bits << 1) | (left > right)
+    return bits
+
+
+def sample_distinct_frames(
+    video_path: str | Path,
+    sampling: FrameSampling,
+    metadata: dict | None = None,
+) -> tuple[list[tuple[float, Image.Image]], FrameSamplingReport]:
+    """Sample frames and keep only those that differ from the last kept one.
+
+    Each candidate's dHash is compared with the most recently kept frame;
+    frames within ``sampling.threshold`` differing bits are treated as the
+    same scene and skipped. Comparing against the last kept frame, not the
+    previous candidate, means slow pans are still caught once they drift far
+    enough. A negative threshold keeps every candidate. Decoding errors end
+    the scan early but keep the frames gathered so far, and so does reaching
+    ``sampling.max_frames`` kept frames, which bounds the memory one video
+    can hold.
+    """
+    report = FrameSamplingReport(video_path=str(video_path))
+    kept: list[tuple[float, Image.Image]] = []
+    last_hash = None
+    max_frames = sampling.max_frames
+    frames = iter_video_frames(
+        video_path, sampling.sample_rate, metadata, sampling.max_edge,
+    )
+    try:
+        with closing(frames):  # Stops ffmpeg when sampling ends early
+            for offset, frame in frames:
+                report.sampled += 1
+                frame_hash = difference_hash(frame)
+                if (
+                    last_hash is not None
+                    and (frame_hash ^ last_hash).bit_count() <= sampling.threshold
+                ):
+                    continue
+                kept.append((offset, frame))
+                last_hash = frame_hash
+                if max_frames is not None and len(kept) >= max_frames:
+                    report.truncated = True
+                    break
+    except (OSError, ValueError, ffmpeg.Error) as e:
+        logger.warning(f"Error processing frame {report.sampled} of {video_path}: {e}")
+    if report.truncated:
+        logger.warning(
+            f"Kept the first {max_frames} distinct frames of {video_path}, "
+            f"up to {kept[-1][0]:.0f}s; later scenes are not indexed",
+        )
+    report.kept = len(kept)
+    return kept, report